@@ -0,0 +1,209 @@
+'''
+Module containing the Case class
+'''
+
+__all__ = ['Case']
+
+import os
+import importlib
+
+# The reader of each attribute of a Case, as the suffix of the file read and
+# the module and class of the reader, which is only imported when first made
+readers = {
+    'energy' : ('.energy', 'wien2k.readers.EnergyReader', 'EnergyReader'),
+    'klist' : ('.klist', 'wien2k.readers.KlistReader', 'KlistReader'),
+    'klist_band' : ('.klist_band', 'wien2k.readers.KlistReader', 'KlistReader'),
+    'outputkgen' : ('.outputkgen', 'wien2k.readers.OutputkgenReader', 'OutputkgenReader'),
+    'struct' : ('.struct', 'wien2k.readers.StructReader', 'StructReader'),
+    'scf' : ('.scf', 'wien2k.readers.ScfReader', 'ScfReader'),
+    'scf2' : ('.scf2', 'wien2k.readers.Scf2Reader', 'Scf2Reader'),
+    'output2' : ('.output2', 'wien2k.readers.Output2Reader', 'Output2Reader'),
+    'kgen' : ('.kgen', 'wien2k.readers.KgenReader', 'KgenReader'),
+    'qtl' : ('.qtl', 'wien2k.readers.QtlReader', 'QtlReader'),
+    # All the .dosN files, the .dos1 file is the one checked
+    'dos' : ('.dos1', 'wien2k.readers.DosBatchReader', 'DosBatchReader'),
+    'vector' : ('.vector', 'wien2k.readers.VectorReader', 'VectorReader'),
+    'clmsum' : ('.clmsum', 'wien2k.readers.ClmReader', 'ClmReader'),
+    'clmval' : ('.clmval', 'wien2k.readers.ClmReader', 'ClmReader'),
+    'clmcor' : ('.clmcor', 'wien2k.readers.ClmReader', 'ClmReader'),
+    'rho' : ('.rho', 'wien2k.readers.RhoReader', 'RhoReader'),
+}
+
+# The readers made from the case filename without a suffix (i.e.
+# 'path/to/TiC') rather than from their file
+case_readers = ['dos']
+
+def _find_dos_files(case_filename):
+    # Imported here so that the DosReader is only imported when used
+    from wien2k.readers.DosReader import find_dos_files
+    return find_dos_files(case_filename)
+
+# The other files read by a reader, as a function which finds them from the
+# case filename without a suffix
+dependencies = {
+    'outputkgen' : lambda case_filename: [case_filename + '.kgen'],
+    'dos' : _find_dos_files,
+}
+
+# The readers which index the lines appended to their file by refresh()
+# rather than being made again when it changes
+refreshed = ['scf']
+
+class Case(object):
+    '''
+    A WIEN2k case directory whose files are read when first used
+
+    Each reader is an attribute (i.e. case.energy is an EnergyReader of
+    case.energy) made when first accessed and kept. It is made again if the
+    modification time or size of any file it reads changes (i.e. the .kgen
+    file as well for case.outputkgen, every .dosN file for case.dos), except
+    case.scf which is refreshed to index the iterations appended.
+
+    Parameters,
+
+    directory:      The case directory
+    name:           The case name, by default the name of the directory
+
+    Results in,
+
+    files:          A dict of the suffix (i.e. '.energy') of each file of
+                    the case to its path
+    available:      The names of the readers whose files exist
+    loaded:         The names of the readers made so far
+
+    EXAMPLE:
+
+    >>> case = Case(TiC_dir)
+    >>> case.name
+    'TiC'
+    >>> case.loaded
+    []
+    >>> case.energy.energies.shape
+    (47, 17)
+    >>> case.energy is case.energy
+    True
+    >>> case.loaded
+    ['energy']
+
+    The reader is made again when the file changes
+
+    >>> energy_rdr = case.energy
+    >>> os.utime(case.files['.energy'], (0, 0))
+    >>> case.energy is energy_rdr
+    False
+
+    The ScfReader is refreshed instead
+
+    >>> scf_rdr = case.scf
+    >>> num_iterations = scf_rdr.num_iterations
+    >>> open(case.files['.scf'], 'a').write(':ITE%03d:  %d. ITERATION\\n' % (num_iterations + 1, num_iterations + 1))
+    >>> case.scf is scf_rdr
+    True
+    >>> case.scf.num_iterations == num_iterations + 1
+    True
+    '''
+    def __init__(self, directory, name=None):
+        self.directory = directory
+        if name is None:
+            name = os.path.basename(os.path.normpath(os.path.abspath(directory)))
+        self.name = name
+        # The (key, reader) of each reader made, the key is the modification
+        # time and size of each file it reads
+        self._readers = {}
+
+    def filename(self, suffix):
+        '''Returns the path of the case file with the suffix i.e. '.struct' '''
+        return os.path.join(self.directory, self.name + suffix)
+
+    def files(self):
+        prefix = self.name + '.'
+        files = {}
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix):
+                files[name[len(self.name):]] = os.path.join(self.directory, name)
+        return files
+    files = property(files)
+
+    def available(self):
+        return sorted([name for name, (suffix, module_name, class_name) in readers.items() \
+            if os.path.exists(self.filename(suffix))])
+    available = property(available)
+
+    def loaded(self):
+        return sorted(self._readers.keys())
+    loaded = property(loaded)
+
+    def reader(self, name):
+        '''Returns the reader called 'name' (i.e. 'energy'), made if it has
+        not been or its file has changed since'''
+        if name not in readers:
+            raise KeyError('Unknown reader %s' % name)
+        filename = self.filename(readers[name][0])
+        if not os.path.exists(filename):
+            raise IOError('%s does not exist' % filename)
+        key = self._key(name, filename)
+        if name not in self._readers:
+            self._readers[name] = (key, self._make_reader(name, filename))
+        elif self._readers[name][0] != key:
+            if name in refreshed:
+                reader = self._readers[name][1]
+                reader.refresh()
+                self._readers[name] = (key, reader)
+            else:
+                self._readers[name] = (key, self._make_reader(name, filename))
+        return self._readers[name][1]
+
+    def _make_reader(self, name, filename):
+        # Imports the module of the reader when it is first made
+        suffix, module_name, class_name = readers[name]
+        reader_class = getattr(importlib.import_module(module_name), class_name)
+        if name in case_readers:
+            return reader_class(self.filename(''))
+        return reader_class(filename)
+
+    def _key(self, name, filename):
+        # The path, modification time and size of each file read by the
+        # reader, files which do not exist have neither
+        filenames = [filename]
+        if name in dependencies:
+            filenames.extend(dependencies[name](self.filename('')))
+        key = []
+        for path in filenames:
+            if os.path.exists(path):
+                stat = os.stat(path)
+                key.append((path, stat.st_mtime, stat.st_size))
+            else:
+                key.append((path, None, None))
+        return tuple(key)
+
+    def forget(self, name=None):
+        '''Drops the reader called 'name', or all of them'''
+        if name is None:
+            self._readers = {}
+        elif name in self._readers:
+            del self._readers[name]
+
+    def __getattr__(self, name):
+        # Only called for attributes not found otherwise
+        if (name.startswith('_')) or (name not in readers):
+            raise AttributeError(name)
+        return self.reader(name)
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    import shutil
+    import tempfile
+    # Copy the files changed by the example
+    tmp_dir = os.path.join(tempfile.mkdtemp(), 'TiC')
+    os.mkdir(tmp_dir)
+    shutil.copy(os.path.join(sys.path[0], 'tests', 'TiC', 'TiC.energy'), tmp_dir)
+    shutil.copy(os.path.join(sys.path[0], 'tests', 'TiC', 'TiC_scf.scf'), os.path.join(tmp_dir, 'TiC.scf'))
+    globs = {
+        'TiC_dir' : tmp_dir,
+        'Case' : Case,
+        'os' : os,
+    }
+    doctest.testmod(globs=globs)
+    shutil.rmtree(os.path.dirname(tmp_dir))
@@ -0,0 +1,245 @@
+'''
+Module containing the FourierInterpolator class
+'''
+
+__all__ = ['FourierInterpolator']
+
+import numpy as np
+from wien2k.Kmesh import Kmesh, OFF_GRID_TOLERANCE
+
+class FourierInterpolator(object):
+    '''
+    Interpolates the energies of a Kmesh by a Fourier series, treating the
+    mesh as one period of the zone (i.e. the points on the far faces are not
+    repeated, as from expand_ibz)
+
+    The coefficients are found by an FFT of the mesh, the series passes
+    through every point of the mesh and is smooth and periodic between them.
+    A finer mesh is found by an inverse FFT of the coefficients padded with
+    zeros, energies at any k points by summing the series.
+
+    Given symmetry matrices the energies are first averaged over the images
+    of each point (so the coefficients are the same over each star of
+    symmetry related wave vectors). Masked points are filled from their
+    unmasked images, so a mesh holding only the irreducible points can be
+    interpolated. Each matrix must map the mesh onto itself.
+
+    Parameters,
+
+    kmesh:              The Kmesh, with no masked points unless they can be
+                        filled by symmetry
+    sym_mats:           A list of SymMat instances acting on the k values of
+                        the mesh, i.e. OutputkgenReader.sym_mats for a mesh
+                        from expand_ibz - default: None
+
+    Results in,
+
+    energies:           The (symmetrised) energies on the mesh
+    coefficients:       The coefficients of the series, as from numpy.fft.rfftn
+                        of the energies
+    periods:            The length of the zone along each direction
+
+    EXAMPLE:
+
+    >>> km = Kmesh(band_data)
+    >>> fi = FourierInterpolator(km)
+
+    The series passes through the points of the mesh
+
+    >>> np.allclose(fi.energies_at(km.kpoints[:,1:4]), km.kpoints[:,4])
+    True
+
+    Between the points it gives a finer mesh, which keeps the points of the
+    coarse mesh
+
+    >>> fine_km = fi.kmesh((40, 40, 40))
+    >>> fine_km.shape
+    (40, 40, 40)
+    >>> np.allclose(fine_km.energies[::4,::4,::4], km.energies)
+    True
+    >>> np.allclose(fi.energies_at(fine_km.kpoints[:,1:4]), fine_km.kpoints[:,4])
+    True
+
+    Masked points are filled by symmetry
+
+    >>> km.energies[2,3,4] = np.ma.masked
+    >>> FourierInterpolator(km)
+    Traceback (most recent call last):
+        ...
+    ValueError: The Kmesh has 1 masked points, give the symmetry matrices to fill them
+    >>> fi = FourierInterpolator(km, sym_mats=outputkgen_rdr.sym_mats)
+    >>> np.allclose(fi.energies, Kmesh(band_data).energies)
+    True
+    '''
+    def __init__(self, kmesh, sym_mats=None):
+        self.shape = kmesh.energies.shape
+        self.offsets = np.array([kmesh.i_offset, kmesh.j_offset, kmesh.k_offset], dtype=float)
+        spacings = np.array([kmesh.i_spacing, kmesh.j_spacing, kmesh.k_spacing], dtype=float)
+        # A single plane has no period in its normal direction
+        self.periods = np.where(spacings != 0, spacings * np.array(self.shape), 1.0)
+        energies = kmesh.energies.filled(0.0).astype(float)
+        mask = np.ma.getmaskarray(kmesh.energies)
+        if sym_mats is not None:
+            energies, mask = self._symmetrise(energies, mask, sym_mats)
+        if mask.any():
+            if sym_mats is None:
+                raise ValueError('The Kmesh has %d masked points, give the symmetry matrices to fill them' % mask.sum())
+            raise ValueError('The Kmesh has %d masked points not related by symmetry to any unmasked point' % mask.sum())
+        self.energies = energies
+        self.coefficients = np.fft.rfftn(energies)
+
+    def _symmetrise(self, energies, mask, sym_mats):
+        # Averages each point over its unmasked images
+        indexes = np.indices(self.shape).reshape((3, -1))
+        k_vals = indexes.transpose() * (self.periods / np.array(self.shape)) + self.offsets
+        total = np.zeros(energies.size)
+        count = np.zeros(energies.size)
+        flat_energies = energies.ravel()
+        flat_mask = mask.ravel()
+        for sym_mat in sym_mats:
+            images = sym_mat.map(np.column_stack((np.zeros(len(k_vals)), k_vals)))[:,1:4]
+            image_indexes = self._grid_indexes(images)
+            present = ~flat_mask[image_indexes]
+            total[present] = total[present] + flat_energies[image_indexes[present]]
+            count = count + present
+        filled = count > 0
+        total[filled] = total[filled] / count[filled]
+        return total.reshape(self.shape), ~filled.reshape(self.shape)
+
+    def _grid_indexes(self, k_vals):
+        # The flat index of the mesh point at each k value, wrapped into the
+        # zone
+        positions = (k_vals - self.offsets) / self.periods * np.array(self.shape)
+        indexes = np.floor(positions + 0.5)
+        if (np.abs(positions - indexes) > OFF_GRID_TOLERANCE).any():
+            raise ValueError('A symmetry matrix does not map the mesh onto itself')
+        indexes = indexes.astype(int) % np.array(self.shape)
+        return np.ravel_multi_index(indexes.transpose(), self.shape)
+
+    def kmesh(self, shape):
+        '''Returns a Kmesh of the interpolated energies on a mesh of 'shape'
+        points covering the same zone, which must be at least as fine'''
+        shape = tuple(shape)
+        if len(shape) != 3 or (np.array(shape) < np.array(self.shape)).any():
+            raise ValueError('The mesh must have 3 dimensions each at least as large as %s' % str(self.shape))
+        padded = self.coefficients
+        # Pad the first two directions in full, the last is halved by rfftn
+        for axis in range(2):
+            padded = _pad_axis(padded, axis, shape[axis])
+        n = self.shape[2]
+        last = np.zeros(padded.shape[:2] + (shape[2] // 2 + 1,), dtype=complex)
+        last[:,:,:n//2+1] = padded
+        if (n % 2 == 0) and (shape[2] > n):
+            # Half of the Nyquist term goes to the negative frequency, which
+            # is implied by irfftn
+            last[:,:,n//2] = last[:,:,n//2] / 2.0
+        energies = np.fft.irfftn(last, s=shape) * (np.prod(shape) / float(np.prod(self.shape)))
+        new_kmesh = Kmesh()
+        new_kmesh.energies = np.ma.array(energies, mask=np.zeros(shape, dtype=bool))
+        new_kmesh.ids = np.ma.array(np.arange(1, energies.size + 1, dtype=float).reshape(shape), \
+            mask=np.zeros(shape, dtype=bool))
+        new_kmesh.i_offset, new_kmesh.j_offset, new_kmesh.k_offset = self.offsets
+        spacings = [self.periods[x] / shape[x] if shape[x] > 1 else 0.0 for x in range(3)]
+        new_kmesh.i_spacing, new_kmesh.j_spacing, new_kmesh.k_spacing = spacings
+        return new_kmesh
+
+    def energies_at(self, k_vals, chunk_size=4096):
+        '''
+        Returns the interpolated energies at an Nx3 array of i, j, k values,
+        summing the series over chunk_size points at a time
+        '''
+        k_vals = np.atleast_2d(np.asarray(k_vals, dtype=float))
+        coefficients, frequencies = self._series()
+        num_i, num_j, num_k = coefficients.shape
+        coefficients = coefficients.reshape((num_i * num_j, num_k))
+        energies = np.empty(len(k_vals))
+        for start in range(0, len(k_vals), chunk_size):
+            fractions = (k_vals[start:start+chunk_size] - self.offsets) / self.periods
+            phases = [np.exp(2j * np.pi * np.outer(fractions[:,x], frequencies[x])) for x in range(3)]
+            sums = np.dot(coefficients, phases[2].transpose()).reshape((num_i, num_j, -1))
+            sums = np.einsum('ijn,nj->in', sums, phases[1])
+            energies[start:start+chunk_size] = np.einsum('in,ni->n', sums, phases[0]).real
+        return energies
+
+    def _series(self):
+        # The coefficients and frequencies of the series with the Nyquist
+        # terms of even directions split between the positive and negative
+        # frequency, so the series is real everywhere. The negative
+        # frequencies of the last direction are the conjugates of the
+        # positive ones and so are included by doubling those
+        if not hasattr(self, '_series_terms'):
+            coefficients = self.coefficients / float(np.prod(self.shape))
+            frequencies = []
+            for axis in range(2):
+                indexes, axis_frequencies, weights = _axis_terms(self.shape[axis])
+                shape = [1, 1, 1]
+                shape[axis] = -1
+                coefficients = np.take(coefficients, indexes, axis=axis) * weights.reshape(shape)
+                frequencies.append(axis_frequencies)
+            n = self.shape[2]
+            axis_frequencies = np.arange(n // 2 + 1)
+            weights = np.where(axis_frequencies == 0, 1.0, 2.0)
+            if n % 2 == 0:
+                weights[-1] = 1.0
+            coefficients = coefficients * weights.reshape((1, 1, -1))
+            frequencies.append(axis_frequencies)
+            self._series_terms = (coefficients, frequencies)
+        return self._series_terms
+
+
+def _axis_terms(n):
+    '''Returns the index in the FFT, frequency and weight of each term of the
+    series along a direction of n points'''
+    num_positive = (n + 1) // 2
+    indexes = list(range(num_positive))
+    frequencies = list(range(num_positive))
+    weights = [1.0] * num_positive
+    if n % 2 == 0:
+        indexes = indexes + [n // 2, n // 2]
+        frequencies = frequencies + [n // 2, -(n // 2)]
+        weights = weights + [0.5, 0.5]
+    num_negative = n - num_positive - (1 - n % 2)
+    indexes = indexes + list(range(n - num_negative, n))
+    frequencies = frequencies + list(range(-num_negative, 0))
+    weights = weights + [1.0] * num_negative
+    return np.array(indexes), np.array(frequencies), np.array(weights)
+
+def _pad_axis(coefficients, axis, m):
+    '''Pads the FFT coefficients along an axis to m points with zeros at the
+    highest frequencies, splitting the Nyquist term of an even axis'''
+    n = coefficients.shape[axis]
+    if m == n:
+        return coefficients
+    coefficients = np.swapaxes(coefficients, 0, axis)
+    padded = np.zeros((m,) + coefficients.shape[1:], dtype=complex)
+    num_positive = (n + 1) // 2
+    num_negative = n - num_positive - (1 - n % 2)
+    padded[:num_positive] = coefficients[:num_positive]
+    if num_negative > 0:
+        padded[m-num_negative:] = coefficients[n-num_negative:]
+    if n % 2 == 0:
+        padded[n//2] = coefficients[n//2] / 2.0
+        padded[m-n//2] = padded[m-n//2] + coefficients[n//2] / 2.0
+    return np.swapaxes(padded, 0, axis)
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    import wien2k
+    from wien2k.utils import expand_ibz
+    # A band expanded to the full zone
+    energy_filename = os.path.join(sys.path[0], 'tests', 'TiC', 'TiC.energy')
+    outputkgen_filename = os.path.join(sys.path[0], 'tests', 'TiC', 'TiC.outputkgen')
+    band = wien2k.EnergyReader(energy_filename).bands[6]
+    outputkgen_rdr = wien2k.OutputkgenReader(outputkgen_filename)
+    band_data = expand_ibz(band=band, outputkgen_rdr=outputkgen_rdr)
+    globs = {
+        'band_data' : band_data,
+        'outputkgen_rdr' : outputkgen_rdr,
+        'Kmesh' : Kmesh,
+        'FourierInterpolator' : FourierInterpolator,
+        'np' : np,
+    }
+    doctest.testmod(globs=globs)
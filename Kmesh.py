@@ -7,6 +7,10 @@ __all__ = ['Kmesh']
 import numpy as np
 import wien2k
 
+# How far a k point may be from the nearest grid point, as a fraction of the
+# spacing, before it is taken to be off the grid
+OFF_GRID_TOLERANCE = 1e-3
+
 class Kmesh(object):
     '''
     Pass in a band istance or a band_data array (an Nx5 array of id, i, j, k,
@@ -20,6 +24,27 @@ class Kmesh(object):
 
     'band_data' is expanded band data read from TiC.energy
 
+    >>> km = Kmesh(band_data)
+    >>> km.shape
+    (10, 10, 10)
+
+    Every k point must lie on the grid, and only one k point on each grid
+    point
+
+    >>> Kmesh(np.array([[1, 0.0, 0, 0, 0.1], [2, 0.2, 0, 0, 0.2], [3, 0.5, 0, 0, 0.3]]))
+    Traceback (most recent call last):
+        ...
+    ValueError: 1 k points do not lie on the grid, i.e. id 3
+    >>> Kmesh(np.array([[1, 0.0, 0, 0, 0.1], [2, 0.1, 0, 0, 0.2], [3, 0.1, 0, 0, 0.3]]))
+    Traceback (most recent call last):
+        ...
+    ValueError: 1 k points with different energies lie on the same grid point, i.e. ids 2 and 3
+
+    Fine meshes, whose spacings are not exact to 6 decimal places, are found
+
+    >>> k_vals = np.arange(120) / 120.0
+    >>> Kmesh(np.column_stack((np.arange(120) + 1, k_vals, 0 * k_vals, 0 * k_vals, k_vals))).shape
+    (120, 1, 1)
     '''
     def __init__(self, band_data=None):
         self.i_spacing = None
@@ -71,8 +96,7 @@ class Kmesh(object):
         >>> km_slice.i_plaid.shape
         (10, 10)
         '''
-        i_mesh = np.ones(self.energies.shape)
-        i_mesh = i_mesh * self.i_vals.reshape((-1,1,1))
+        i_mesh = np.broadcast_to(self.i_vals.reshape((-1,1,1)), self.energies.shape)
         return np.squeeze(i_mesh)
     i_plaid = property(i_plaid)
 
@@ -95,8 +119,7 @@ class Kmesh(object):
         >>> km_slice.j_plaid.shape
         (10, 10)
         '''
-        j_mesh = np.ones(self.energies.shape)
-        j_mesh = j_mesh * self.j_vals.reshape((1,-1,1))
+        j_mesh = np.broadcast_to(self.j_vals.reshape((1,-1,1)), self.energies.shape)
         return np.squeeze(j_mesh)
     j_plaid = property(j_plaid)
 
@@ -119,8 +142,7 @@ class Kmesh(object):
         >>> km_slice.k_plaid.shape
         (10, 10)
         '''
-        k_mesh = np.ones(self.energies.shape)
-        k_mesh = k_mesh * self.k_vals.reshape((1,1,-1))
+        k_mesh = np.broadcast_to(self.k_vals.reshape((1,1,-1)), self.energies.shape)
         return np.squeeze(k_mesh)
     k_plaid = property(k_plaid)
 
@@ -161,6 +183,23 @@ class Kmesh(object):
         self.j_offset = self.j_offset + shift_places[1] * self.j_spacing
         self.k_offset = self.k_offset + shift_places[2] * self.k_spacing
 
+    def fourier_interpolate(self, shape, sym_mats=None):
+        '''
+        Returns a Kmesh of 'shape' points interpolated from this one by a
+        Fourier series, optionally symmetrised, see FourierInterpolator
+
+        EXAMPLE:
+
+        >>> km = Kmesh(band_data)
+        >>> fine_km = km.fourier_interpolate((20, 20, 20))
+        >>> fine_km.shape
+        (20, 20, 20)
+        >>> np.allclose(fine_km.energies[::2,::2,::2], km.energies)
+        True
+        '''
+        from wien2k.FourierInterpolator import FourierInterpolator
+        return FourierInterpolator(self, sym_mats=sym_mats).kmesh(shape)
+
     def indexes(self):
         '''
         Returns an Nx4 array of the id,i,j,k,energy values as indexes
@@ -199,80 +238,24 @@ class Kmesh(object):
 
     def _build_mesh(self, band_data):
         '''Builds a 3D array of energies'''
-        band_data = band_data.copy()
-        i_vals = np.unique(band_data[:,1])
-        j_vals = np.unique(band_data[:,2])
-        k_vals = np.unique(band_data[:,3])
-        j_vals.sort()
-        j_vals.sort()
-        k_vals.sort()
-        self.i_offset, self.i_spacing = \
-            self._find_arithmetic_series_formula(i_vals)
-        self.j_offset, self.j_spacing = \
-            self._find_arithmetic_series_formula(j_vals)
-        self.k_offset, self.k_spacing = \
-            self._find_arithmetic_series_formula(k_vals)
-        # Find the dimensions of the 3D array - bearing in mind that there may
-        # not be a point at every spacing
-        if self.i_spacing != 0.0:
-            i_dimension = int(round((i_vals.max() - i_vals.min()) / self.i_spacing)) + 1
-        else:
-            i_dimension = 1
-        if self.j_spacing != 0.0:
-            j_dimension = int(round((j_vals.max() - j_vals.min()) / self.j_spacing)) + 1
-        else:
-            j_dimension = 1
-        if self.k_spacing != 0.0:
-            k_dimension = int(round((k_vals.max() - k_vals.min()) / self.k_spacing)) + 1
-        else:
-            k_dimension = 1
-        self.energies = np.ma.zeros((i_dimension, j_dimension, k_dimension))
-        self.ids = np.ma.zeros((i_dimension, j_dimension, k_dimension))
-        self.energies.mask = True
-        self.ids.mask = True
-        # Now populate the mesh
-        for k in band_data:
-            id, i, j, k, energy = k
-            if self.i_spacing == 0:
-                i = 0
-            else:
-                i = (i-self.i_offset)/self.i_spacing
-            if self.j_spacing == 0:
-                j = 0
-            else:
-                j = (j-self.j_offset)/self.j_spacing
-            if self.k_spacing == 0:
-                k = 0
-            else:
-                k = (k-self.k_offset)/self.k_spacing
-            id = int(id)
-            i = int(round(i))
-            j = int(round(j))
-            k = int(round(k))
-            self.energies[i, j, k] = energy
-            self.ids[i, j, k] = id
-            self.energies.mask[i, j, k] = False
-            self.ids.mask[i, j, k] = False
+        band_data = np.asarray(band_data, dtype=float)
+        offsets, spacings, dimensions, flat_indexes = _index_grid(band_data[:,:4], band_data[:,4])
+        self.i_offset, self.j_offset, self.k_offset = offsets
+        self.i_spacing, self.j_spacing, self.k_spacing = spacings
+        size = int(np.prod(dimensions))
+        energies = np.zeros(size)
+        energies[flat_indexes] = band_data[:,4]
+        ids = np.zeros(size)
+        ids[flat_indexes] = band_data[:,0]
+        mask = np.ones(size, dtype=bool)
+        mask[flat_indexes] = False
+        self.energies = np.ma.array(energies.reshape(dimensions), mask=mask.reshape(dimensions))
+        self.ids = np.ma.array(ids.reshape(dimensions), mask=mask.reshape(dimensions).copy())
 
     def _find_arithmetic_series_formula(self, series):
         '''Returns the formula for an incomplete arithmetic progression
         i.e. returns a and b for x_n = a + b*n'''
-        # Test if series is iterable, if not then cast as np array
-        try:
-            tst = iter(series)
-        except TypeError:
-            series = np.array([series])
-        copy_series = np.unique(series[:])
-        copy_series.sort()
-        # Allow up to million points in each span of Kmesh
-        copy_series = np.around(copy_series, decimals=6)
-        if len(copy_series) > 1:
-            differences = copy_series[1:] - copy_series[:-1]
-        else:
-            differences = np.array([0.0])
-        a = copy_series[0]
-        b = differences.min()
-        return (a, b)
+        return _find_arithmetic_series_formula(series)
 
     def shape(self):
         return self.energies.shape
@@ -285,34 +268,100 @@ class Kmesh(object):
         '''
         Allow Kmesh objects to be generated from slices called on the
         object itself (raw data can be got from the attributes directly)
+
+        The new Kmesh is a view, its energies and ids share memory with
+        this one and only its offsets and spacings are worked out. An
+        integer index keeps its dimension with a length of 1. As when the
+        Kmesh was built from the k points of the slice, the edges with no k
+        points are trimmed off and a negative step gives the same points in
+        increasing order. Missing points inside the slice stay masked.
+
+        EXAMPLE:
+
+        >>> km = Kmesh(band_data)
+        >>> km_slice = km[2:8:2,:,5]
+        >>> km_slice.shape
+        (3, 10, 1)
+        >>> list(km_slice.i_vals.round(6))
+        [0.2, 0.4, 0.6]
+        >>> list(km_slice.k_vals.round(6))
+        [0.5]
+        >>> np.may_share_memory(km_slice.energies, km.energies)
+        True
+        >>> km_slice.energies[1,3,0] == km.energies[4,3,5]
+        True
+        >>> list(km[7:1:-2,0,0].i_vals.round(6))
+        [0.3, 0.5, 0.7]
+
+        Masked edges are trimmed
+
+        >>> km.energies[:,:2,:] = np.ma.masked
+        >>> km[:,:,5].shape
+        (10, 8, 1)
+        >>> list(km[:,:,5].j_vals.round(6)[:2])
+        [0.2, 0.3]
         '''
-        slices = args[0]
-        # Create a matrix of indexes
-        i_vals = np.ma.zeros(self.energies.shape)
-        i_vals.mask = self.energies.mask.copy()
-        j_vals = np.ma.zeros(self.energies.shape)
-        j_vals.mask = self.energies.mask.copy()
-        k_vals = np.ma.zeros(self.energies.shape)
-        k_vals.mask = self.energies.mask.copy()
-        for ind, en in np.ndenumerate(self.energies):
-            if self.energies.mask[ind] == False:
-                i_vals[ind] = ind[0]
-                j_vals[ind] = ind[1]
-                k_vals[ind] = ind[2]
-        # Now parse down to only those asked for
-        ens = self.energies[slices]
-        ids = self.ids[slices]
-        i_vals = i_vals[slices] * self.i_spacing + self.i_offset
-        j_vals = j_vals[slices] * self.j_spacing + self.j_offset
-        k_vals = k_vals[slices] * self.k_spacing + self.k_offset
-        # Now output a klist to create the new kmesh
-        klist = []
-        for ind, mask in np.ndenumerate(ens.mask):
-            if mask == False:
-                klist.append([ids[ind], i_vals[ind], j_vals[ind], k_vals[ind], ens[ind]])
-        new_kmesh = Kmesh(np.array(klist))
-        return new_kmesh
-            
+        slices = self._expand_slices(args[0])
+        # Trim off the edges with no k points
+        present = ~np.ma.getmaskarray(self.energies[slices])
+        if not present.any():
+            raise ValueError('There are no k points in the slice')
+        trimmed = []
+        for axis in range(3):
+            other_axes = tuple([x for x in range(3) if x != axis])
+            present_indexes = np.flatnonzero(present.any(axis=other_axes))
+            start, stop, step = slices[axis].indices(self.energies.shape[axis])
+            first, last = present_indexes[0], present_indexes[-1]
+            trimmed.append(slice(start + first * step, start + last * step + 1, step))
+        slices = tuple(trimmed)
+        view = Kmesh()
+        view.energies = self.energies[slices]
+        view.ids = self.ids[slices]
+        offsets = [self.i_offset, self.j_offset, self.k_offset]
+        spacings = [self.i_spacing, self.j_spacing, self.k_spacing]
+        for axis in range(3):
+            offsets[axis] = offsets[axis] + slices[axis].start * spacings[axis]
+            # As for a mesh built from a single plane of points
+            if view.energies.shape[axis] == 1:
+                spacings[axis] = 0.0
+            else:
+                spacings[axis] = spacings[axis] * slices[axis].step
+        view.i_offset, view.j_offset, view.k_offset = offsets
+        view.i_spacing, view.j_spacing, view.k_spacing = spacings
+        return view
+
+    def _expand_slices(self, key):
+        '''Returns a tuple of a slice with a positive step along each
+        direction, an integer becoming a slice of length 1'''
+        if not isinstance(key, tuple):
+            key = (key,)
+        if Ellipsis in key:
+            at = key.index(Ellipsis)
+            key = key[:at] + (slice(None),) * (3 - len(key) + 1) + key[at+1:]
+        if len(key) > 3:
+            raise IndexError('Too many indices for a Kmesh')
+        key = key + (slice(None),) * (3 - len(key))
+        slices = []
+        for axis, index in enumerate(key):
+            length = self.energies.shape[axis]
+            if isinstance(index, slice):
+                start, stop, step = index.indices(length)
+                if step < 0:
+                    # The same points taken in increasing order
+                    indexes = range(start, stop, step)
+                    if len(indexes) == 0:
+                        start, stop, step = 0, 0, 1
+                    else:
+                        start, stop, step = indexes[-1], indexes[0] + 1, -step
+                slices.append(slice(start, stop, step))
+                continue
+            index = int(index)
+            if (index < -length) or (index >= length):
+                raise IndexError('Index %d is out of bounds for a Kmesh dimension of %d' % (index, length))
+            index = index % length
+            slices.append(slice(index, index+1, 1))
+        return tuple(slices)
+
     def query(self):
         '''
         Returns a bunch of useful stuff when using interactively. Aliased to
@@ -397,6 +446,86 @@ class Kmesh(object):
         print out
     q = property(query)
         
+
+
+def _index_grid(k_points, values):
+    '''
+    Finds the grid the k points (an Nx4 array of id, i, j, k values) lie on,
+    returns its offsets, spacings and dimensions and the flat index of each
+    k point in it. Raises a ValueError if a k point is off the grid or if two
+    with different 'values' (one value or row per k point) share a grid point
+    '''
+    offsets = []
+    spacings = []
+    dimensions = []
+    for col in [1, 2, 3]:
+        vals = np.unique(k_points[:,col])
+        offset, spacing = _find_arithmetic_series_formula(vals)
+        # Find the dimension bearing in mind that there may not be a point at
+        # every spacing
+        if spacing != 0.0:
+            dimensions.append(int(round((vals.max() - vals.min()) / spacing)) + 1)
+        else:
+            dimensions.append(1)
+        offsets.append(offset)
+        spacings.append(spacing)
+    # The grid index of every point along each direction
+    indexes = np.zeros((3, len(k_points)), dtype=int)
+    for axis in range(3):
+        if spacings[axis] == 0:
+            continue
+        positions = (k_points[:,axis+1] - offsets[axis]) / spacings[axis]
+        indexes[axis] = np.floor(positions + 0.5)
+        off_grid = np.abs(positions - indexes[axis]) > OFF_GRID_TOLERANCE
+        if off_grid.any():
+            raise ValueError('%d k points do not lie on the grid, i.e. id %d' % \
+                (off_grid.sum(), k_points[off_grid,0][0]))
+    flat_indexes = np.ravel_multi_index(indexes, dimensions)
+    # Points landing on the same grid point must be the same point
+    order = np.argsort(flat_indexes, kind='mergesort')
+    repeated = flat_indexes[order[1:]] == flat_indexes[order[:-1]]
+    if repeated.any():
+        sorted_values = values[order]
+        differs = (sorted_values[1:] != sorted_values[:-1]) & \
+            ~(np.isnan(sorted_values[1:]) & np.isnan(sorted_values[:-1]))
+        if differs.ndim > 1:
+            differs = differs.reshape((len(differs), -1)).any(axis=1)
+        clashes = repeated & differs
+        if clashes.any():
+            raise ValueError('%d k points with different energies lie on the same grid point, i.e. ids %d and %d' % \
+                (clashes.sum(), k_points[order[:-1][clashes][0],0], k_points[order[1:][clashes][0],0]))
+    return offsets, spacings, tuple(dimensions), flat_indexes
+
+def _find_arithmetic_series_formula(series):
+    '''Returns the formula for an incomplete arithmetic progression
+    i.e. returns a and b for x_n = a + b*n'''
+    # Test if series is iterable, if not then cast as np array
+    try:
+        tst = iter(series)
+    except TypeError:
+        series = np.array([series])
+    copy_series = np.unique(series[:])
+    copy_series.sort()
+    # Allow up to million points in each span of Kmesh
+    copy_series = np.around(copy_series, decimals=6)
+    if len(copy_series) > 1:
+        differences = copy_series[1:] - copy_series[:-1]
+    else:
+        differences = np.array([0.0])
+    a = copy_series[0]
+    b = differences.min()
+    # The rounding puts the smallest difference out by up to 1e-6, which
+    # builds up over many points, so where the span is (near enough) a whole
+    # number of differences take the spacing over the whole span instead
+    if b != 0:
+        span = np.max(series) - np.min(series)
+        num_steps = round(span / b)
+        if abs(span / b - num_steps) < 0.25:
+            a = np.min(series)
+            b = span / num_steps
+    return (a, b)
+
+
 if __name__ == '__main__':
     # Do some testing ...
     import doctest
@@ -412,7 +541,8 @@ if __name__ == '__main__':
     band_data = expand_ibz(band=band, outputkgen_rdr=outputkgen_rdr)
     globs = {
         'band_data' : band_data,
-        'Kmesh': Kmesh
+        'Kmesh': Kmesh,
+        'np' : np,
     }
     doctest.testmod(globs=globs)
     doctest.testfile(os.path.join('tests', 'Kmesh_test.txt'))
@@ -0,0 +1,261 @@
+'''
+Module containing the KmeshInterpolator class
+'''
+
+__all__ = ['KmeshInterpolator']
+
+import numpy as np
+from wien2k.Kmesh import Kmesh
+
+# Points of the mesh with less weight than this in a value are not used
+WEIGHT_TOLERANCE = 1e-9
+
+class KmeshInterpolator(object):
+    '''
+    Interpolates the energies of a Kmesh at any k points, treating the mesh
+    as one period of the zone (i.e. the points on the far faces are not
+    repeated, as from expand_ibz)
+
+    The 'cubic' method is a periodic tricubic B-spline through the points
+    of the mesh, its coefficients (one per point) are found once by an FFT.
+    The 'linear' method is trilinear between the points. The energies and
+    gradients at a batch of k points are found from the 4x4x4 (or 2x2x2)
+    points around each at once.
+
+    Masked points are never used. Where the cubic spline would need one the
+    trilinear value is given instead, and where that would too the energy
+    is masked (points given no weight, i.e. those around a mesh point, are
+    not needed). Gradients are masked where they would need one. n.b. As the spline coefficients depend on the whole mesh,
+    masked points are filled with the mean energy in finding them, which has
+    a small effect on the cubic values nearby.
+
+    Parameters,
+
+    kmesh:              The Kmesh
+    method:             'cubic' or 'linear' - default: 'cubic'
+
+    Results in,
+
+    values:             The energies at the mesh points, masked points
+                        filled with the mean
+    mask:               The mask of the mesh points
+    coefficients:       The B-spline coefficients ('cubic') or energies
+                        ('linear') at the mesh points
+
+    EXAMPLE:
+
+    >>> km = Kmesh(band_data)
+    >>> interp = KmeshInterpolator(km)
+
+    The interpolation passes through the points of the mesh
+
+    >>> np.allclose(interp.energies_at(km.kpoints[:,1:4]), km.kpoints[:,4])
+    True
+
+    Between them it is close to the Fourier series
+
+    >>> k_vals = np.random.RandomState(0).rand(1000, 3)
+    >>> energies, gradients = interp.energies_at(k_vals, gradients=True)
+    >>> np.abs(energies - FourierInterpolator(km).energies_at(k_vals)).max() < 0.01
+    True
+
+    The gradients are those of the interpolation
+
+    >>> step = np.array([1e-6, 0, 0])
+    >>> finite_differences = (interp.energies_at(k_vals + step) - interp.energies_at(k_vals - step)) / 2e-6
+    >>> np.allclose(gradients[:,0], finite_differences)
+    True
+
+    Near a masked point the trilinear value is given, at it none is
+
+    >>> km.energies[2,3,4] = np.ma.masked
+    >>> interp = KmeshInterpolator(km)
+    >>> energies = interp.energies_at([[0.2, 0.3, 0.4], [0.25, 0.3, 0.35], [0.21, 0.3, 0.55], [0.7, 0.7, 0.7]])
+    >>> energies.mask
+    array([ True,  True, False, False])
+    >>> abs(energies[2] - KmeshInterpolator(km, method='linear').energies_at([[0.21, 0.3, 0.55]])[0]) < 1e-12
+    True
+
+    The mesh points next to it are not masked
+
+    >>> nodes = np.array([[1, 2, 3], [1, 2, 4], [1, 3, 3], [1, 3, 4], [2, 2, 3], [2, 2, 4], [2, 3, 3], [3, 3, 4]])
+    >>> for method in ('cubic', 'linear'):
+    ...     energies = KmeshInterpolator(km, method=method).energies_at(nodes * 0.1)
+    ...     print energies.mask.any(), np.allclose(energies, km.energies[tuple(nodes.transpose())])
+    False True
+    False True
+    '''
+    def __init__(self, kmesh, method='cubic'):
+        if method not in ('cubic', 'linear'):
+            raise ValueError('Unknown interpolation method %s' % method)
+        self.method = method
+        self.shape = kmesh.energies.shape
+        self.offsets = np.array([kmesh.i_offset, kmesh.j_offset, kmesh.k_offset], dtype=float)
+        spacings = np.array([kmesh.i_spacing, kmesh.j_spacing, kmesh.k_spacing], dtype=float)
+        # A single plane has no extent in its normal direction
+        self.spacings = np.where(spacings != 0, spacings, 1.0)
+        self.mask = np.ma.getmaskarray(kmesh.energies)
+        energies = kmesh.energies.filled(0.0).astype(float)
+        if self.mask.any() and not self.mask.all():
+            energies[self.mask] = energies[~self.mask].mean()
+        self.values = energies
+        if method == 'cubic':
+            self.coefficients = _spline_coefficients(energies)
+        else:
+            self.coefficients = energies
+
+    def energies_at(self, k_vals, gradients=False, chunk_size=65536):
+        '''
+        Returns the interpolated energies at an Nx3 array of i, j, k values
+        as a masked array, and if 'gradients' is True an Nx3 masked array of
+        their gradients, working on chunk_size points at a time
+        '''
+        k_vals = np.atleast_2d(np.asarray(k_vals, dtype=float))
+        energies = np.ma.zeros(len(k_vals))
+        energies.mask = np.zeros(len(k_vals), dtype=bool)
+        grads = np.ma.zeros((len(k_vals), 3))
+        grads.mask = np.zeros((len(k_vals), 3), dtype=bool)
+        for start in range(0, len(k_vals), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            positions = (k_vals[chunk] - self.offsets) / self.spacings
+            chunk_energies, chunk_grads, masked, grads_masked = self._evaluate(positions, self.method, gradients)
+            if (self.method == 'cubic') and masked.any():
+                # Fall back to trilinear where the spline needs a masked point
+                linear_energies, linear_grads, linear_masked, linear_grads_masked = \
+                    self._evaluate(positions[masked], 'linear', gradients)
+                fall_back = np.flatnonzero(masked)[~linear_masked]
+                chunk_energies[fall_back] = linear_energies[~linear_masked]
+                if gradients:
+                    chunk_grads[fall_back] = linear_grads[~linear_masked]
+                    grads_masked[fall_back] = linear_grads_masked[~linear_masked]
+                masked[fall_back] = False
+            energies[chunk] = chunk_energies
+            energies.mask[chunk] = masked
+            if gradients:
+                grads[chunk] = chunk_grads
+                grads.mask[chunk] = (masked | grads_masked).reshape((-1, 1))
+        if gradients:
+            return energies, grads
+        return energies
+
+    def _evaluate(self, positions, method, gradients):
+        # Sums the weighted coefficients around each position, given in
+        # units of the spacings from the offsets
+        if method == 'cubic':
+            coefficients = self.coefficients
+            weight_function = _cubic_weights
+        else:
+            coefficients = self.values
+            weight_function = _linear_weights
+        flat_indexes, weights, derivatives = self._stencil(positions, weight_function)
+        block = coefficients.take(flat_indexes)
+        # Contract one direction at a time, the last first
+        k_sums = np.einsum('nijk,nk->nij', block, weights[2])
+        jk_sums = np.einsum('nij,nj->ni', k_sums, weights[1])
+        energies = np.einsum('ni,ni->n', jk_sums, weights[0])
+        grads = None
+        if gradients:
+            grads = np.column_stack((
+                np.einsum('ni,ni->n', jk_sums, derivatives[0]),
+                np.einsum('ni,ni->n', np.einsum('nij,nj->ni', k_sums, derivatives[1]), weights[0]),
+                np.einsum('ni,ni->n', np.einsum('nij,nj->ni', np.einsum('nijk,nk->nij', block, derivatives[2]), weights[1]), weights[0]),
+            )) / self.spacings
+        # Whether each energy and gradient uses a masked point
+        masked = np.zeros(len(positions), dtype=bool)
+        grads_masked = np.zeros(len(positions), dtype=bool)
+        if self.mask.any():
+            masked_points = self.mask.take(flat_indexes)
+            masked = _uses_masked(masked_points, weights)
+            if gradients:
+                for axis in range(3):
+                    factors = list(weights)
+                    factors[axis] = derivatives[axis]
+                    grads_masked = grads_masked | _uses_masked(masked_points, factors)
+        return energies, grads, masked, grads_masked
+
+    def _stencil(self, positions, weight_function):
+        # The flat indexes of the points used around each position (wrapped
+        # into the zone) as an (N, n, n, n) array and the weights and
+        # derivatives of those along each direction
+        flat_indexes = 0
+        weights = []
+        derivatives = []
+        for axis in range(3):
+            n = self.shape[axis]
+            cells = np.floor(positions[:,axis])
+            axis_weights, axis_derivatives, steps = weight_function(positions[:,axis] - cells)
+            axis_indexes = (cells.astype(int).reshape((-1, 1)) + steps) % n
+            shape = [len(positions), 1, 1, 1]
+            shape[axis+1] = len(steps)
+            flat_indexes = flat_indexes * n + axis_indexes.reshape(shape)
+            weights.append(axis_weights)
+            derivatives.append(axis_derivatives)
+        return flat_indexes, weights, derivatives
+
+
+def _uses_masked(masked_points, factors):
+    '''Returns whether each of an (N, n, n, n) array of masked points is
+    given weight by the product of the (N, n) factors along each direction'''
+    uses_masked = masked_points.reshape((len(masked_points), -1)).any(axis=1)
+    # Only the positions with a masked point around them are weighed
+    rows = np.flatnonzero(uses_masked)
+    if len(rows) == 0:
+        return uses_masked
+    weights = factors[0][rows,:,None,None] * factors[1][rows,None,:,None] * factors[2][rows,None,None,:]
+    uses_masked[rows] = (masked_points[rows] & (np.abs(weights) > WEIGHT_TOLERANCE)).reshape((len(rows), -1)).any(axis=1)
+    return uses_masked
+
+def _spline_coefficients(energies):
+    '''Returns the periodic cubic B-spline coefficients through a 3D array
+    of energies'''
+    spectrum = np.fft.fftn(energies)
+    for axis, n in enumerate(energies.shape):
+        # A B-spline is 1/6, 4/6, 1/6 at the points around its centre
+        response = (4.0 + 2.0 * np.cos(2.0 * np.pi * np.arange(n) / n)) / 6.0
+        shape = [1, 1, 1]
+        shape[axis] = n
+        spectrum = spectrum / response.reshape(shape)
+    return np.fft.ifftn(spectrum).real
+
+def _cubic_weights(fractions):
+    '''Returns the cubic B-spline weights and their derivatives of the 4
+    points around each fraction of a cell, and the steps to those points'''
+    u = fractions
+    u2 = u * u
+    u3 = u2 * u
+    v = 1.0 - u
+    v2 = v * v
+    weights = np.column_stack((v2 * v, 3.0 * u3 - 6.0 * u2 + 4.0, -3.0 * u3 + 3.0 * u2 + 3.0 * u + 1.0, u3)) / 6.0
+    derivatives = np.column_stack((-0.5 * v2, 1.5 * u2 - 2.0 * u, -1.5 * u2 + u + 0.5, 0.5 * u2))
+    return weights, derivatives, np.array([-1, 0, 1, 2])
+
+def _linear_weights(fractions):
+    '''Returns the linear weights and their derivatives of the 2 points
+    either side of each fraction of a cell, and the steps to those points'''
+    u = fractions.reshape((-1, 1))
+    weights = np.column_stack((1.0 - u, u))
+    derivatives = np.column_stack((-np.ones(len(u)), np.ones(len(u))))
+    return weights, derivatives, np.array([0, 1])
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    import wien2k
+    from wien2k.utils import expand_ibz
+    from wien2k.FourierInterpolator import FourierInterpolator
+    # A band expanded to the full zone
+    energy_filename = os.path.join(sys.path[0], 'tests', 'TiC', 'TiC.energy')
+    outputkgen_filename = os.path.join(sys.path[0], 'tests', 'TiC', 'TiC.outputkgen')
+    band = wien2k.EnergyReader(energy_filename).bands[6]
+    outputkgen_rdr = wien2k.OutputkgenReader(outputkgen_filename)
+    band_data = expand_ibz(band=band, outputkgen_rdr=outputkgen_rdr)
+    globs = {
+        'band_data' : band_data,
+        'Kmesh' : Kmesh,
+        'KmeshInterpolator' : KmeshInterpolator,
+        'FourierInterpolator' : FourierInterpolator,
+        'np' : np,
+    }
+    doctest.testmod(globs=globs)
@@ -0,0 +1,55 @@
+'''
+Module containing the LazyModule class
+'''
+
+__all__ = ['LazyModule']
+
+import sys
+import types
+import importlib
+
+class LazyModule(types.ModuleType):
+    '''
+    A package whose public names are imported from their modules when first
+    used, so importing the package costs only the modules actually used
+
+    Put in place of a package at the end of its __init__.py with,
+
+        sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+            'EnergyReader' : 'wien2k.readers.EnergyReader', ...})
+
+    mapping each name to the module it is imported from.
+
+    n.b. Importing a module sets an attribute of the same name on its
+    package (i.e. importing wien2k.Band sets wien2k.Band to the module), so
+    the names are always looked up in their modules rather than kept.
+
+    EXAMPLE:
+
+    >>> lazy = LazyModule(types.ModuleType('lazy'), {'join' : 'os.path'})
+    >>> lazy.join('a', 'b')
+    'a/b'
+    >>> hasattr(lazy, 'split')
+    False
+    '''
+    def __init__(self, module, names):
+        self._lazy_names = names
+        types.ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+
+    def __getattribute__(self, name):
+        lazy_names = types.ModuleType.__getattribute__(self, '_lazy_names')
+        if name in lazy_names:
+            module = sys.modules.get(lazy_names[name])
+            if module is None:
+                module = importlib.import_module(lazy_names[name])
+            return getattr(module, name)
+        return types.ModuleType.__getattribute__(self, name)
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys()) | set(self._lazy_names.keys()))
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,144 @@
+'''
+Module containing the MultiBandKmesh class
+'''
+
+__all__ = ['MultiBandKmesh']
+
+import numpy as np
+from wien2k.Kmesh import Kmesh, _index_grid
+from wien2k.utils.expand_ibz import expand_ibz
+
+class MultiBandKmesh(object):
+    '''
+    The energies of several bands on one 3D mesh of k points, built in one
+    pass from an EnergyReader
+
+    The k points are expanded to the full zone and placed on the grid once
+    for all the bands, which share the grid, mask and ids. Indexing gives the
+    Kmesh of a single band as a view of the energies.
+
+    Parameters,
+
+    energy_rdr:         The EnergyReader the bands are read from
+    outputkgen_rdr:     An OutputkgenReader whose symmetry matrices expand
+                        the k points to the full Brillouin zone, if None the
+                        k points are used as they are - default: None
+    bands:              The indexes (as of EnergyReader.bands) of the bands
+                        to mesh, by default all of them - default: None
+
+    Results in,
+
+    band_indexes:       The index of each band meshed
+    energies:           A masked (n_bands, ni, nj, nk) array of energies,
+                        masked where there is no k point or the band is not
+                        present at it
+    ids:                A masked (ni, nj, nk) array of k point ids
+    mask:               The (ni, nj, nk) mask of grid points with no k point
+    i_offset, ...       The offsets and spacings of the grid, as of a Kmesh
+
+    EXAMPLE:
+
+    >>> mkm = MultiBandKmesh(energy_rdr, outputkgen_rdr, bands=[5, 6, 7])
+    >>> mkm.shape
+    (3, 10, 10, 10)
+    >>> km = mkm[1]
+    >>> km.shape
+    (10, 10, 10)
+    >>> band_km = Kmesh(expand_ibz(band=energy_rdr.bands[6], outputkgen_rdr=outputkgen_rdr))
+    >>> (km.energies == band_km.energies).all()
+    True
+    >>> (km.ids == band_km.ids).all()
+    True
+    >>> np.may_share_memory(km.energies, mkm.energies)
+    True
+
+    Meshing every band to find those which cross the Fermi energy
+
+    >>> MultiBandKmesh(energy_rdr, outputkgen_rdr).bands_crossing(0.74023)
+    [5, 6, 7, 8]
+    '''
+    def __init__(self, energy_rdr, outputkgen_rdr=None, bands=None):
+        if bands is None:
+            bands = range(len(energy_rdr.bands))
+        self.band_indexes = list(bands)
+        band_energies = self._read_band_energies(energy_rdr)
+        # The row of each k point in the .energy file is carried through the
+        # expansion to look up its energies
+        k_points = energy_rdr.k_points
+        ibz_data = np.column_stack((k_points, np.arange(len(k_points))))
+        if outputkgen_rdr is not None:
+            full_data = expand_ibz(ibz_data=ibz_data, outputkgen_rdr=outputkgen_rdr)
+        else:
+            full_data = ibz_data
+        rows = full_data[:,4].astype(int)
+        offsets, spacings, dimensions, flat_indexes = _index_grid(full_data[:,:4], band_energies[rows])
+        self.i_offset, self.j_offset, self.k_offset = offsets
+        self.i_spacing, self.j_spacing, self.k_spacing = spacings
+        size = int(np.prod(dimensions))
+        mask = np.ones(size, dtype=bool)
+        mask[flat_indexes] = False
+        ids = np.zeros(size)
+        ids[flat_indexes] = full_data[:,0]
+        energies = np.zeros((len(self.band_indexes), size))
+        energies[:,flat_indexes] = band_energies[rows].transpose()
+        absent = np.isnan(energies)
+        energies[absent] = 0.0
+        self.mask = mask.reshape(dimensions)
+        self.ids = np.ma.array(ids.reshape(dimensions), mask=self.mask)
+        self.energies = np.ma.array(energies.reshape((-1,) + dimensions), \
+            mask=absent.reshape((-1,) + dimensions) | self.mask)
+
+    def _read_band_energies(self, energy_rdr):
+        # Returns the energy of each band (column) at each k point (row) of
+        # the .energy file, NaN where the band is not present
+        if energy_rdr.energies is not None:
+            return energy_rdr.energies[:,self.band_indexes]
+        # A lazy reader reads only the bands asked for
+        band_energies = np.empty((len(energy_rdr.k_points), len(self.band_indexes)))
+        band_energies.fill(np.nan)
+        for col, band_index in enumerate(self.band_indexes):
+            present = energy_rdr.num_bands > band_index
+            band_energies[present,col] = energy_rdr.bands[band_index].energies
+        return band_energies
+
+    def shape(self):
+        return self.energies.shape
+    shape = property(shape)
+
+    def __len__(self):
+        return len(self.energies)
+
+    def __getitem__(self, band_num):
+        '''Returns the Kmesh of the band_num'th band meshed, sharing memory
+        with this mesh'''
+        kmesh = Kmesh()
+        kmesh.energies = self.energies[band_num]
+        kmesh.ids = np.ma.array(self.ids.data, mask=kmesh.energies.mask)
+        kmesh.i_offset, kmesh.j_offset, kmesh.k_offset = self.i_offset, self.j_offset, self.k_offset
+        kmesh.i_spacing, kmesh.j_spacing, kmesh.k_spacing = self.i_spacing, self.j_spacing, self.k_spacing
+        return kmesh
+
+    def bands_crossing(self, energy):
+        '''Returns the indexes of the bands whose energies span 'energy'
+        (i.e. the Fermi energy)'''
+        energies = self.energies.reshape((len(self.energies), -1))
+        crossing = (energies.min(axis=1) <= energy) & (energies.max(axis=1) >= energy)
+        return [x for x, is_crossing in zip(self.band_indexes, crossing) if is_crossing]
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    import wien2k
+    energy_filename = os.path.join(sys.path[0], 'tests', 'TiC', 'TiC.energy')
+    outputkgen_filename = os.path.join(sys.path[0], 'tests', 'TiC', 'TiC.outputkgen')
+    globs = {
+        'energy_rdr' : wien2k.EnergyReader(energy_filename),
+        'outputkgen_rdr' : wien2k.OutputkgenReader(outputkgen_filename),
+        'MultiBandKmesh' : MultiBandKmesh,
+        'Kmesh' : Kmesh,
+        'expand_ibz' : expand_ibz,
+        'np' : np,
+    }
+    doctest.testmod(globs=globs)
@@ -32,9 +32,9 @@ class SymMat(object):
 
     '''
     def __init__(self, matrix=None, tau_offsets=None, id=None):
-        if matrix == None:
+        if matrix is None:
             matrix = np.zeros((3,3)) 
-        if tau_offsets == None:
+        if tau_offsets is None:
             tau_offsets = np.zeros((3)) 
         self.matrix = matrix
         self.tau_offsets = tau_offsets
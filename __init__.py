@@ -1,13 +1,35 @@
-__all__ = ['EnergyReader', 'Scf2Reader', 'StructReader', 'OutputkgenReader', 'KlistReader', 'KlistWriter', 'Output2Reader', 'Band', 'Kpoint', 'Kmesh', 'SymMat']
+__all__ = ['EnergyReader', 'Scf2Reader', 'StructReader', 'OutputkgenReader', 'KlistReader', 'KlistWriter', 'Output2Reader', 'ParallelEnergyReader', 'SpinEnergyReader', 'KgenReader', 'QtlReader', 'DosReader', 'DosBatchReader', 'ScfReader', 'VectorReader', 'ClmReader', 'RhoReader', 'RhoStackReader', 'KgenWriter', 'Band', 'Kpoint', 'Kmesh', 'MultiBandKmesh', 'FourierInterpolator', 'KmeshInterpolator', 'SymMat', 'Case']
 
-from readers.EnergyReader import EnergyReader
-from readers.Scf2Reader import Scf2Reader
-from readers.StructReader import StructReader
-from readers.OutputkgenReader import OutputkgenReader
-from readers.KlistReader import KlistReader
-from readers.Output2Reader import Output2Reader
-from writers.KlistWriter import KlistWriter
-from Band import Band
-from Kpoint import Kpoint
-from Kmesh import Kmesh
-from SymMat import SymMat
+# The public names are imported from their modules when first used, see
+# LazyModule
+import sys
+from wien2k.LazyModule import LazyModule
+sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+    'EnergyReader' : 'wien2k.readers.EnergyReader',
+    'Scf2Reader' : 'wien2k.readers.Scf2Reader',
+    'StructReader' : 'wien2k.readers.StructReader',
+    'OutputkgenReader' : 'wien2k.readers.OutputkgenReader',
+    'KlistReader' : 'wien2k.readers.KlistReader',
+    'Output2Reader' : 'wien2k.readers.Output2Reader',
+    'ParallelEnergyReader' : 'wien2k.readers.ParallelEnergyReader',
+    'SpinEnergyReader' : 'wien2k.readers.SpinEnergyReader',
+    'KgenReader' : 'wien2k.readers.KgenReader',
+    'QtlReader' : 'wien2k.readers.QtlReader',
+    'DosReader' : 'wien2k.readers.DosReader',
+    'DosBatchReader' : 'wien2k.readers.DosBatchReader',
+    'ScfReader' : 'wien2k.readers.ScfReader',
+    'VectorReader' : 'wien2k.readers.VectorReader',
+    'ClmReader' : 'wien2k.readers.ClmReader',
+    'RhoReader' : 'wien2k.readers.RhoReader',
+    'RhoStackReader' : 'wien2k.readers.RhoStackReader',
+    'KlistWriter' : 'wien2k.writers.KlistWriter',
+    'KgenWriter' : 'wien2k.writers.KgenWriter',
+    'Band' : 'wien2k.Band',
+    'Kpoint' : 'wien2k.Kpoint',
+    'Kmesh' : 'wien2k.Kmesh',
+    'MultiBandKmesh' : 'wien2k.MultiBandKmesh',
+    'FourierInterpolator' : 'wien2k.FourierInterpolator',
+    'KmeshInterpolator' : 'wien2k.KmeshInterpolator',
+    'SymMat' : 'wien2k.SymMat',
+    'Case' : 'wien2k.Case',
+})
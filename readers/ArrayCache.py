@@ -0,0 +1,162 @@
+'''
+ArrayCache.py
+
+A class which keeps the arrays parsed from a WIEN2k file in binary .npy
+files so that they can be memory mapped rather than parsed again
+'''
+
+__all__ = ['ArrayCache']
+
+import os
+import json
+import hashlib
+import numpy as np
+
+KEY_FILENAME = 'key.json'
+HASH_CHUNK_SIZE = 2**20
+
+class ArrayCache(object):
+    '''
+    A cache of the Numpy arrays parsed from a single source file
+
+    The cache is keyed on the size, modification time and SHA1 hash of the
+    source file. If the size and modification time are unchanged the cache
+    is used without reading the source, otherwise the hash is checked and
+    the cache discarded if the contents have changed. A cache written by
+    another version of the reader, or without every array the reader
+    expects, is not used either.
+
+    Parameters,
+
+    filename:       The source file
+    cache_dir:      The directory in which to keep the cache, by default the
+                    cache is kept in a hidden directory next to the source
+                    i.e. 'TiC.energy' is cached in '.TiC.energy.cache'
+    version:        The version of the arrays kept by the reader, changed
+                    whenever they change - default: 0
+    names:          The names of the arrays the reader expects - default: ()
+
+    EXAMPLE:
+
+    >>> cache = ArrayCache(TiC_klist_filename, cache_dir=tmp_dir, version=1, names=['data', 'shape'])
+    >>> cache.load() is None
+    True
+    >>> cache.save({'data' : np.arange(3.), 'shape' : None})
+    >>> arrays = cache.load()
+    >>> arrays['data'].tolist(), arrays['shape']
+    ([0.0, 1.0, 2.0], None)
+
+    The cache of another version, or missing an array, is not used
+
+    >>> ArrayCache(TiC_klist_filename, cache_dir=tmp_dir, version=2, names=['data', 'shape']).load() is None
+    True
+    >>> ArrayCache(TiC_klist_filename, cache_dir=tmp_dir, version=1, names=['data', 'weights']).load() is None
+    True
+    '''
+    def __init__(self, filename, cache_dir=None, version=0, names=()):
+        self.filename = filename
+        self.version = version
+        self.names = list(names)
+        basename = os.path.basename(filename)
+        if cache_dir is None:
+            self.cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), \
+                '.%s.cache' % basename)
+        else:
+            # Allow one cache dir to hold files of the same name from
+            # different cases
+            path_hash = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+            self.cache_dir = os.path.join(cache_dir, '%s-%s' % (basename, path_hash[:12]))
+
+    def load(self):
+        '''Returns a dict of read-only memory mapped arrays (None for values
+        which were None) or None if there is no valid cache'''
+        key_filename = os.path.join(self.cache_dir, KEY_FILENAME)
+        if not os.path.exists(key_filename):
+            return None
+        key_handle = open(key_filename, 'r')
+        try:
+            key = json.load(key_handle)
+        except ValueError:
+            return None
+        finally:
+            key_handle.close()
+        if key.get('version') != self.version:
+            return None
+        empty = key.get('empty', [])
+        for name in self.names:
+            if (name not in key['arrays']) and (name not in empty):
+                return None
+        stat = os.stat(self.filename)
+        if (key['size'] != stat.st_size) or (key['mtime'] != stat.st_mtime):
+            if (key['size'] != stat.st_size) or (key['sha1'] != self._hash()):
+                return None
+            # Same contents, just touched - update the key
+            key['mtime'] = stat.st_mtime
+            self._write_key(key)
+        arrays = dict([(name, None) for name in empty])
+        for name in key['arrays']:
+            try:
+                arrays[name] = np.load(self._array_filename(name), mmap_mode='r')
+            except IOError:
+                return None
+        return arrays
+
+    def save(self, arrays):
+        '''Stores a dict of arrays, values of None are noted in the key'''
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        # Remove the key first so a partly written cache is never used
+        key_filename = os.path.join(self.cache_dir, KEY_FILENAME)
+        if os.path.exists(key_filename):
+            os.remove(key_filename)
+        names = []
+        empty = []
+        for name, array in arrays.items():
+            if array is None:
+                empty.append(name)
+                continue
+            np.save(self._array_filename(name), np.asarray(array))
+            names.append(name)
+        stat = os.stat(self.filename)
+        self._write_key({
+            'version' : self.version,
+            'size' : stat.st_size,
+            'mtime' : stat.st_mtime,
+            'sha1' : self._hash(),
+            'arrays' : sorted(names),
+            'empty' : sorted(empty),
+        })
+
+    def _array_filename(self, name):
+        return os.path.join(self.cache_dir, '%s.npy' % name)
+
+    def _write_key(self, key):
+        key_handle = open(os.path.join(self.cache_dir, KEY_FILENAME), 'w')
+        json.dump(key, key_handle)
+        key_handle.close()
+
+    def _hash(self):
+        sha1 = hashlib.sha1()
+        file_handle = open(self.filename, 'rb')
+        chunk = file_handle.read(HASH_CHUNK_SIZE)
+        while chunk:
+            sha1.update(chunk)
+            chunk = file_handle.read(HASH_CHUNK_SIZE)
+        file_handle.close()
+        return sha1.hexdigest()
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    import shutil
+    import tempfile
+    tmp_dir = tempfile.mkdtemp()
+    globs = {
+        'TiC_klist_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.klist'),
+        'tmp_dir' : tmp_dir,
+        'ArrayCache' : ArrayCache,
+        'np' : np,
+    }
+    doctest.testmod(globs=globs)
+    shutil.rmtree(tmp_dir)
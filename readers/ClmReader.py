@@ -0,0 +1,207 @@
+'''
+ClmReader.py
+
+A class for reading the radial LM expansions of the charge density in the
+WIEN2k .clmsum, .clmval and .clmcor files
+'''
+
+__all__ = ['ClmReader']
+
+import os
+import re
+import numpy as np
+from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.FortranFormat import FortranFormat, line_bounds
+from wien2k.readers.CompressedFile import map_file, read_array, iter_chunks
+
+fmt = {
+    # Each atom begins with
+    #    ATOMNUMBER =  1
+    #    NUMBER OF LM  5
+    # or in .clmcor,
+    #    ATOMNUMBER    1     TiTi
+    # then each LM with
+    #    CLM(R) FOR L  4   M= 4
+    # a blank line, the value at each radial point and a blank line
+    #     0.269288026990E-03 0.276630028135E-03 0.284172086515E-03 0.291919609025E-03
+    # FORMAT(3X,4E19.12)
+    # The interstitial follows the last atom in .clmsum and .clmval,
+    #                 136 NUMBER OF PW
+    #        0    0    0 0.682482807912E-01 0.000000000000E+00  0.682E-01  0.000E+00
+    # FORMAT(3X,3I5,2E19.12,2E11.3)
+    # Matches the newline before each of these lines
+    'section_line' : re.compile(r'''\n(?:
+        (?:[ \t]*ATOMNUMBER\s*=?\s*(?P<atom>\d+))                                   |
+        (?:[ \t]*NUMBER\ OF\ LM\s*(?P<num_lm>\d+))                                  |
+        (?:[ \t]*CLM\(R\)\ FOR\ L\s*(?P<l>-?\d+)\s*M=\s*(?P<m>-?\d+)[^\n]*)         |
+        (?:[ \t]*(?P<num_plane_waves>\d+)\ NUMBER\ OF\ PW[^\n]*)
+    )''', re.VERBOSE),
+    'blank_lines' : re.compile(r'(?:[ \t]*\r?\n)*'),
+    'blank_line' : re.compile(r'\n[ \t]*\r?\n'),
+    # The bytes first read for a block of values, doubled until it ends
+    'block_read_length' : 2**16,
+    'radial_record' : FortranFormat('(3X,4E19.12)'),
+    'radial_line_start' : 3,
+    'radial_field_width' : 19,
+    'plane_wave_record' : FortranFormat('(3X,3I5,2E19.12)', names=['h', 'k', 'l', 're', 'im']),
+}
+
+class ClmReader(object):
+    '''
+    Reads the radial LM expansions of the charge density in a WIEN2k
+    .clmsum, .clmval or .clmcor file on demand
+
+    The file is memory mapped and scanned once for where each atom and LM
+    begins. Each radial array is decoded when first asked for and kept.
+    Compressed files are read as map_file does.
+
+    Parameters,
+
+    filename:           The .clm file to read
+    in_memory:          If True a compressed file is decompressed into
+                        memory rather than as it is read - default: False
+
+    Results in,
+
+    title:              The first line of the file
+    atoms:              The atom numbers, in order
+    lms:                A dict of atom number to a list of the (L, M) of
+                        each expansion
+    lm_offsets:         A dict of (atom, L, M) to the byte offset of the
+                        CLM(R) line
+    num_plane_waves:    The number of interstitial plane waves, None in
+                        .clmcor
+
+    EXAMPLE:
+
+    >>> clm_rdr = ClmReader(TiC_clmsum_filename)
+    >>> clm_rdr.atoms
+    [1, 2]
+    >>> clm_rdr.lms[1]
+    [(0, 0), (4, 0), (4, 4), (6, 0), (6, 4)]
+    >>> clm_rdr.radial(1, 0, 0).shape
+    (781,)
+    >>> clm_rdr.radial(1, 6, 4)[-1]
+    -0.0164368990083
+
+    The densities of two iterations can be compared without decoding the
+    rest of either file
+
+    >>> old_rdr = ClmReader(TiC_clmsum_old_filename)
+    >>> bool(abs(clm_rdr.radial(1, 0, 0) - old_rdr.radial(1, 0, 0)).max() < 1e-2)
+    True
+
+    >>> g_vectors, coefficients = clm_rdr.plane_waves()
+    >>> g_vectors[1].tolist(), coefficients[0]
+    ([-1, -1, -1], (0.0682482807912+0j))
+    '''
+    def __init__(self, filename, in_memory=False):
+        self.filename = filename
+        if os.path.getsize(filename) == 0:
+            raise UnexpectedFileFormat('The .clm file is empty (line: 1)')
+        self._map = map_file(filename, in_memory=in_memory)
+        self._radials = {}
+        self._index_sections()
+
+    def _index_sections(self):
+        # Scans the file once for the atoms, LMs and plane waves
+        self.title = self._map[:self._map.find(b'\n')].strip()
+        self.atoms = []
+        self.lms = {}
+        self.lm_offsets = {}
+        self.num_plane_waves = None
+        self._plane_wave_offset = None
+        atom = None
+        for chunk_offset, chunk in iter_chunks(self._map):
+            # Chunks after the first begin a line, so the newline before is
+            # put back
+            if chunk_offset > 0:
+                chunk = b'\n' + chunk
+                chunk_offset = chunk_offset - 1
+            for match in fmt['section_line'].finditer(chunk):
+                line_offset = chunk_offset + match.start() + 1
+                if match.group('atom') is not None:
+                    atom = int(match.group('atom'))
+                    self.atoms.append(atom)
+                    self.lms[atom] = []
+                elif match.group('l') is not None:
+                    if atom is None:
+                        raise UnexpectedFileFormat('CLM(R) before the first ATOMNUMBER (byte: %d)' % line_offset)
+                    lm = (int(match.group('l')), int(match.group('m')))
+                    self.lms[atom].append(lm)
+                    self.lm_offsets[(atom,) + lm] = line_offset
+                elif match.group('num_plane_waves') is not None:
+                    self.num_plane_waves = int(match.group('num_plane_waves'))
+                    self._plane_wave_offset = chunk_offset + match.end() + 1
+
+    def _block(self, offset):
+        # The bytes of the lines of values following the line at 'offset',
+        # up to the next blank line
+        start = self._map.find(b'\n', offset) + 1
+        length = fmt['block_read_length']
+        while True:
+            text = self._map[start:start+length]
+            values_start = fmt['blank_lines'].match(text).end()
+            end_match = fmt['blank_line'].search(text, values_start)
+            if (end_match is not None) or (len(text) < length):
+                break
+            length = 2 * length
+        end = len(text)
+        if end_match is not None:
+            end = end_match.start() + 1
+        return np.frombuffer(text[values_start:end], dtype=np.uint8)
+
+    def radial(self, atom, l, m):
+        '''Returns the value of the CLM(R) of an atom at each radial point'''
+        key = (atom, l, m)
+        if key not in self.lm_offsets:
+            raise KeyError('No CLM(R) for atom %d L %d M %d in %s' % (atom, l, m, self.filename))
+        if key not in self._radials:
+            buf = self._block(self.lm_offsets[key])
+            starts, lengths = line_bounds(buf)
+            if len(starts) == 0:
+                raise UnexpectedFileFormat('No values for atom %d L %d M %d (byte: %d)' % \
+                    (atom, l, m, self.lm_offsets[key]))
+            try:
+                records = fmt['radial_record'].decode(buf, starts, lengths)
+            except ValueError:
+                raise UnexpectedFileFormat('Could not parse the values for atom %d L %d M %d (byte: %d)' % \
+                    (atom, l, m, self.lm_offsets[key]))
+            num_vals_per_line = len(records.dtype.names)
+            values = records.view(np.float64).ravel()
+            # The last line may be short
+            last_line = buf[starts[-1]:starts[-1]+lengths[-1]].tobytes().rstrip()
+            num_values = num_vals_per_line * (len(records) - 1) + \
+                -(-(len(last_line) - fmt['radial_line_start']) // fmt['radial_field_width'])
+            self._radials[key] = values[:num_values]
+        return self._radials[key]
+
+    def plane_waves(self):
+        '''Returns the (num. plane waves, 3) reciprocal lattice vectors and
+        the complex coefficients of the interstitial density'''
+        if self._plane_wave_offset is None:
+            raise KeyError('No plane waves in %s' % self.filename)
+        buf = read_array(self._map, self._plane_wave_offset)
+        starts, lengths = line_bounds(buf)
+        starts = starts[:self.num_plane_waves]
+        lengths = lengths[:self.num_plane_waves]
+        if len(starts) < self.num_plane_waves:
+            raise UnexpectedFileFormat('Expected %d plane waves (byte: %d)' % \
+                (self.num_plane_waves, self._plane_wave_offset))
+        try:
+            records = fmt['plane_wave_record'].decode(buf, starts, lengths)
+        except ValueError:
+            raise UnexpectedFileFormat('Could not parse the plane waves (byte: %d)' % self._plane_wave_offset)
+        g_vectors = np.column_stack((records['h'], records['k'], records['l']))
+        return g_vectors, records['re'] + 1j * records['im']
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    globs = {
+        'TiC_clmsum_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.clmsum'),
+        'TiC_clmsum_old_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.clmsum_old'),
+        'ClmReader' : ClmReader,
+    }
+    doctest.testmod(globs=globs)
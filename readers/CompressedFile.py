@@ -0,0 +1,598 @@
+'''
+CompressedFile.py
+
+Functions for reading WIEN2k files which may be compressed with gzip, bzip2
+or xz, and for compressing files so that they can be decompressed in
+parallel
+'''
+
+__all__ = ['compression', 'open_file', 'read_file', 'map_file', 'read_array', 'gather', 'iter_chunks', \
+    'compress_file', 'BlockGzipFile', 'StreamedFile']
+
+import os
+import bz2
+import gzip
+import mmap
+import zlib
+import bisect
+import struct
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# The first bytes of each kind of compressed file
+magic_bytes = [
+    ('gzip', b'\x1f\x8b'),
+    ('bz2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'),
+]
+num_magic_bytes = max([len(x[1]) for x in magic_bytes])
+
+# Block gzip (BGZF, as written by bgzip) is a series of gzip members each
+# holding at most 64 KB, with the compressed size of the member in an extra
+# field of its header so the members can be found without decompressing
+# them. See section 4.1 of the SAM specification.
+#   ID1 ID2 CM FLG MTIME XFL OS XLEN, then the subfield SI1 SI2 SLEN BSIZE
+fmt = {
+    'block_gzip_header' : struct.Struct('<4BI2BH'),
+    'block_gzip_subfield' : struct.Struct('<2BH'),
+    'block_gzip_subfield_id' : b'BC',
+    'block_gzip_size' : struct.Struct('<H'),
+    'block_gzip_header_length' : 18,
+    # CRC32 and ISIZE
+    'gzip_footer' : struct.Struct('<2I'),
+    # The most data in a block, small enough that an incompressible block
+    # still fits once compressed
+    'block_gzip_data_length' : 0xff00,
+    # The empty block ending a BGZF file
+    'block_gzip_eof' : b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00' + \
+        b'\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00',
+    # The number of blocks compressed or decompressed at once
+    'num_blocks_per_batch' : 256,
+    # Fewer blocks than this are not worth a pool of threads
+    'num_blocks_per_pool' : 8,
+    # The number of decompressed blocks a BlockGzipFile keeps
+    'num_kept_blocks' : 64,
+    'gzip_flag_extra' : 4,
+    # The bytes a StreamedFile decompresses at a time
+    'chunk_length' : 2**20,
+}
+
+def compression(filename):
+    '''Returns 'gzip', 'bz2' or 'xz' if the file is compressed (from its
+    first bytes, not its name), otherwise None'''
+    file_handle = open(filename, 'rb')
+    start = file_handle.read(num_magic_bytes)
+    file_handle.close()
+    for name, magic in magic_bytes:
+        if start.startswith(magic):
+            return name
+    return None
+
+def open_file(filename):
+    '''
+    Opens a file for reading in binary mode, decompressing it as it is read
+    if it is compressed. Compressed files can only be read in order, use
+    map_file to read them at any offset.
+    '''
+    kind = compression(filename)
+    if kind is None:
+        return open(filename, 'rb')
+    if kind == 'gzip':
+        return gzip.GzipFile(filename, 'rb')
+    if kind == 'bz2':
+        return bz2.BZ2File(filename, 'rb')
+    if lzma is None:
+        raise IOError('Reading the xz compressed %s needs the lzma module (backports.lzma for Python 2)' % filename)
+    return lzma.LZMAFile(filename, 'rb')
+
+def read_file(filename, num_threads=None):
+    '''
+    Returns the contents of a file, decompressed if it is compressed. Block
+    gzip files (i.e. from bgzip or compress_file) are decompressed a batch
+    of blocks at a time in a pool of 'num_threads' threads, by default one
+    per CPU.
+    '''
+    if (compression(filename) == 'gzip') and _is_block_gzip(filename):
+        gz_file = BlockGzipFile(filename, num_threads=num_threads)
+        try:
+            return gz_file[:]
+        finally:
+            gz_file.close()
+    file_handle = open_file(filename)
+    data = file_handle.read()
+    file_handle.close()
+    return data
+
+def map_file(filename, in_memory=False):
+    '''
+    Returns the contents of a file for reading at any offset. Slicing it
+    gives the bytes (i.e. mapped[start:end]), and it has len() and find()
+    as a string does, so each kind of file is read alike,
+
+      uncompressed:     a read-only memory map, so only the parts used are
+                        read from disk
+      block gzip:       a BlockGzipFile, so only the blocks used are
+                        decompressed
+      gzip, bzip2, xz:  a StreamedFile, decompressed in one pass when read
+                        in order
+
+    Set 'in_memory' to decompress a compressed file into memory instead (the
+    bytes), which is quicker if it fits and is read out of order.
+    '''
+    kind = compression(filename)
+    if (kind is None) and (os.path.getsize(filename) > 0):
+        file_handle = open(filename, 'rb')
+        mapped = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        file_handle.close()
+        return mapped
+    if (kind is None) or in_memory:
+        return read_file(filename)
+    if (kind == 'gzip') and _is_block_gzip(filename):
+        return BlockGzipFile(filename)
+    return StreamedFile(filename)
+
+def read_array(mapped, offset, length=None):
+    '''Returns 'length' bytes (fewer at the end of the file, by default the
+    rest of it) from 'offset' in a file from map_file as a Numpy array, a
+    view of a memory map or bytes in memory'''
+    # Numpy is imported here so that the text readers do not need it
+    import numpy as np
+    end = None if length is None else offset + length
+    if isinstance(mapped, _MappedFile):
+        return np.frombuffer(mapped[offset:end], dtype=np.uint8)
+    return np.frombuffer(mapped, dtype=np.uint8)[offset:end]
+
+def gather(mapped, offsets, width):
+    '''Returns a (len(offsets), width) Numpy array of the 'width' bytes at
+    each of the offsets in a file from map_file. Raises an IndexError if
+    any run past the end of the file.'''
+    import numpy as np
+    offsets = np.asarray(offsets, dtype=np.int64).ravel()
+    if isinstance(mapped, _MappedFile):
+        return mapped.gather(offsets, width)
+    return np.frombuffer(mapped, dtype=np.uint8)[offsets.reshape((-1,1)) + np.arange(width)]
+
+def iter_chunks(mapped, chunk_length=fmt['chunk_length']):
+    '''Yields the (offset, bytes) of a file from map_file in chunks of
+    whole lines, so that a compressed file is read in one pass. A memory
+    map or bytes in memory is yielded whole.'''
+    if not isinstance(mapped, _MappedFile):
+        yield 0, mapped
+        return
+    offset = 0
+    while True:
+        chunk = mapped[offset:offset+chunk_length]
+        if len(chunk) < chunk_length:
+            if chunk:
+                yield offset, chunk
+            return
+        # A line longer than a chunk is split
+        end = chunk.rfind(b'\n') + 1 or len(chunk)
+        yield offset, chunk[:end]
+        offset = offset + end
+
+def compress_file(filename, compressed_filename=None, level=6, num_threads=None):
+    '''
+    Compresses a file as block gzip, which gzip can read as normal but which
+    read_file (and bgzip) can decompress in parallel and BlockGzipFile can
+    read at any offset. The blocks are compressed in a pool of 'num_threads'
+    threads, by default one per CPU. By default the compressed file is the
+    filename plus '.gz'. Returns the compressed filename.
+
+    EXAMPLE:
+
+    >>> gz_filename = compress_file(TiC_energy_filename, os.path.join(tmp_dir, 'TiC.energy'))
+    >>> compression(gz_filename)
+    'gzip'
+    >>> data = open(TiC_energy_filename, 'rb').read()
+    >>> read_file(gz_filename) == data
+    True
+    >>> gzip.GzipFile(gz_filename).read() == data
+    True
+
+    Every reader takes compressed files
+
+    >>> energy_rdr = EnergyReader(gz_filename)
+    >>> np.allclose(energy_rdr.energies, EnergyReader(TiC_energy_filename).energies, equal_nan=True)
+    True
+    >>> lazy_rdr = EnergyReader(gz_filename, lazy=True)
+    >>> (lazy_rdr.bands[6].data == energy_rdr.bands[6].data).all()
+    True
+    >>> bz2_filename = os.path.join(tmp_dir, 'TiC.vector.bz2')
+    >>> bz2.BZ2File(bz2_filename, 'wb').write(open(TiC_vector_filename, 'rb').read())
+    >>> compression(bz2_filename)
+    'bz2'
+    >>> vector_rdr = VectorReader(bz2_filename)
+    >>> (vector_rdr.coefficients(3, 2) == VectorReader(TiC_vector_filename).coefficients(3, 2)).all()
+    True
+    '''
+    if compressed_filename is None:
+        compressed_filename = filename + '.gz'
+    source = open(filename, 'rb')
+    destination = open(compressed_filename, 'wb')
+    block_length = fmt['block_gzip_data_length']
+    while True:
+        data = source.read(block_length * fmt['num_blocks_per_batch'])
+        if not data:
+            break
+        blocks = [(data[i:i+block_length], level) for i in range(0, len(data), block_length)]
+        destination.write(b''.join(_map_blocks(_compress_block, blocks, num_threads)))
+    destination.write(fmt['block_gzip_eof'])
+    source.close()
+    destination.close()
+    return compressed_filename
+
+
+class _MappedFile(object):
+    # What BlockGzipFile and StreamedFile share, slicing and searching the
+    # decompressed bytes as a memory map is. Each gives _read, __len__ and
+    # the span_length read at once by find and gather
+
+    def __getitem__(self, key):
+        if (not isinstance(key, slice)) or (key.step not in (None, 1)):
+            raise TypeError('Only slices with a step of 1 can be read from a compressed file')
+        start, stop = self._bounds(key.start, key.stop)
+        return self._read(start, stop)
+
+    def _bounds(self, start, stop):
+        # The start and stop (None for the end of the file) as offsets, the
+        # length is only found for offsets from the end
+        if ((start is not None) and (start < 0)) or ((stop is not None) and (stop < 0)):
+            start, stop, step = slice(start, stop).indices(len(self))
+        return (start or 0), stop
+
+    def find(self, sub, start=None, end=None):
+        '''Returns the lowest offset at which 'sub' is found between 'start'
+        and 'end', -1 if it is not, as str.find'''
+        start, end = self._bounds(start, end)
+        overlap = max(len(sub) - 1, 0)
+        offset = start
+        while (end is None) or (offset < end):
+            stop = offset + self.span_length
+            if end is not None:
+                stop = min(stop, end)
+            text_start = max(start, offset - overlap)
+            text = self._read(text_start, stop)
+            found = text.find(sub)
+            if found >= 0:
+                return text_start + found
+            if text_start + len(text) < stop:
+                break
+            offset = stop
+        return -1
+
+    def gather(self, offsets, width):
+        '''Returns a (len(offsets), width) Numpy array of the 'width' bytes
+        at each of the offsets, reading them in order'''
+        import numpy as np
+        offsets = np.asarray(offsets, dtype=np.int64).ravel()
+        rows = np.empty((len(offsets), width), dtype=np.uint8)
+        order = np.argsort(offsets, kind='mergesort')
+        sorted_offsets = offsets[order]
+        i = 0
+        while i < len(order):
+            # The offsets within a span are read at once
+            j = int(np.searchsorted(sorted_offsets, sorted_offsets[i] + self.span_length))
+            span_start = int(sorted_offsets[i])
+            span_end = int(sorted_offsets[j-1]) + width
+            buf = np.frombuffer(self._read(span_start, span_end), dtype=np.uint8)
+            if len(buf) < span_end - span_start:
+                raise IndexError('Reading past the end of %s (byte: %d)' % (self.filename, span_start + len(buf)))
+            rows[order[i:j]] = buf[(sorted_offsets[i:j] - span_start).reshape((-1,1)) + np.arange(width)]
+            i = j
+        return rows
+
+
+class BlockGzipFile(_MappedFile):
+    '''
+    Reads the decompressed bytes of a block gzip file (i.e. from bgzip or
+    compress_file) at any offset, decompressing only the blocks read
+
+    When the file is opened the header and footer of each block are read
+    to index where it begins in the compressed and decompressed file,
+    without decompressing any. The blocks last read are kept, and longer
+    reads are decompressed a batch of blocks at a time in a pool of
+    threads. The file is read by slicing as a memory map is, i.e.
+    gz_file[start:end], and searched with find().
+
+    Parameters,
+
+    filename:           The block gzip file to read
+    num_threads:        The number of threads decompressing long reads - default: one per CPU
+
+    Results in,
+
+    compressed_offsets: A list of the byte offset of each block in the file
+    offsets:            A list of the offset of each block once
+                        decompressed, then the decompressed length of the
+                        file
+
+    EXAMPLE:
+
+    >>> gz_filename = compress_file(TiC_qtl_filename, os.path.join(tmp_dir, 'TiC.qtl.gz'))
+    >>> gz_file = BlockGzipFile(gz_filename)
+    >>> data = open(TiC_qtl_filename, 'rb').read()
+    >>> len(gz_file.compressed_offsets), len(gz_file) == len(data)
+    (4, True)
+
+    Reading across the end of a block only decompresses the two blocks
+
+    >>> gz_file[65000:66000] == data[65000:66000]
+    True
+    >>> gz_file.find(b' BAND:  10') == data.find(b' BAND:  10')
+    True
+
+    Partial charges from the compressed file
+
+    >>> qtl_rdr = QtlReader(gz_filename, bands=[10], atoms=[2])
+    >>> (qtl_rdr.data == QtlReader(TiC_qtl_filename, bands=[10], atoms=[2]).data).all()
+    True
+    '''
+    def __init__(self, filename, num_threads=None):
+        self.filename = filename
+        self.num_threads = num_threads
+        self.span_length = fmt['block_gzip_data_length']
+        self._file_handle = open(filename, 'rb')
+        self.compressed_offsets, self._compressed_lengths, self.offsets = _block_gzip_index(self._file_handle)
+        self._blocks = collections.OrderedDict()
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def close(self):
+        '''Closes the file'''
+        self._file_handle.close()
+        self._blocks.clear()
+
+    def _read(self, start, stop):
+        # The decompressed bytes from start to stop
+        if (stop is None) or (stop > len(self)):
+            stop = len(self)
+        if start >= stop:
+            return b''
+        first = bisect.bisect_right(self.offsets, start) - 1
+        last = bisect.bisect_right(self.offsets, stop - 1) - 1
+        pieces = []
+        for batch_start in range(first, last + 1, fmt['num_blocks_per_batch']):
+            pieces.extend(self._read_blocks(range(batch_start, min(batch_start + fmt['num_blocks_per_batch'], last + 1))))
+        pieces[-1] = pieces[-1][:stop-self.offsets[last]]
+        pieces[0] = pieces[0][start-self.offsets[first]:]
+        return b''.join(pieces)
+
+    def _read_blocks(self, block_nums):
+        # Decompresses the blocks not kept, then keeps the ones last read
+        missing = [n for n in block_nums if n not in self._blocks]
+        compressed = []
+        for n in missing:
+            self._file_handle.seek(self.compressed_offsets[n])
+            compressed.append(self._file_handle.read(self._compressed_lengths[n]))
+        for n, data in zip(missing, _map_blocks(_decompress_block, compressed, self.num_threads)):
+            self._blocks[n] = data
+        blocks = [self._blocks[n] for n in block_nums]
+        for n in block_nums:
+            self._blocks[n] = self._blocks.pop(n)
+        while len(self._blocks) > fmt['num_kept_blocks']:
+            self._blocks.popitem(last=False)
+        return blocks
+
+
+class StreamedFile(_MappedFile):
+    '''
+    Reads the decompressed bytes of a gzip, bzip2 or xz file as BlockGzipFile
+    does, i.e. stream[start:end] and find()
+
+    These can only be decompressed from the start, so the file is
+    decompressed in one pass as it is read in order, keeping only the last
+    two chunks. Reading before those starts again from the beginning of the
+    file.
+
+    EXAMPLE:
+
+    >>> gz_stream_filename = os.path.join(tmp_dir, 'TiC.energy_band.gz')
+    >>> gz_file = gzip.GzipFile(gz_stream_filename, 'wb')
+    >>> shutil.copyfileobj(open(TiC_energy_band_filename, 'rb'), gz_file)
+    >>> gz_file.close()
+    >>> stream = map_file(gz_stream_filename)
+    >>> data = open(TiC_energy_band_filename, 'rb').read()
+    >>> isinstance(stream, StreamedFile), stream[150000:150100] == data[150000:150100]
+    (True, True)
+
+    Only the k point lines and the lines of the bands asked for are decoded
+
+    >>> lazy_rdr = EnergyReader(gz_stream_filename, lazy=True)
+    >>> (lazy_rdr.bands[3].data == EnergyReader(TiC_energy_band_filename).bands[3].data).all()
+    True
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.span_length = fmt['chunk_length']
+        self._length = None
+        self._file_handle = None
+        self._rewind()
+
+    def __len__(self):
+        if self._length is None:
+            while self._advance():
+                pass
+        return self._length
+
+    def close(self):
+        '''Closes the file'''
+        self._file_handle.close()
+        self._data = b''
+
+    def _rewind(self):
+        # Starts decompressing from the beginning of the file again
+        if self._file_handle is not None:
+            self._file_handle.close()
+        self._file_handle = open_file(self.filename)
+        self._start = 0
+        self._data = b''
+
+    def _advance(self):
+        # Decompresses the next chunk, keeping the one before it. Returns
+        # False at the end of the file
+        chunk = self._file_handle.read(self.span_length)
+        if not chunk:
+            self._length = self._start + len(self._data)
+            return False
+        previous = self._data[-self.span_length:]
+        self._start = self._start + len(self._data) - len(previous)
+        self._data = previous + chunk
+        return True
+
+    def _read(self, start, stop):
+        # The decompressed bytes from start to stop
+        if start < self._start:
+            self._rewind()
+        pieces = []
+        while (stop is None) or (start < stop):
+            data_end = self._start + len(self._data)
+            if start < data_end:
+                piece_end = data_end if stop is None else min(stop, data_end)
+                pieces.append(self._data[start-self._start:piece_end-self._start])
+                start = piece_end
+            elif not self._advance():
+                break
+        return b''.join(pieces)
+
+
+def _map_blocks(function, blocks, num_threads):
+    # zlib releases the GIL so blocks can be done in threads
+    if num_threads is None:
+        num_threads = multiprocessing.cpu_count()
+    if (len(blocks) < fmt['num_blocks_per_pool']) or (num_threads == 1):
+        return [function(x) for x in blocks]
+    pool = ThreadPool(processes=num_threads)
+    try:
+        return pool.map(function, blocks)
+    finally:
+        pool.close()
+        pool.join()
+
+def _block_gzip_size(header, extra):
+    # The size of a block gzip member from its header and extra field, None
+    # if it is not one
+    id1, id2, method, flags, mtime, extra_flags, os_id, extra_length = fmt['block_gzip_header'].unpack(header)
+    if (id1, id2, method) != (0x1f, 0x8b, 8) or not (flags & fmt['gzip_flag_extra']) or \
+            (len(extra) != extra_length):
+        return None
+    # Find the BC subfield amongst the extra fields
+    block_size = None
+    field_offset = 0
+    while field_offset + fmt['block_gzip_subfield'].size <= len(extra):
+        si1, si2, field_length = fmt['block_gzip_subfield'].unpack_from(extra, field_offset)
+        field_id = extra[field_offset:field_offset+2]
+        field_offset = field_offset + fmt['block_gzip_subfield'].size
+        if (field_id == fmt['block_gzip_subfield_id']) and (field_length == fmt['block_gzip_size'].size):
+            block_size = fmt['block_gzip_size'].unpack_from(extra, field_offset)[0] + 1
+        field_offset = field_offset + field_length
+    return block_size
+
+def _read_block_gzip_size(file_handle):
+    # The size of the block gzip member at the position of the file, None if
+    # it is not one, 0 at the end of the file
+    header = file_handle.read(fmt['block_gzip_header'].size)
+    if len(header) == 0:
+        return 0
+    if len(header) < fmt['block_gzip_header'].size:
+        return None
+    return _block_gzip_size(header, file_handle.read(fmt['block_gzip_header'].unpack(header)[-1]))
+
+def _is_block_gzip(filename):
+    # True if the file begins with a block gzip member
+    file_handle = open(filename, 'rb')
+    try:
+        return bool(_read_block_gzip_size(file_handle))
+    finally:
+        file_handle.close()
+
+def _block_gzip_index(file_handle):
+    # The compressed offset and length, and the decompressed offset, of each
+    # block from the headers and footers alone. Empty blocks (i.e. the one
+    # ending the file) are left out
+    compressed_offsets = []
+    compressed_lengths = []
+    offsets = [0]
+    offset = 0
+    while True:
+        file_handle.seek(offset)
+        block_size = _read_block_gzip_size(file_handle)
+        if block_size == 0:
+            break
+        if block_size is None:
+            raise IOError('Expected a block gzip header in %s (byte: %d)' % (file_handle.name, offset))
+        file_handle.seek(offset + block_size - fmt['gzip_footer'].size)
+        footer = file_handle.read(fmt['gzip_footer'].size)
+        if len(footer) < fmt['gzip_footer'].size:
+            raise IOError('The last block of %s is cut short (byte: %d)' % (file_handle.name, offset))
+        length = fmt['gzip_footer'].unpack(footer)[1]
+        if length > 0:
+            compressed_offsets.append(offset)
+            compressed_lengths.append(block_size)
+            offsets.append(offsets[-1] + length)
+        offset = offset + block_size
+    return compressed_offsets, compressed_lengths, offsets
+
+def _decompress_block(block):
+    # Decompresses one member of a block gzip file
+    extra_length = fmt['block_gzip_size'].unpack_from(block, 10)[0]
+    footer_start = len(block) - fmt['gzip_footer'].size
+    data = zlib.decompress(block[12+extra_length:footer_start], -zlib.MAX_WBITS)
+    crc, length = fmt['gzip_footer'].unpack_from(block, footer_start)
+    if (len(data) != length) or ((zlib.crc32(data) & 0xffffffff) != crc):
+        raise IOError('A block of the gzip file is corrupt')
+    return data
+
+def _compress_block(args):
+    # Compresses one block of data into a block gzip member
+    data, level = args
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(data) + compressor.flush()
+    block_size = fmt['block_gzip_header_length'] + len(compressed) + fmt['gzip_footer'].size
+    header = fmt['block_gzip_header'].pack(0x1f, 0x8b, 8, fmt['gzip_flag_extra'], 0, 0, 0xff, 6) + \
+        fmt['block_gzip_subfield'].pack(ord('B'), ord('C'), 2) + fmt['block_gzip_size'].pack(block_size - 1)
+    return header + compressed + fmt['gzip_footer'].pack(zlib.crc32(data) & 0xffffffff, len(data))
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    import shutil
+    import tempfile
+    import numpy as np
+    from wien2k.readers.EnergyReader import EnergyReader
+    from wien2k.readers.VectorReader import VectorReader
+    from wien2k.readers.QtlReader import QtlReader
+    tmp_dir = tempfile.mkdtemp()
+    globs = {
+        'TiC_energy_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.energy'),
+        'TiC_energy_band_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.energy_band'),
+        'TiC_vector_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.vector'),
+        'TiC_qtl_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.qtl'),
+        'tmp_dir' : tmp_dir,
+        'compress_file' : compress_file,
+        'compression' : compression,
+        'read_file' : read_file,
+        'map_file' : map_file,
+        'BlockGzipFile' : BlockGzipFile,
+        'StreamedFile' : StreamedFile,
+        'EnergyReader' : EnergyReader,
+        'VectorReader' : VectorReader,
+        'QtlReader' : QtlReader,
+        'bz2' : bz2,
+        'gzip' : gzip,
+        'shutil' : shutil,
+        'os' : os,
+        'np' : np,
+    }
+    doctest.testmod(globs=globs)
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,115 @@
+'''
+DosBatchReader.py
+
+A class for reading all the .dos1, .dos2 ... files of a case into one array
+'''
+
+__all__ = ['DosBatchReader']
+
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from wien2k.readers.DosReader import DosReader, find_dos_files
+
+# The energies are written as F10.5 so are the same on this grid
+ENERGY_DECIMALS = 5
+
+class DosBatchReader(object):
+    '''
+    Reads the .dos1, .dos2 ... files of a case concurrently in a pool of
+    threads and lines up their columns on one energy grid
+
+    Parameters,
+
+    filename:       The case i.e. 'TiC' or 'path/to/TiC'
+    ev:             Read the .dosNev files rather than the .dosN files -
+                    default: False
+    spin:           'up' or 'dn' to read the .dosNup (or .dosNevup) files -
+                    default: None
+    num_threads:    The number of threads used to read the files, by
+                    default the number of CPUs - default: None
+
+    Results in,
+
+    filenames:      The files read, in order
+    readers:        The DosReader of each file
+    fermi_energy:   The Fermi energy of the first file
+    energies:       The energies of all the files
+    data:           The (num. energies, total NDOS) array of the densities of
+                    states of every file side by side, NaN where a file has
+                    no value at an energy
+    labels:         A list of the label of each column
+    column_files:   The index into 'filenames' of each column
+
+    EXAMPLE:
+
+    >>> dos_rdr = DosBatchReader(TiC_case_filename)
+    >>> [os.path.basename(x) for x in dos_rdr.filenames]
+    ['TiC.dos1', 'TiC.dos2']
+    >>> dos_rdr.data.shape
+    (773, 6)
+    >>> dos_rdr.labels
+    ['l+1', 'l-1', 'tot', 'l+1', 'l-1', 'tot']
+    >>> dos_rdr.column_files.tolist()
+    [0, 0, 0, 1, 1, 1]
+    >>> (dos_rdr.data[:,3:] == dos_rdr.readers[1].data).all()
+    True
+    '''
+    def __init__(self, filename, ev=False, spin=None, num_threads=None):
+        self.filename = filename
+        self.filenames = find_dos_files(filename, ev=ev, spin=spin)
+        if len(self.filenames) == 0:
+            raise IOError('No .dos files found for %s' % filename)
+        if (len(self.filenames) == 1) or (num_threads == 1):
+            self.readers = [DosReader(x) for x in self.filenames]
+        else:
+            pool = ThreadPool(processes=num_threads)
+            try:
+                self.readers = pool.map(DosReader, self.filenames)
+            finally:
+                pool.close()
+                pool.join()
+        self._align()
+
+    def _align(self):
+        # Places the columns of every file on the union of their energies
+        self.fermi_energy = self.readers[0].fermi_energy
+        self.labels = []
+        self.column_files = []
+        for i, dos_rdr in enumerate(self.readers):
+            self.labels.extend(dos_rdr.labels)
+            self.column_files.extend([i] * dos_rdr.num_dos)
+        self.column_files = np.array(self.column_files, dtype=int)
+        keys = [np.round(x.energies * 10**ENERGY_DECIMALS).astype(np.int64) for x in self.readers]
+        if np.all([np.array_equal(x, keys[0]) for x in keys]):
+            self.energies = self.readers[0].energies
+            self.data = np.hstack([x.data for x in self.readers])
+            return
+        all_keys = np.unique(np.concatenate(keys))
+        self.energies = all_keys / float(10**ENERGY_DECIMALS)
+        self.data = np.empty((len(all_keys), len(self.labels)))
+        self.data.fill(np.nan)
+        for i, dos_rdr in enumerate(self.readers):
+            rows = np.searchsorted(all_keys, keys[i])
+            self.data[rows[:,np.newaxis], np.flatnonzero(self.column_files == i)] = dos_rdr.data
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    import shutil
+    import tempfile
+    # Make a case with two .dos files
+    tmp_dir = tempfile.mkdtemp()
+    TiC_case_filename = os.path.join(tmp_dir, 'TiC')
+    TiC_dos_filename = os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.dos1')
+    shutil.copy(TiC_dos_filename, TiC_case_filename + '.dos1')
+    shutil.copy(TiC_dos_filename, TiC_case_filename + '.dos2')
+    shutil.copy(TiC_dos_filename + 'ev', TiC_case_filename + '.dos1ev')
+    globs = {
+        'TiC_case_filename' : TiC_case_filename,
+        'DosBatchReader' : DosBatchReader,
+        'os' : os,
+    }
+    doctest.testmod(globs=globs)
+    shutil.rmtree(tmp_dir)
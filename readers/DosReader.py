@@ -0,0 +1,184 @@
+'''
+DosReader.py
+
+A class for reading the densities of states in WIEN2k .dos1, .dos1ev ...
+files written by tetra
+'''
+
+__all__ = ['DosReader']
+
+import os
+import re
+import numpy as np
+from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.FortranFormat import FortranFormat, line_bounds
+from wien2k.readers.CompressedFile import read_file
+
+fmt = {
+    # The title i.e.
+    # # Autocreate Title: At
+    'title_line_start' : '#',
+    # then the Fermi energy, the number of DOS columns and energies i.e.
+    # #EF=   0.73293     NDOS= 3     NENRG=  773    Gaussian bradening: 0.00000
+    'header_line' : re.compile(r'''
+        \#EF=\s*(\S+)                           # Fermi energy
+        \s+NDOS=\s*(\d+)                        # Number of DOS columns
+        \s+NENRG=\s*(\d+)                       # Number of energies
+        (?:\s+Gaussian\ bradening:\s*(\S+))?    # Broadening (sic)
+    ''', re.VERBOSE),
+    # then the column labels i.e.
+    # # ENERGY         l+1           l-1           tot
+    'labels_line_start' : '#',
+    'energy_label' : 'ENERGY',
+    # and a line for each energy,
+    #    0.58593    7.09571695    0.06155412   21.88843155
+    # Guess a format statement of
+    # FORMAT(F10.5,NDOS F14.8)
+    'dos_line' : '(F10.5,%dF14.8)',
+    'num_header_lines' : 3,
+    # i.e. TiC.dos1, TiC.dos2ev, TiC.dos1evup
+    'filename' : re.compile(r'\.dos(\d+)(ev)?(up|dn)?$'),
+    # which may be compressed i.e. TiC.dos1ev.gz
+    'compressed_suffix' : re.compile(r'\.(?:gz|bz2|xz)$'),
+}
+
+class DosReader(object):
+    '''
+    Reads the densities of states from a WIEN2k .dosN(ev)(up|dn) file into
+    one array
+
+    Results in,
+
+    title:          The title of the case
+    fermi_energy:   The Fermi energy in the units of the file
+    num_dos:        NDOS, the number of DOS columns
+    num_energies:   NENRG, the number of energies
+    broadening:     The Gaussian broadening, None if not given
+    units:          'eV' for .dosNev files, otherwise 'Ry'
+    labels:         A list of the label of each DOS column i.e. ['l+1', 'tot']
+    energies:       The (NENRG,) array of energies
+    data:           The (NENRG, NDOS) array of the densities of states
+
+    EXAMPLE:
+
+    >>> dos_rdr = DosReader(TiC_dos_filename)
+    >>> dos_rdr.data.shape
+    (773, 3)
+    >>> dos_rdr.labels
+    ['l+1', 'l-1', 'tot']
+    >>> dos_rdr.fermi_energy
+    0.73293
+    >>> dos_rdr.energies[0], dos_rdr.data[0].tolist()
+    (0.58593, [7.09571695, 0.06155412, 21.88843155])
+
+    >>> DosReader(TiC_dosev_filename).units
+    'eV'
+
+    A compressed file is named for the file it holds plus .gz, .bz2 or .xz
+
+    >>> gz_filename = compress_file(TiC_dosev_filename, os.path.join(tmp_dir, 'TiC.dos1ev.gz'))
+    >>> gz_rdr = DosReader(gz_filename)
+    >>> gz_rdr.units, (gz_rdr.data == DosReader(TiC_dosev_filename).data).all()
+    ('eV', True)
+    >>> [os.path.basename(x) for x in find_dos_files(os.path.join(tmp_dir, 'TiC'), ev=True)]
+    ['TiC.dos1ev.gz']
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.units = 'Ry'
+        filename_match = fmt['filename'].search(fmt['compressed_suffix'].sub('', filename))
+        if (filename_match is not None) and (filename_match.group(2) is not None):
+            self.units = 'eV'
+        self._load_values()
+
+    def _load_values(self):
+        buf = np.frombuffer(read_file(self.filename), dtype=np.uint8)
+        starts, lengths = line_bounds(buf)
+        num_header_lines = fmt['num_header_lines']
+        if len(starts) < num_header_lines:
+            raise UnexpectedFileFormat('Expected %d header lines (line: %d)' % \
+                (num_header_lines, len(starts) + 1))
+        header_lines = [buf[x:x+y].tobytes().rstrip('\r') for x, y in \
+            zip(starts[:num_header_lines], lengths[:num_header_lines])]
+        self._read_header(header_lines)
+        # Decode all the energies in one go
+        num_lines = len(starts) - num_header_lines
+        if num_lines < self.num_energies:
+            raise UnexpectedFileFormat('Expected %d energies, found %d (line: %d)' % \
+                (self.num_energies, num_lines, len(starts) + 1))
+        starts = starts[num_header_lines:num_header_lines+self.num_energies]
+        lengths = lengths[num_header_lines:num_header_lines+self.num_energies]
+        names = ['energy'] + ['dos%d' % i for i in range(self.num_dos)]
+        dos_fmt = FortranFormat(fmt['dos_line'] % self.num_dos, names=names)
+        try:
+            records = dos_fmt.decode(buf, starts, lengths)
+        except ValueError:
+            raise UnexpectedFileFormat('Could not parse the densities of states (line: %d)' % \
+                (num_header_lines + 1))
+        self.energies = records['energy']
+        self.data = np.empty((self.num_energies, self.num_dos))
+        for i, name in enumerate(names[1:]):
+            self.data[:,i] = records[name]
+
+    def _read_header(self, lines):
+        # Reads the title, metadata and label lines
+        if not lines[0].startswith(fmt['title_line_start']):
+            raise UnexpectedFileFormat('Expected a title (line: 1)')
+        self.title = lines[0][len(fmt['title_line_start']):].strip()
+        header_match = fmt['header_line'].search(lines[1])
+        if header_match is None:
+            raise UnexpectedFileFormat('Expected the #EF= NDOS= NENRG= line (line: 2)')
+        self.fermi_energy = float(header_match.group(1))
+        self.num_dos = int(header_match.group(2))
+        self.num_energies = int(header_match.group(3))
+        self.broadening = None
+        if header_match.group(4) is not None:
+            self.broadening = float(header_match.group(4))
+        if not lines[2].startswith(fmt['labels_line_start']):
+            raise UnexpectedFileFormat('Expected the column labels (line: 3)')
+        labels = lines[2][len(fmt['labels_line_start']):].split()
+        if (len(labels) > 0) and (labels[0] == fmt['energy_label']):
+            labels = labels[1:]
+        if len(labels) != self.num_dos:
+            raise UnexpectedFileFormat('Expected %d column labels (line: 3)' % self.num_dos)
+        self.labels = labels
+
+
+def find_dos_files(filename, ev=False, spin=None):
+    '''Returns the case.dos1, case.dos2 ... files that exist for the case
+    'filename' (i.e. 'TiC' or 'path/to/TiC'), in numerical order
+
+    Set 'ev' to find the .dosNev files and 'spin' to 'up' or 'dn' to find the
+    .dosNup (or .dosNevup) files. Compressed files (i.e. case.dos1.gz) are
+    found too, an uncompressed file is taken over a compressed one.'''
+    directory, basename = os.path.split(filename)
+    dos_files = {}
+    for name in sorted(os.listdir(directory or os.curdir)):
+        if not name.startswith(basename + '.'):
+            continue
+        filename_match = fmt['filename'].match(fmt['compressed_suffix'].sub('', name[len(basename):]))
+        if (filename_match is None) or ((filename_match.group(2) is not None) != ev) or \
+                (filename_match.group(3) != spin):
+            continue
+        dos_files.setdefault(int(filename_match.group(1)), os.path.join(directory, name))
+    return [dos_files[x] for x in sorted(dos_files)]
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    import shutil
+    import tempfile
+    from wien2k.readers.CompressedFile import compress_file
+    tmp_dir = tempfile.mkdtemp()
+    globs = {
+        'TiC_dos_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.dos1'),
+        'TiC_dosev_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.dos1ev'),
+        'tmp_dir' : tmp_dir,
+        'compress_file' : compress_file,
+        'find_dos_files' : find_dos_files,
+        'DosReader' : DosReader,
+        'os' : os,
+    }
+    doctest.testmod(globs=globs)
+    shutil.rmtree(tmp_dir)
@@ -6,105 +6,404 @@ A class for reading Wien2k .energy files
 
 __all__ = ['EnergyReader']
 
-import re
 import numpy as np
 from wien2k.Band import Band
 from wien2k.Kpoint import Kpoint
 from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.ArrayCache import ArrayCache
+from wien2k.readers.FortranFormat import FortranFormat, line_bounds
+from wien2k.readers.CompressedFile import open_file, read_file, map_file, gather
 
 fmt = {
     # Begins with expansions energy (E_J) for atom 'I'
     # WRITE(11,'(100(f9.5))') (E(J,I),J=1,LMAX)
     # Also has expansion energy for local orbitals (ELO_J) fro atom 'I'
     # WRITE(11,'(100(f9.5))') ((ELO(J,k,I),J=0,LOMAX),k=1,nloat)
-    
+
     # k Point line contains details on k_point and is of format,
     # 0.000000000000E+00 0.000000000000E+00 0.000000000000E+00         1   455    50  1.0
     # Actual format is
     # WRITE(11,'(3e19.12,a10,2i6,f5.1,a3)') SX, SY, SZ, KNAME, NV, NE, WEIGHT, IPGR
     # From line 46 of tapewf.f in SRC_lapw1
+    # n.b. line lengths include the newline, 85 if IPGR is not written
     'k_point_line_lengths' : (85, 88),
-    'num_k_point_vals' : 7,
-    'k_point_line' : re.compile('''
-        ([-+EDed\d\.\s]{19})   # i
-        ([-+EDed\d\.\s]{19})   # j
-        ([-+EDed\d\.\s]{19})   # k
-        (.{10})                # k point name (i.e. 'GAMMA')
-        ([-+\d\.\s]{6})        # Number plane waves (tot num considered recip. latt. vecs.) plus number of local orbitals
-        ([-+\d\.\s]{6})        # Number of bands
-        ([-+EDed\d\.\s]{5})    # Weight
-        .{3}
-        \s*
-    ''', re.VERBOSE),
+    'k_point_line' : FortranFormat('(3e19.12,a10,2i6,f5.1,a3)', names=[
+        'i', 'j', 'k',
+        'k_point_name',     # i.e. 'GAMMA' for .klist_band, otherwise an integer id
+        'num_plane_waves',  # Number plane waves (tot num considered recip. latt. vecs.) plus number of local orbitals
+        'num_bands',
+        'weight',
+        'ipgr',
+    ]),
     # Band line contains details on band energy at a particular k point and is of format,
     #           3  -3.30918392086173
     # Actual format is
     # WRITE(11,*) I, E(I)
     # From line 50 of tapewf.f in SRC_lapw1
+    # n.b. list directed output so the width is compiler dependent, all
+    # lines between two k point lines are taken to be band lines
     'band_line_length' : 37,
     'num_band_vals' : 2,
-    'band_line' : re.compile('''
-        \s*
-        (-?[-+E\d\.]+)
-        \s+(-?[-+E\d\.]+)
-        \s*
-    ''', re.VERBOSE)
 }
 
+# The parsed values kept by the on-disk cache, and the version of them
+cached_attributes = ('k_points', 'weights', 'num_plane_waves', 'num_bands', 'energies')
+cache_version = 1
+
 class EnergyReader(object):
     '''An object which reads WIEN2k .energy files and
     places the energies into bands
 
+    The whole file is read at once and decoded column-wise with Numpy
+    rather than line by line.
+
     Parameters,
 
     filename:               The filename of the .energy(so) file to parse
     spin_orb_dirn:          If is a spin orbit calculation, specify either 'up' or 'down' - default: None
-    
+    lazy:                   If True only the k point lines are read when
+                            the object is created, each band is read from
+                            the file when first accessed - default: False
+    cache:                  If True the parsed arrays are kept in .npy files
+                            and memory mapped when the file is next read,
+                            the cache is discarded if the file changes - default: False
+    cache_dir:              The directory in which to keep the cache, by
+                            default it is kept next to the file - default: None
+    in_memory:              If True and lazy, a compressed file is
+                            decompressed into memory rather than as it is
+                            read (see map_file) - default: False
+
     Results in,
-    
+
     bands:                  A list of Band objects for this energy file
+    k_points:               An Nx4 array of id, i, j, k values, one row per k point
+    weights:                The weight of each k point
+    num_plane_waves:        The number of plane waves (plus local orbitals) at each k point
+    num_bands:              The number of bands (NE) written at each k point
+    energies:               An (n_kpoints, n_bands) array of energies,
+                            bands not present at a k point are NaN (None
+                            if lazy)
+
+    EXAMPLE:
+
+    >>> energy_rdr = EnergyReader(TiC_energy_filename)
+    >>> energy_rdr.energies.shape
+    (47, 17)
+    >>> energy_rdr.bands[6].data.shape
+    (47, 5)
+    >>> energy_rdr.bands[16].data.shape
+    (11, 5)
+
+    Reading only the bands that are needed
+
+    >>> lazy_rdr = EnergyReader(TiC_energy_filename, lazy=True)
+    >>> len(lazy_rdr.bands)
+    17
+    >>> (lazy_rdr.bands[6].data == energy_rdr.bands[6].data).all()
+    True
+    >>> [band.id for band in lazy_rdr.bands[5:8]]
+    [6, 7, 8]
     '''
-    def __init__(self, filename, spin_orb_dirn=None):
+    def __init__(self, filename, spin_orb_dirn=None, lazy=False, cache=False, cache_dir=None, in_memory=False):
         self.filename = filename
         self.spin_orb_dirn = spin_orb_dirn
-        self.bands = []
-        tmp_bands = []
-        file_handle = open(filename, 'r')
-        line_num = 0
-        for line in file_handle:
-            line_num = line_num + 1
-            if len(line) in fmt['k_point_line_lengths']:
-                try:
-                    k_point_vals = fmt['k_point_line'].match(line).groups()
-                    if len(k_point_vals) != fmt['num_k_point_vals']:
-                        raise UnexpectedFileFormat('The specified number of values was not parsed from the k point line (line: %d)' % line_num)
-                    i, j, k, k_point_name, unknown, num_bands, k_weight = [x.strip() for x in k_point_vals]
-                    i, j, k, k_weight = [float(x) for x in (i, j, k, k_weight)] 
-                    num_bands = int(num_bands)
-                except ValueError:
-                    raise UnexpectedFileFormat('A non-float was parsed from a line identified as a k-point line (line: %d)' % line_num)
-                try:
-                    # For .klist_band files, k_point_name is a name, for
-                    # others it is a unique integer
-                    k_point_id = int(k_point_name)
-                except ValueError:
-                    k_point_id = 0
-            elif len(line) == fmt['band_line_length']:
-                try:
-                    band_vals = fmt['band_line'].match(line).groups()
-                    if len(band_vals) != fmt['num_band_vals']:
-                        raise UnexpectedFileFormat('A line describing a band contains less values than expected (line: %d)' % line_num)
-                    band_id, energy = band_vals
-                    energy = float(energy)
-                    band_id = int(band_id)
-                except:
-                    raise UnexpectedFileFormat('A non-number was parsed from a line identified as a band energy line (line: %d)' % line_num)
-                while band_id > len(tmp_bands):
-                    tmp_bands.append([])
-                tmp_bands[band_id - 1].append([k_point_id, i, j, k, energy])
+        self.energies = None
+        self._map = None
+        self._in_memory = in_memory
+        if cache == True:
+            array_cache = ArrayCache(filename, cache_dir=cache_dir, version=cache_version, names=cached_attributes)
+            arrays = array_cache.load()
+            if arrays is None:
+                self._read_file()
+                array_cache.save(dict([(name, getattr(self, name)) for name in cached_attributes]))
+            else:
+                for name in cached_attributes:
+                    setattr(self, name, arrays[name])
+        elif lazy == True:
+            self._index_k_points()
+        else:
+            self._read_file()
+        if lazy == True:
+            self.bands = _LazyBandList(self)
+        else:
+            # Now cast into Band objects
+            self.bands = []
+            for i in range(self.energies.shape[1]):
+                self.bands.append(Band(id=i+1, data=self._band_data(i)))
+
+    def _read_file(self):
+        self.k_points, self.weights, self.num_plane_waves, self.num_bands, \
+            self.energies = _read_energy_file(self.filename)
+
+    def iter_kpoints(self, chunk_size=1000, block_size=2**22):
+        '''
+        Reads the file from disk a chunk of k points at a time so that
+        files larger than memory can be processed. Use lazy=True when
+        creating the reader so that the bands are not read as well.
+
+        Parameters,
+
+        chunk_size:     The number of k points in each chunk (default: 1000)
+        block_size:     The number of bytes read from the file at a time
+                        (default: 4MB)
+
+        Yields a tuple of,
+
+        k_points:       An Nx4 array of id, i, j, k values
+        weights:        The weight of each k point
+        energies:       An (N, n_bands) array of energies, bands not
+                        present at a k point are NaN
+
+        EXAMPLE:
+
+        Finding the lowest energy of each band without holding the whole file
+
+        >>> lazy_rdr = EnergyReader(TiC_energy_filename, lazy=True)
+        >>> band_mins = np.inf
+        >>> for k_points, weights, energies in lazy_rdr.iter_kpoints(chunk_size=10):
+        ...     band_mins = np.fmin(band_mins, np.fmin.reduce(energies, axis=0))
+        >>> band_mins.shape
+        (17,)
+        >>> band_mins[6] == lazy_rdr.bands[6].energies.min()
+        True
+        '''
+        num_bands = int(self.num_bands.max()) if len(self.num_bands) > 0 else 0
+        return _iter_energy_blocks(self.filename, num_bands, chunk_size, block_size)
+
+    def _index_k_points(self):
+        # Walks the file recording only the k point lines and where the block
+        # of band lines following each begins. Band lines are normally all
+        # the same width so the next k point line can be jumped to directly
+        k_point_lines = []
+        band_line_offsets = []
+        band_line_widths = []
+        band_block_lengths = []
+        line_length = fmt['k_point_line'].width
+        mapped = self._mapped()
+        offset = 0
+        line = _read_line(mapped, offset)
+        # Skip the expansion energies at the top of the file
+        while line and (len(line) not in fmt['k_point_line_lengths']):
+            offset = offset + len(line)
+            line = _read_line(mapped, offset)
+        while line.strip():
+            if len(line) not in fmt['k_point_line_lengths']:
+                raise UnexpectedFileFormat('Expected a k point line (byte: %d)' % offset)
+            k_point_line = line.rstrip(b'\r\n')[:line_length].ljust(line_length)
+            k_point_lines.append(k_point_line)
+            try:
+                num_bands = int(k_point_line[fmt['k_point_line'].field_slice('num_bands')])
+            except ValueError:
+                raise UnexpectedFileFormat('A non-number was parsed from a line identified as a k-point line (byte: %d)' % offset)
+            block_offset = offset + len(line)
+            width = len(_read_line(mapped, block_offset)) if num_bands > 0 else 0
+            line = _read_line(mapped, block_offset + num_bands * width)
+            if line.strip() and (len(line) not in fmt['k_point_line_lengths']):
+                # Band lines differ in width so have to step through them
+                width = 0
+                block_length = 0
+                for n in range(num_bands):
+                    block_length = block_length + len(_read_line(mapped, block_offset + block_length))
+                line = _read_line(mapped, block_offset + block_length)
+            else:
+                block_length = num_bands * width
+            band_line_offsets.append(block_offset)
+            band_line_widths.append(width)
+            band_block_lengths.append(block_length)
+            offset = block_offset + block_length
+        buf = np.frombuffer(b''.join(k_point_lines), dtype=np.uint8)
+        self.k_points, self.weights, self.num_plane_waves, self.num_bands = \
+            _decode_k_point_lines(buf, np.arange(len(k_point_lines)) * line_length, \
+                np.ones(len(k_point_lines), dtype=int) * line_length)
+        self._band_line_offsets = np.array(band_line_offsets, dtype=np.int64)
+        self._band_line_widths = np.array(band_line_widths, dtype=np.int64)
+        self._band_block_lengths = np.array(band_block_lengths, dtype=np.int64)
+
+    def _read_band_energies(self, band_num, present):
+        # Reads the energies of a single band from the k point blocks in
+        # which it is present
+        energies = np.empty(present.sum())
+        offsets = self._band_line_offsets[present]
+        widths = self._band_line_widths[present]
+        mapped = self._mapped()
+        # Fixed width blocks - gather every line of this band at once
+        for width in np.unique(widths[widths > 0]):
+            same_width = (widths == width)
+            lines = gather(mapped, offsets[same_width] + band_num * width, width)
+            band_vals = np.fromstring(lines.tobytes(), sep=' ')
+            if len(band_vals) != same_width.sum() * fmt['num_band_vals']:
+                raise UnexpectedFileFormat('A non-number was parsed from a line identified as a band energy line')
+            band_vals = band_vals.reshape((-1, fmt['num_band_vals']))
+            if (band_vals[:,0] != band_num + 1).any():
+                raise UnexpectedFileFormat('Band lines are not in the expected order for band %d' % (band_num + 1))
+            energies[same_width] = band_vals[:,1]
+        # Variable width blocks - read the whole block
+        lengths = self._band_block_lengths[present]
+        for n in np.flatnonzero(widths == 0):
+            block = mapped[offsets[n]:offsets[n] + lengths[n]]
+            band_vals = np.fromstring(block, sep=' ').reshape((-1, fmt['num_band_vals']))
+            energies[n] = band_vals[band_vals[:,0] == band_num + 1, 1][0]
+        return energies
+
+    def _mapped(self):
+        # The file as map_file gives it, kept for reading the bands
+        if self._map is None:
+            self._map = map_file(self.filename, in_memory=self._in_memory)
+        return self._map
+
+    def _band_data(self, band_num):
+        # Builds the Nx5 id, i, j, k, energy array for a single band from the
+        # k points at which it exists
+        if self.energies is not None:
+            band_energies = self.energies[:,band_num]
+            present = ~np.isnan(band_energies)
+            band_energies = band_energies[present]
+        else:
+            present = self.num_bands > band_num
+            band_energies = self._read_band_energies(band_num, present)
+        return np.column_stack((self.k_points[present], band_energies))
+
+
+class _LazyBandList(object):
+    '''A read-only list of Band objects which are read from the .energy file
+    (and then kept) only when first accessed'''
+    def __init__(self, energy_rdr):
+        self._energy_rdr = energy_rdr
+        self._bands = {}
+
+    def __len__(self):
+        if len(self._energy_rdr.num_bands) == 0:
+            return 0
+        return int(self._energy_rdr.num_bands.max())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index = index + len(self)
+        if (index < 0) or (index >= len(self)):
+            raise IndexError('Band index out of range')
+        if index not in self._bands:
+            self._bands[index] = Band(id=index+1, data=self._energy_rdr._band_data(index))
+        return self._bands[index]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _read_line(mapped, offset):
+    '''Returns the line beginning at 'offset' in a file from map_file,
+    including the newline'''
+    end = mapped.find(b'\n', offset)
+    if end < 0:
+        return mapped[offset:]
+    return mapped[offset:end+1]
+
+def _read_energy_file(filename):
+    '''Reads and decodes a whole .energy file'''
+    buf = np.frombuffer(read_file(filename), dtype=np.uint8)
+    return _decode_energy_blocks(buf)
+
+def _iter_energy_blocks(filename, num_bands, chunk_size, block_size):
+    '''Yields the k points, weights and energies (with num_bands columns) of
+    chunk_size k points at a time'''
+    file_handle = open_file(filename)
+    try:
+        pending = b''
+        # The lines of pending before scanned have been searched for k point
+        # lines, which begin at k_point_starts
+        scanned = 0
+        k_point_starts = np.zeros(0, dtype=np.int64)
+        while True:
+            data = file_handle.read(block_size)
+            pending = pending + data
+            # Only search up to the last complete line until the end of file
+            if data:
+                end = pending.rfind(b'\n') + 1
+            else:
+                end = len(pending)
+            if end > scanned:
+                starts, lengths = line_bounds(np.frombuffer(pending[scanned:end], dtype=np.uint8))
+                k_point_starts = np.append(k_point_starts, \
+                    starts[np.in1d(lengths, fmt['k_point_line_lengths'])] + scanned)
+                scanned = end
+            # A chunk is complete once the k point line following it is read
+            chunk_ends = list(k_point_starts[chunk_size::chunk_size])
+            if (not data) and (len(k_point_starts) > 0):
+                chunk_ends.append(end)
+            buf = np.frombuffer(pending, dtype=np.uint8)
+            chunk_start = 0
+            for chunk_end in chunk_ends:
+                k_points, weights, num_plane_waves, num_k_bands, energies = \
+                    _decode_energy_blocks(buf[chunk_start:chunk_end], num_bands)
+                yield (k_points, weights, energies)
+                chunk_start = chunk_end
+            if not data:
+                break
+            if chunk_start > 0:
+                pending = pending[chunk_start:]
+                scanned = scanned - chunk_start
+                k_point_starts = k_point_starts[len(chunk_ends) * chunk_size:] - chunk_start
+    finally:
         file_handle.close()
 
-        # Now cast into Band objects
-        for i in range(len(tmp_bands)):
-            self.bands.append(Band(id=i+1, data=np.array(tmp_bands[i])))
-        del tmp_bands # Frees up memory?
+def _decode_energy_blocks(buf, num_bands=None):
+    '''Decodes a buffer containing whole k point blocks, returns the k
+    points, weights, numbers of plane waves, numbers of bands and an array of
+    energies with num_bands columns (by default the largest band number)'''
+    # Find where each line begins and how long it is
+    starts, lengths = line_bounds(buf)
+    is_k_point_line = np.in1d(lengths, fmt['k_point_line_lengths'])
+    k_point_starts = starts[is_k_point_line]
+    # Decode all the k point lines in one go
+    k_points, weights, num_plane_waves, num_k_bands = _decode_k_point_lines(buf, k_point_starts, lengths[is_k_point_line])
+    # Every non-blank line following the first k point line is a band line
+    k_point_num = np.cumsum(is_k_point_line) - 1
+    is_band_line = (~is_k_point_line) & (k_point_num >= 0) & (lengths > 1)
+    band_text = buf[np.repeat(is_band_line, lengths)].tobytes()
+    band_vals = np.fromstring(band_text, sep=' ')
+    num_band_lines = is_band_line.sum()
+    if len(band_vals) != num_band_lines * fmt['num_band_vals']:
+        raise UnexpectedFileFormat('A non-number was parsed from a line identified as a band energy line')
+    band_vals = band_vals.reshape((-1, fmt['num_band_vals']))
+    band_k_point_num = k_point_num[is_band_line]
+    if (np.bincount(band_k_point_num, minlength=len(k_point_starts)) != num_k_bands).any():
+        raise UnexpectedFileFormat('The number of band lines does not match the number of bands given on the k point line')
+    band_ids = band_vals[:,0].astype(int)
+    if num_bands is None:
+        num_bands = band_ids.max() if len(band_ids) > 0 else 0
+    # Fill a single preallocated array with every energy
+    energies = np.empty((len(k_point_starts), num_bands))
+    energies.fill(np.nan)
+    energies[band_k_point_num, band_ids - 1] = band_vals[:,1]
+    return k_points, weights, num_plane_waves, num_k_bands, energies
+
+def _decode_k_point_lines(buf, k_point_starts, k_point_lengths):
+    '''Decodes the k point lines beginning at k_point_starts, returns the k
+    points, weights, numbers of plane waves and numbers of bands'''
+    try:
+        k_point_vals = fmt['k_point_line'].decode(buf, k_point_starts, k_point_lengths)
+    except ValueError:
+        raise UnexpectedFileFormat('A non-number was parsed from a line identified as a k-point line')
+    # For .klist_band files, k_point_name is a name, for others it is a
+    # unique integer
+    k_point_names = np.char.strip(k_point_vals['k_point_name'])
+    k_point_ids = np.zeros(len(k_point_names))
+    is_id = np.char.isdigit(k_point_names)
+    k_point_ids[is_id] = k_point_names[is_id].astype(int)
+    k_points = np.column_stack((k_point_ids, k_point_vals['i'], k_point_vals['j'], k_point_vals['k']))
+    return k_points, k_point_vals['weight'], k_point_vals['num_plane_waves'], k_point_vals['num_bands']
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    TiC_energy_filename = os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.energy')
+    globs = {
+        'TiC_energy_filename' : TiC_energy_filename,
+        'EnergyReader' : EnergyReader,
+        'np' : np,
+    }
+    doctest.testmod(globs=globs)
@@ -0,0 +1,460 @@
+'''
+FortranFormat.py
+
+A class which compiles a FORTRAN FORMAT statement into a plan of fixed width
+columns so that many records can be decoded or encoded at once with Numpy
+'''
+
+__all__ = ['FortranFormat']
+
+import re
+import warnings
+import numpy as np
+
+# A single edit descriptor i.e. '4I10', 'f5.1', '3e19.12', '4x' or 'A'
+edit_descriptor = re.compile(r'''
+    ^(\d*)          # Repeat count
+    ([A-Za-z]+)     # Descriptor
+    (\d*)           # Width
+    (?:\.(\d+))?$   # Decimal places
+''', re.VERBOSE)
+
+NEWLINE = ord('\n')
+CARRIAGE_RETURN = ord('\r')
+SPACE = ord(' ')
+ZERO = ord('0')
+MINUS = ord('-')
+PLUS = ord('+')
+
+# The bytes which may appear in an I field (and between lines)
+INTEGER_BYTES = np.zeros(256, dtype=bool)
+INTEGER_BYTES[[ord(x) for x in '0123456789+- ']] = True
+INTEGER_TEXT_BYTES = INTEGER_BYTES.copy()
+INTEGER_TEXT_BYTES[[NEWLINE, CARRIAGE_RETURN]] = True
+# The bytes of an F or E field that Numpy can read (not D exponents)
+REAL_BYTES = INTEGER_BYTES.copy()
+REAL_BYTES[[ord(x) for x in '.Ee']] = True
+POINT = ord('.')
+
+class FortranFormat(object):
+    '''
+    Compiles a FORTRAN FORMAT statement into fixed width fields which are
+    decoded (or encoded) column-wise for a whole block of records at once
+
+    The I, F, E, D, G and A edit descriptors are supported along with nX,
+    quoted literals, repeat counts and repeated groups i.e. '3(f5.1)'. An A
+    descriptor without a width takes the rest of the record.
+
+    Parameters,
+
+    format_string:      The FORMAT statement i.e. '(I10,4I10,f5.1)'
+    names:              A name for each field (not counting X or literals),
+                        default: f0, f1, ...
+
+    Results in,
+
+    fields:             A list of (name, descriptor, start, width, decimals)
+    literals:           A list of (start, text) of the quoted literals
+    width:              The width of a record (None if ends with an A
+                        without a width)
+    dtype:              The Numpy structured dtype of decoded records (an A
+                        field without a width is sized to the longest record
+                        when decoded)
+
+    EXAMPLE:
+
+    >>> k_point_fmt = FortranFormat('(I10,4I10,f5.1)', names=['id', 'i', 'j', 'k', 'denominator', 'weight'])
+    >>> k_point_fmt.width
+    55
+    >>> lines = ['         2         1         1        -1        10  8.0',
+    ...          '         3         2         2        -2        10  8.0']
+    >>> records = k_point_fmt.decode_lines(lines)
+    >>> records['k'].tolist()
+    [-1, -2]
+    >>> records['weight'].tolist()
+    [8.0, 8.0]
+    >>> k_point_fmt.encode([records[name] for name in records.dtype.names]).splitlines() == lines
+    True
+    '''
+    def __init__(self, format_string, names=None):
+        self.format_string = format_string
+        self.fields = []
+        self.literals = []
+        self.width = 0
+        self._compile(_strip_parentheses(format_string.strip()))
+        if names is None:
+            names = ['f%d' % i for i in range(len(self.fields))]
+        if len(names) != len(self.fields):
+            raise ValueError('%d names given for the %d fields of %s' % \
+                (len(names), len(self.fields), format_string))
+        self.fields = [(name,) + field for name, field in zip(names, self.fields)]
+        self.dtype = self._record_dtype(self.width)
+
+    def _record_dtype(self, record_width):
+        # The structured dtype for records of the given width (only needed
+        # for the width of an A field without a width)
+        dtypes = []
+        for name, descriptor, start, width, decimals in self.fields:
+            if descriptor == 'I':
+                dtypes.append((name, np.int64))
+            elif descriptor == 'A':
+                if width is None:
+                    width = max((record_width or 0) - start, 1)
+                dtypes.append((name, 'S%d' % width))
+            else:
+                dtypes.append((name, np.float64))
+        return np.dtype(dtypes)
+
+    def _compile(self, format_string):
+        # Appends the fields of a format string (without the outer
+        # parentheses) to self.fields
+        for item in _split_items(format_string):
+            if item.startswith("'") or item.startswith('"'):
+                # A literal string, i.e. ' k, div: ('
+                if self.width is None:
+                    raise ValueError('A literal follows an A field without a width in %s' % self.format_string)
+                text = item[1:-1].replace(item[0]*2, item[0])
+                self.literals.append((self.width, text))
+                self.width = self.width + len(text)
+                continue
+            group = re.match(r'^(\d*)\((.*)\)$', item)
+            if group is not None:
+                for repeat in range(int(group.group(1) or 1)):
+                    self._compile(group.group(2))
+                continue
+            match = edit_descriptor.match(item)
+            if match is None:
+                raise ValueError('Could not compile the edit descriptor %s' % item)
+            repeat, descriptor, width, decimals = match.groups()
+            descriptor = descriptor.upper()
+            repeat = int(repeat or 1)
+            if descriptor == 'X':
+                self.width = self.width + repeat
+                continue
+            if descriptor == 'ES':
+                descriptor = 'E'
+            if descriptor not in ('I', 'F', 'E', 'D', 'G', 'A'):
+                raise ValueError('The edit descriptor %s is not supported' % item)
+            if self.width is None:
+                raise ValueError('A field follows an A field without a width in %s' % self.format_string)
+            if width == '':
+                if descriptor != 'A':
+                    raise ValueError('The edit descriptor %s has no width' % item)
+                self.fields.append((descriptor, self.width, None, None))
+                self.width = None
+                continue
+            width = int(width)
+            decimals = int(decimals) if decimals is not None else None
+            for i in range(repeat):
+                self.fields.append((descriptor, self.width, width, decimals))
+                self.width = self.width + width
+
+    def field_slice(self, name):
+        '''Returns a slice of the columns occupied by the named field'''
+        for field_name, descriptor, start, width, decimals in self.fields:
+            if field_name == name:
+                return slice(start, start + width if width is not None else None)
+        raise KeyError(name)
+
+    def decode(self, buf, starts, lengths=None):
+        '''
+        Decodes the records beginning at the offsets 'starts' in 'buf' (a
+        Numpy array of bytes), 'lengths' are the lengths of each line -
+        records shorter than the format are padded with blanks. Returns a
+        structured array with one element per record. Raises a ValueError if
+        a field cannot be converted.
+        '''
+        starts = np.asarray(starts, dtype=np.int64)
+        if len(starts) == 0:
+            return np.empty(0, dtype=self.dtype)
+        record_width = self.width
+        if record_width is None:
+            if lengths is None:
+                raise ValueError('The line lengths are needed to decode an A field without a width')
+            record_width = int(np.max(lengths))
+        records = np.empty(len(starts), dtype=self._record_dtype(record_width))
+        chars = _gather_rows(buf, starts, record_width)
+        if lengths is not None:
+            short = np.asarray(lengths) < record_width
+            if np.any(short):
+                chars[short] = np.where(np.arange(record_width) < np.asarray(lengths)[short].reshape((-1,1)), \
+                    chars[short], SPACE)
+        chars[(chars == NEWLINE) | (chars == CARRIAGE_RETURN)] = SPACE
+        for name, descriptor, start, width, decimals in self.fields:
+            if width is None:
+                width = record_width - start
+            if width <= 0:
+                records[name] = b''
+                continue
+            if descriptor == 'I':
+                records[name] = _decode_integer(chars[:,start:start+width])
+                continue
+            if descriptor == 'A':
+                records[name] = np.ascontiguousarray(chars[:,start:start+width]).view('S%d' % width).ravel()
+                continue
+            records[name] = _decode_real(chars[:,start:start+width], decimals)
+        return records
+
+    def encode(self, columns):
+        '''
+        Encodes 'columns', a sequence holding an array of values for each
+        field, into records. Returns a string with each record terminated by
+        a newline. I and F fields are written as by '%10d' and '%5.1f'
+        (floats in an I field are truncated) and A fields are right
+        justified. Raises a ValueError if a value does not fit in its field
+        or the field cannot be written. E and D fields are formatted one
+        value at a time so are best kept to short records such as headers.
+        '''
+        if self.width is None:
+            raise ValueError('Records ending in an A field without a width cannot be encoded')
+        if len(columns) != len(self.fields):
+            raise ValueError('%d columns given for the %d fields of %s' % \
+                (len(columns), len(self.fields), self.format_string))
+        num_records = len(columns[0]) if len(columns) > 0 else 0
+        chars = np.empty((num_records, self.width + 1), dtype=np.uint8)
+        chars.fill(SPACE)
+        chars[:,-1] = NEWLINE
+        for start, text in self.literals:
+            chars[:,start:start+len(text)] = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        for (name, descriptor, start, width, decimals), values in zip(self.fields, columns):
+            if descriptor == 'A':
+                field = np.char.rjust(np.asarray(values, dtype='S%d' % width), width)
+                chars[:,start:start+width] = field.view(np.uint8).reshape((-1,width))
+            elif descriptor in ('I', 'F'):
+                chars[:,start:start+width] = _encode_number(np.asarray(values), width, \
+                    decimals if descriptor == 'F' else None)
+            elif descriptor in ('E', 'D'):
+                field = np.array([_format_exponent(x, width, decimals, descriptor) for x in values], dtype='S%d' % width)
+                chars[:,start:start+width] = field.view(np.uint8).reshape((-1,width))
+            else:
+                raise ValueError('The edit descriptor %s is not supported for output' % descriptor)
+        return chars.tobytes()
+
+    def decode_values(self, buf, starts, lengths):
+        '''
+        Decodes a list of values written with this format over many lines,
+        i.e. (ITTFL(J),J=1,5*MWRIT) written with FORMAT(6i10), where the
+        last line may be short. The format must be I fields of one width.
+        Returns a flat array of the values in the order they were written.
+        '''
+        widths = set([(descriptor, width) for name, descriptor, start, width, decimals in self.fields])
+        if (len(widths) != 1) or (list(widths)[0][0] != 'I'):
+            raise ValueError('Values can only be decoded for a format of I fields of one width')
+        width = list(widths)[0][1]
+        num_fields = len(self.fields)
+        starts = np.asarray(starts, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if len(starts) == 0:
+            return np.zeros(0, dtype=np.int64)
+        # The number of fields on each line, not counting the newline
+        ends = starts + lengths
+        line_lengths = lengths - (buf[ends - 1] == NEWLINE)
+        line_lengths = line_lengths - ((line_lengths > 0) & (buf[starts + np.maximum(line_lengths, 1) - 1] == CARRIAGE_RETURN))
+        num_vals = np.minimum((line_lengths + width - 1) // width, num_fields)
+        if (width > 1) and np.all(starts[1:] == ends[:-1]) and np.all(INTEGER_TEXT_BYTES[buf[starts[-1]:ends[-1]]]):
+            # Whilst every field starts with a blank and ends with a digit
+            # each holds one value and the values are separated by blanks so
+            # Numpy can split them on whitespace. Numpy stops at the first
+            # character it cannot read so if all the values are read only
+            # the last line can hold a stray character
+            field_starts = starts.reshape((-1,1)) + np.arange(num_fields) * width
+            in_line = np.arange(num_fields) < num_vals.reshape((-1,1))
+            field_ends = np.minimum(field_starts + width, (starts + line_lengths).reshape((-1,1))) - 1
+            if np.all(buf[field_starts[in_line]] == SPACE) and np.all(buf[field_ends[in_line]] != SPACE):
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', DeprecationWarning)
+                    try:
+                        values = np.fromstring(buf[starts[0]:ends[-1]].tobytes(), dtype=np.int64, sep=' ')
+                    except ValueError:
+                        values = None
+                if (values is not None) and (len(values) == num_vals.sum()):
+                    return values
+        values = self.decode(buf, starts, lengths).view(np.int64).reshape((-1,num_fields))
+        return values[np.arange(num_fields) < num_vals.reshape((-1,1))]
+
+    def decode_lines(self, lines):
+        '''Decodes a list of lines, returns a structured array with one
+        element per line'''
+        lines = [x.encode('ascii') if not isinstance(x, bytes) else x for x in lines]
+        buf = np.frombuffer(b'\n'.join(lines) + b'\n', dtype=np.uint8)
+        starts, lengths = line_bounds(buf)
+        return self.decode(buf, starts, lengths)
+
+
+def line_bounds(buf):
+    '''Returns the start offsets and lengths (including the newline) of
+    every line in a buffer of bytes'''
+    ends = np.flatnonzero(buf == NEWLINE) + 1
+    if (len(buf) > 0) and (buf[-1] != NEWLINE):
+        ends = np.append(ends, len(buf))
+    starts = np.zeros_like(ends)
+    starts[1:] = ends[:-1]
+    return starts, ends - starts
+
+def _decode_real(chars, decimals):
+    # The reals in an array of (num. records, width) bytes, blank fields are
+    # read as zero
+    if (chars.shape[1] > 1) and np.all(chars[:,0] == SPACE) and np.all(chars[:,-1] != SPACE) and \
+            np.all(REAL_BYTES[chars]) and \
+            ((not decimals) or np.all(((chars == POINT) | (chars == ord('E')) | (chars == ord('e'))).any(axis=1))):
+        # Each field starts with a blank, ends with a digit and has no
+        # implied decimal point so Numpy can split them on whitespace,
+        # unless some field has blanks inside
+        values = np.fromstring(np.ascontiguousarray(chars).tobytes(), dtype=np.float64, sep=' ')
+        if len(values) == len(chars):
+            return values
+    field = np.ascontiguousarray(chars).view('S%d' % chars.shape[1]).ravel()
+    field = np.char.strip(field)
+    field[field == b''] = b'0'
+    field = np.char.replace(np.char.upper(field), b'D', b'E')
+    values = field.astype(np.float64)
+    # Without a decimal point the last 'decimals' digits are the fractional
+    # part
+    if decimals:
+        implied = (np.char.find(field, b'.') < 0) & (np.char.find(field, b'E') < 0)
+        values[implied] = values[implied] / 10.0**decimals
+    return values
+
+def _gather_rows(buf, starts, width):
+    # Copies 'width' bytes from each offset in 'starts' into the rows of an
+    # array, rows running off the end of 'buf' are padded with blanks
+    chars = np.empty((len(starts), width), dtype=np.uint8)
+    num_windows = len(buf) - width + 1
+    inside = starts < num_windows
+    if num_windows > 0:
+        # Every run of 'width' bytes in buf as the rows of a view
+        windows = np.lib.stride_tricks.as_strided(buf, shape=(num_windows, width), \
+            strides=(buf.strides[0], buf.strides[0]))
+        if np.all(inside):
+            chars[:] = windows[starts]
+        else:
+            chars[inside] = windows[starts[inside]]
+    for i in np.flatnonzero(~inside):
+        row = buf[starts[i]:starts[i]+width]
+        chars[i,:len(row)] = row
+        chars[i,len(row):] = SPACE
+    return chars
+
+def _decode_integer(chars):
+    # The integers in an array of (num. records, width) bytes, blanks are
+    # ignored (so a blank field is zero)
+    if not np.all(INTEGER_BYTES[chars]):
+        raise ValueError('Could not convert a field to an integer')
+    if (chars.shape[1] > 1) and np.all(chars[:,0] == SPACE) and np.all(chars[:,-1] != SPACE):
+        # Each field starts with a blank and ends with a digit so Numpy can
+        # split them on whitespace, unless some field has blanks inside
+        values = np.fromstring(np.ascontiguousarray(chars).tobytes(), dtype=np.int64, sep=' ')
+        if len(values) == len(chars):
+            return values
+    columns = np.ascontiguousarray(chars.T)
+    digits = columns - np.uint8(ZERO)
+    is_digit = digits < 10
+    is_minus = columns == MINUS
+    values = np.zeros(len(chars), dtype=np.int64)
+    for col in range(len(columns)):
+        values = np.where(is_digit[col], values * 10 + digits[col], values)
+    return np.where(is_minus.any(axis=0), -values, values)
+
+def _format_exponent(value, width, decimals, descriptor='E'):
+    # Formats a value as FORTRAN does for Ew.d i.e. 0.166666666667E-03
+    if decimals is None:
+        raise ValueError('The edit descriptor %s needs a number of decimal places' % descriptor)
+    value = float(value)
+    if value == 0:
+        mantissa, exponent = '0' * decimals, 0
+    else:
+        text = '%.*e' % (decimals - 1, abs(value))
+        mantissa = text[0] + text[2:2+decimals-1]
+        exponent = int(text.split('e')[1]) + 1
+    text = '%s0.%s%s%+03d' % ('-' if value < 0 else '', mantissa, descriptor, exponent)
+    if len(text) > width:
+        raise ValueError('A value does not fit in a field of width %d' % width)
+    return text.rjust(width)
+
+def _encode_number(values, width, decimals):
+    # Right justified digits of each value as an array of (len(values),
+    # width) bytes, 'decimals' is None for an integer
+    if decimals is None:
+        scaled = np.trunc(values)
+        negative = scaled < 0
+        decimals = 0
+        has_point = False
+    else:
+        # Rounded half away from zero as by '%5.1f', np.round would round
+        # halves to even
+        scaled = np.abs(values) * 10.0**decimals
+        rounded = np.floor(scaled + 0.5)
+        # Where the value is close to a half its digits are taken from '%'
+        # as the product may not be exact
+        ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+        for i in ties:
+            rounded[i] = float(('%.*f' % (decimals, abs(values[i]))).replace('.', ''))
+        # As '%5.1f' % -0.01 gives ' -0.0'
+        negative = np.signbit(values)
+        scaled = rounded
+        has_point = True
+    if not np.all(np.isfinite(scaled)):
+        raise ValueError('Cannot encode a value that is not finite')
+    remaining = np.abs(scaled).astype(np.int64)
+    chars = np.empty((len(values), width), dtype=np.uint8)
+    chars.fill(SPACE)
+    unsigned = negative.copy()
+    num_digits = 0
+    for col in range(width - 1, -1, -1):
+        if has_point and (num_digits == decimals):
+            chars[:,col] = POINT
+            has_point = False
+            continue
+        if (num_digits > decimals) and not remaining.any():
+            # Only the signs are left to write
+            chars[unsigned,col] = MINUS
+            unsigned[:] = False
+            break
+        # The units and fractional digits are always written
+        is_digit = (remaining > 0) | (num_digits <= decimals)
+        is_sign = unsigned & ~is_digit
+        chars[:,col] = np.where(is_digit, ZERO + remaining % 10, np.where(is_sign, MINUS, SPACE))
+        unsigned = unsigned & ~is_sign
+        remaining = remaining // 10
+        num_digits = num_digits + 1
+    if has_point or remaining.any() or unsigned.any():
+        raise ValueError('A value does not fit in a field of width %d' % width)
+    return chars
+
+def _strip_parentheses(format_string):
+    if format_string.startswith('(') and format_string.endswith(')'):
+        return format_string[1:-1]
+    return format_string
+
+def _split_items(format_string):
+    # Splits a format string on the commas that are not inside quotes or
+    # parentheses
+    items = []
+    depth = 0
+    quote = None
+    current = ''
+    for char in format_string:
+        if quote is not None:
+            current = current + char
+            if char == quote:
+                quote = None
+            continue
+        if char in ('"', "'"):
+            quote = char
+        elif char == '(':
+            depth = depth + 1
+        elif char == ')':
+            depth = depth - 1
+        elif (char == ',') and (depth == 0):
+            items.append(current.strip())
+            current = ''
+            continue
+        current = current + char
+    if current.strip() != '':
+        items.append(current.strip())
+    return items
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,144 @@
+'''
+KgenReader.py
+
+Reads the tetrahedra in a WIEN2k .kgen file into an object
+'''
+
+__all__ = ['KgenReader']
+
+import numpy as np
+from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.ArrayCache import ArrayCache
+from wien2k.readers.FortranFormat import FortranFormat, line_bounds
+from wien2k.readers.CompressedFile import read_file
+
+# fmt describes the .kgen file written by tetcnt.f, see the WRITE(15,...)
+# statements
+fmt = {
+    # 1234 FORMAT(2i10,e20.12,2I10) NKP,NTT,V,MWRIT,NREC
+    #         47       148  0.166666666667E-03       101         2
+    'header_record' : FortranFormat('(2I10,E20.12,2I10)', names=[
+        'num_k_points',                 # NKP, the number of irreducible k points
+        'num_tetrahedra',               # NTT, the number of different tetrahedra
+        'volume',                       # V, the volume of a tetrahedron
+        'num_tetrahedra_per_record',    # MWRIT, the tetrahedra written at one time
+        'num_records',                  # NREC
+    ]),
+    # 1235 FORMAT(6i10)(ITTFL(J),J=1,5*MWRIT)
+    #         24         1         2         2         7        24
+    # Each record is the multiplicity then the 4 corners (k point ids) of
+    # MWRIT tetrahedra, 6 to a line so the last line of a record may be
+    # short. The last record is padded with zeros
+    'tetrahedra_record' : FortranFormat('(6I10)'),
+    'num_vals_per_tetrahedron' : 5,
+}
+
+# The parsed values kept by the on-disk cache, and the version of them
+cached_arrays = ('header', 'volume', 'data')
+cache_version = 1
+
+class KgenReader(object):
+    '''
+    Reads the tetrahedra from a WIEN2k .kgen file
+
+    Results in,
+
+    num_k_points:               NKP, the number of irreducible k points
+    num_tetrahedra:             NTT, the number of different tetrahedra
+    volume:                     V, the volume of a tetrahedron as a fraction
+                                of the Brillouin zone
+    num_tetrahedra_per_record:  MWRIT, the tetrahedra written in each record
+    num_records:                NREC, the number of records
+    data:                       An int32 (NTT, 5) array of the multiplicity
+                                and the four corners of each tetrahedron
+    multiplicities:             A view of the multiplicities in 'data'
+    tetrahedra:                 A view of the corners (k point ids counting
+                                from 1) in 'data'
+
+    Set 'cache' to True to keep the parsed values in .npy files (in
+    'cache_dir' or next to the file) which are memory mapped when the file
+    is next read
+
+    EXAMPLE:
+
+    >>> kgen_rdr = KgenReader(TiC_kgen_filename)
+    >>> kgen_rdr.num_tetrahedra
+    148
+    >>> kgen_rdr.data[0].tolist()
+    [24, 1, 2, 2, 7]
+    >>> kgen_rdr.tetrahedra.shape
+    (148, 4)
+    >>> int(kgen_rdr.multiplicities.sum())
+    6000
+    '''
+    def __init__(self, filename, cache=False, cache_dir=None):
+        self.filename = filename
+        if cache == True:
+            array_cache = ArrayCache(filename, cache_dir=cache_dir, version=cache_version, names=cached_arrays)
+            arrays = array_cache.load()
+            if arrays is None:
+                self._load_values()
+                array_cache.save(self._cached_arrays())
+            else:
+                self._restore_cached_arrays(arrays)
+        else:
+            self._load_values()
+
+    def _cached_arrays(self):
+        # The parsed values as a dict of arrays for the on-disk cache
+        return {
+            'header' : np.array([self.num_k_points, self.num_tetrahedra, \
+                self.num_tetrahedra_per_record, self.num_records]),
+            'volume' : np.array(self.volume),
+            'data' : self.data,
+        }
+
+    def _restore_cached_arrays(self, arrays):
+        self.num_k_points, self.num_tetrahedra, self.num_tetrahedra_per_record, self.num_records = \
+            [int(x) for x in arrays['header']]
+        self.volume = float(arrays['volume'])
+        self.data = arrays['data']
+
+    def _load_values(self):
+        # Decode the header and all the records in one pass
+        buf = np.frombuffer(read_file(self.filename), dtype=np.uint8)
+        starts, lengths = line_bounds(buf)
+        if len(starts) == 0:
+            raise UnexpectedFileFormat('The .kgen file is empty (line: 1)')
+        try:
+            header = fmt['header_record'].decode(buf, starts[:1], lengths[:1])[0]
+        except ValueError:
+            raise UnexpectedFileFormat('Could not parse the header (line: 1)')
+        self.num_k_points = int(header['num_k_points'])
+        self.num_tetrahedra = int(header['num_tetrahedra'])
+        self.volume = float(header['volume'])
+        self.num_tetrahedra_per_record = int(header['num_tetrahedra_per_record'])
+        self.num_records = int(header['num_records'])
+        try:
+            vals = fmt['tetrahedra_record'].decode_values(buf, starts[1:], lengths[1:])
+        except ValueError:
+            raise UnexpectedFileFormat('Could not parse the tetrahedra records (line: 2)')
+        num_vals_per_tetrahedron = fmt['num_vals_per_tetrahedron']
+        if len(vals) < self.num_tetrahedra * num_vals_per_tetrahedron:
+            raise UnexpectedFileFormat('Fewer tetrahedra than NTT (line: %d)' % len(starts))
+        self.data = vals[:self.num_tetrahedra * num_vals_per_tetrahedron] \
+            .reshape((-1,num_vals_per_tetrahedron)).astype(np.int32)
+
+    def multiplicities(self):
+        return self.data[:,0]
+    multiplicities = property(multiplicities)
+
+    def tetrahedra(self):
+        return self.data[:,1:]
+    tetrahedra = property(tetrahedra)
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    globs = {
+        'TiC_kgen_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.kgen'),
+        'KgenReader' : KgenReader,
+    }
+    doctest.testmod(globs=globs)
@@ -9,19 +9,21 @@ __all__ = ['KlistReader']
 import numpy as np
 import re
 from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.ArrayCache import ArrayCache
+from wien2k.readers.FortranFormat import FortranFormat
+from wien2k.readers.CompressedFile import read_file
 
 
 # fmt describes the format of the WIEN2k .klist file
 fmt = {
     # Note that file ends with line of FORTRAN format statment from line 286 of main.f
     # format('END',/)
-    'file_terminator' : re.compile(r'\s*END\s*'),
+    'file_terminator' : re.compile(r'^\s*END', re.MULTILINE),
     # Meta data line typically looks like,
     #         1         0         0         0        21  1.0 -7.0  1.5     10000 k, div: ( 21 21 21)
     # FORTRAN format statement found in main.f on line 287
     # FORMAT(I10,4I10,3f5.1,4x,i6,' k, div: (',3i3,')')  
-    'meta_data_line_num' : 1,    # Specify a lne to make it quicker
-    'num_meta_data_vals' : 12,    # Number of values read from the meta line - used to check parsing successful
+    # The regular expression is only used to recognise the type of file
     'meta_data_line' : re.compile(r'''
         \s*(-?[\d\.]+)      # k point id
         \s+(-?[\d\.]+)      # i' value
@@ -38,33 +40,34 @@ fmt = {
         \s*([\d\s]{3})\s*\) # The number to divide the z recip. latt. vec. by to get the spacings of the mesh points in z dirn
         .*
     ''', re.VERBOSE),
+    'meta_data_record' : FortranFormat("(I10,4I10,3f5.1,4x,i6,' k, div: (',3i3,')')", names=[
+        'id', 'i', 'j', 'k',
+        'denominator',      # i.e. divide i',j',k' by this to get true i,j,k
+        'weight',           # no. of times this k point should be replicated in full BZ
+        'unknown_1',        # i.e. '-7.0' - actually hardcoded!
+        'unknown_2',        # i.e. '1.5' - actually hardcoded!
+        'num_k_points',     # 'Number of k points in whole cell' (i.e. '10000')
+        'i_divisions', 'j_divisions', 'k_divisions', # Divide the recip. latt. vecs. by these to get the mesh spacings
+    ]),
     # K point line typically looks like
     #         2         1         1         0        21  4.0
     # FORTRAN format statement found in main.f on line 285
     # FORMAT(I10,4I10,f5.1)
-    'num_k_point_vals' : 6,   # Number of values read from k point line - used to check parsing successful
-    'k_point_line' : re.compile(r'''
-        \s+(-?[\d\.]+) # k point id
-        \s+(-?[\d\.]+) # i' value
-        \s+(-?[\d\.]+) # j' value
-        \s+(-?[\d\.]+) # k' value
-        \s+(-?[\d\.]+) # denominator (i.e. divide i',j',k' by this to get true i,j,k)
-        \s+(-?[\d\.]+) # weight (no. of times this k point should be replicated in full BZ)
-        \s*
-    ''', re.VERBOSE)
+    'k_point_record' : FortranFormat('(I10,4I10,f5.1)', names=[
+        'id', 'i', 'j', 'k', 'denominator', 'weight',
+    ]),
 }
 
 xcd_band_fmt = {
     # The case.klist_band file (at least as generated by XCrysden 1.4.1) is of
     # a different format to the .klist file generated by WIEN2k. This
     # describes the file
-    'file_terminator' : re.compile(r'\s*END\s*'),
+    'file_terminator' : re.compile(r'^\s*END', re.MULTILINE),
     # Meta data line typically looks like,
     #N             0  -10    0   10  2.0-8.00 8.00    k-list generated by XCrySDen
     # Guess a format statement of
     # FORMAT('A10,4I5,3f5.1,A')  
-    'meta_data_line_num' : 1,    # Specify a line to make it quicker
-    'num_meta_data_vals' : 8,   # Number of values read from the meta line - used to check parsing successful
+    # The regular expression is only used to recognise the type of file
     'meta_data_line' : re.compile(r'''
         (.{10})               # Point name i.e. 'N' or 'GAMMA'
         ([-+\s\d]{5})         # 'i' value
@@ -76,89 +79,93 @@ xcd_band_fmt = {
         ([-+\s\dDdEe\.]{5})   # Unknown number (i.e. '8.0') - actually hardcoded!
         .*                    # Any leftover string i.e. 'k-list generated by XCrySDen' (not captured)
     ''', re.VERBOSE),
+    'meta_data_record' : FortranFormat('(A10,4I5,3f5.1,A)', names=[
+        'name', 'i', 'j', 'k', 'denominator', 'weight', 'unknown_1', 'unknown_2', 'comment',
+    ]),
     # K point line typically looks like
     #              0   -8    0   10  2.0
     # Guess a format statement of
     # FORMAT(A10,4I5,f5.1)
-    'num_k_point_vals' : 5,   # Number of values read from k point line - used to check parsing successful
-    'k_point_line' : re.compile(r'''
-        .{10}                 # Blanks (not captured)
-        ([-+\s\d]{5})         # 'i' value
-        ([-+\s\d]{5})         # 'j' value
-        ([-+\s\d]{5})         # 'k' value
-        ([-+\s\d]{5})         # denominator (i.e. divide i',j',k' by this to get true i,j,k)
-        ([-+\s\dDdEe\.]{5})   # weight (no. of times this k point should be replicated in full BZ)
-        .*                    # Any leftover string (not captured)
-    ''', re.VERBOSE)    
+    'k_point_record' : FortranFormat('(A10,4I5,f5.1)', names=[
+        'name', 'i', 'j', 'k', 'denominator', 'weight',
+    ]),
 }
 
+# The parsed values kept by the on-disk cache, and the version of them
+cached_arrays = ('data', 'bz_shape', 'is_bandlist')
+cache_version = 1
+
 class KlistReader(object):
-    '''A class to read in .klist files from WIEN2k'''
-    def __init__(self, filename):
+    '''A class to read in .klist files from WIEN2k
+
+    Set 'cache' to True to keep the parsed values in .npy files (in
+    'cache_dir' or next to the file) which are memory mapped when the file
+    is next read
+    '''
+    def __init__(self, filename, cache=False, cache_dir=None):
         self.filename = filename
         self.data = None
         self.bz_shape = []
         self.is_bandlist = False
-        self._load_values()
+        if cache == True:
+            array_cache = ArrayCache(filename, cache_dir=cache_dir, version=cache_version, names=cached_arrays)
+            arrays = array_cache.load()
+            if arrays is None:
+                self._load_values()
+                array_cache.save({
+                    'data' : self.data,
+                    'bz_shape' : np.array(self.bz_shape, dtype=int),
+                    'is_bandlist' : np.array(self.is_bandlist),
+                })
+            else:
+                self.data = arrays['data']
+                if len(arrays['bz_shape']) > 0:
+                    self.bz_shape = tuple([int(x) for x in arrays['bz_shape']])
+                self.is_bandlist = bool(arrays['is_bandlist'])
+        else:
+            self._load_values()
+
     def _load_values(self):
         # Loads the object with values from the .klist file
-        file_handle = open(self.filename, 'r')
-        line_num = 0
-        tmp_data = []
-        for line in file_handle:
-            line_num = line_num + 1
-            # Quit if reach file terminator string
-            ##if line.strip().startswith(file_terminator):
-            if fmt['file_terminator'].match(line):
-                break
-            # Skip if line empty
-            if line.strip() == '':
-                continue
-            # Try to determine if a file is a .klist or a .klist_band
-            if line_num == fmt['meta_data_line_num']:
-                if fmt['meta_data_line'].match(line) is None:
-                    assert line_num == xcd_band_fmt['meta_data_line_num']
-                    if xcd_band_fmt['meta_data_line'].match(line) is None:
-                        raise UnexpectedFileFormat('Could not determine if file is .klist or .klist_band')
-                    else:
-                        self.is_bandlist = True
-                else:
-                    self.is_bandlist = False
-            if self.is_bandlist == True:
-                # Parse out meta data line
-                if line_num == xcd_band_fmt['meta_data_line_num']:
-                    # Extract all the matches to the regular expression
-                    meta_vals = xcd_band_fmt['meta_data_line'].match(line).groups()
-                    if len(meta_vals) != xcd_band_fmt['num_meta_data_vals']:
-                        raise UnexpectedFileFormat('Meta line parsed wrong number of elements - check that the file is correct or update format (line: %d))' % line_num)
-                    tmp_data.append([0.0] + [float(x) for x in meta_vals[1:6]]) # Line also contains a k point - add this
-                # Otherwise parse out the k point line
-                else:
-                    # Extract all the matches to the regular expression
-                    k_point_vals = xcd_band_fmt['k_point_line'].match(line).groups()
-                    if len(k_point_vals) != xcd_band_fmt['num_k_point_vals']:
-                        raise UnexpectedFileFormat('k point line parsed wrong number of elements - check that the file is correct or update format (line: %d))' % line_num)
-                    # i', j', k', denominator, weight
-                    tmp_data.append([0.0] + [float(x) for x in k_point_vals])
-            else:
-                # Parse out meta data line
-                if line_num == fmt['meta_data_line_num']:
-                    # Extract all the matches to the regular expression
-                    meta_vals = fmt['meta_data_line'].match(line).groups()
-                    if len(meta_vals) != fmt['num_meta_data_vals']:
-                        raise UnexpectedFileFormat('Meta line parsed wrong number of elements - check that the file is correct or update format (line: %d))' % line_num)
-                    self.bz_shape = tuple([int(x) for x in meta_vals[9:12]])
-                    tmp_data.append([float(x) for x in meta_vals[:6]]) # Line also contains a k point - add this
-                # Otherwise parse out the k point line
-                else:
-                    # Extract all the matches to the regular expression
-                    k_point_vals = fmt['k_point_line'].match(line).groups()
-                    if len(k_point_vals) != fmt['num_k_point_vals']:
-                        raise UnexpectedFileFormat('k point line parsed wrong number of elements - check that the file is correct or update format (line: %d))' % line_num)
-                    # i', j', k', denominator, weight
-                    tmp_data.append([float(x) for x in k_point_vals[:6]])
-        self.data = np.array(tmp_data)
-        file_handle.close()
+        text = read_file(self.filename)
+        # Quit if reach file terminator string
+        terminator = fmt['file_terminator'].search(text)
+        if terminator is not None:
+            text = text[:terminator.start()]
+        # Skip empty lines
+        lines = [line for line in text.splitlines() if line.strip() != '']
+        if len(lines) == 0:
+            self.data = np.array([])
+            return
+        # Try to determine if a file is a .klist or a .klist_band
+        if fmt['meta_data_line'].match(lines[0]) is not None:
+            self.is_bandlist = False
+            file_fmt = fmt
+        elif xcd_band_fmt['meta_data_line'].match(lines[0]) is not None:
+            self.is_bandlist = True
+            file_fmt = xcd_band_fmt
+        else:
+            raise UnexpectedFileFormat('Could not determine if file is .klist or .klist_band')
+        # The meta data line also contains a k point, decode it and then
+        # the rest of the k points in one go
+        try:
+            meta_vals = file_fmt['meta_data_record'].decode_lines(lines[:1])
+        except ValueError:
+            raise UnexpectedFileFormat('Meta line could not be parsed - check that the file is correct or update format (line: 1)')
+        try:
+            k_point_vals = file_fmt['k_point_record'].decode_lines(lines[1:])
+        except ValueError:
+            raise UnexpectedFileFormat('k point lines could not be parsed - check that the file is correct or update format')
+        self.data = np.zeros((len(lines), 6))
+        # .klist_band files have names rather than ids so leave them as 0
+        columns = ('i', 'j', 'k', 'denominator', 'weight')
+        if self.is_bandlist == False:
+            columns = ('id',) + columns
+            self.bz_shape = tuple([int(meta_vals[x][0]) for x in ('i_divisions', 'j_divisions', 'k_divisions')])
+        first_column = self.data.shape[1] - len(columns)
+        for n, column in enumerate(columns):
+            self.data[0, first_column + n] = meta_vals[column][0]
+            self.data[1:, first_column + n] = k_point_vals[column]
 
     def ids(self):
         if self.data != None:
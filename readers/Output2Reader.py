@@ -6,44 +6,187 @@ A class which reads from the .output2 file which contains band lmits
 
 __all__ = ['Output2Reader']
 
+import re
+import numpy as np
 from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.CompressedFile import open_file
 
 fmt = {
     # The line preceding the band ranges
     'band_range_header' : 'Bandranges (emin - emax):',
     # The start of the line containing the band energy limits
     'band_line_prefix' : 'band',
+    # The first line of each section of the file i.e.
+    # Bandranges (emin - emax):
+    # :NOE  : NUMBER OF ELECTRONS          =  16.000
+    # :FER  : F E R M I - ENERGY           =   0.74023
+    # 0 TOTAL CHARGE INSIDE SPHERE    1:   10.246207
+    # :QTL001: 0.5695 0.5716 8.8749 0.2030 0.0000 0.0000 0.0000 3.5914 ...
+    # :CHA  : TOTAL CHARGE INSIDE UNIT CELL =      23.801802
+    'sections' : [
+        ('band_ranges', r'[ \t]*Bandranges \(emin - emax\):'),
+        ('num_electrons', r':NOE\s'),
+        ('fermi_energy', r':FER\s'),
+        ('sphere_charge', r'0 TOTAL CHARGE INSIDE SPHERE'),
+        ('partial_charges', r':QTL\d+:'),
+        ('cell_charge', r':CHA\s'),
+    ],
+    # The sections end with the total charge in the unit cell, after which
+    # are only the charges of each band at each k point
+    'last_section' : 'cell_charge',
+    # The number of bytes scanned at a time when indexing
+    'block_size' : 2**16,
 }
+# Matches the newline before the first line of a section, starting with a
+# literal is much faster than anchoring each alternative with '^'
+fmt['section_line'] = re.compile('\n(?:%s)' % '|'.join(['(?P<%s>%s)' % x for x in fmt['sections']]))
 
 class Output2Reader(object):
-    '''A class which reads from the .output2 file which contains band lmits'''
+    '''A class which reads from the .output2 file which contains band lmits
+
+    The file is scanned once to find where each section begins, stopping
+    after the total charge in the unit cell, and each section is read by
+    seeking straight to it.
+
+    Results in,
+
+    band_limits:        A list of the (band number, emin, emax) of each band
+    section_offsets:    A dict of section name to a list of the byte offset
+                        of each line beginning the section
+    fermi_energy:       The Fermi energy (from :FER)
+    num_electrons:      The number of electrons (from :NOE)
+    sphere_charges:     The total charge inside each sphere
+    partial_charges:    A (num. atoms, num. characters) array of the partial
+                        charges (from :QTL)
+    cell_charge:        The total charge inside the unit cell (from :CHA)
+
+    EXAMPLE:
+
+    >>> output2_rdr = Output2Reader(TiC_output2_filename)
+    >>> len(output2_rdr.band_limits)
+    17
+    >>> output2_rdr.band_limits[0]
+    (1, -3.42715655101072, -3.41983569458544)
+    >>> output2_rdr.fermi_energy
+    0.74023
+    >>> output2_rdr.sphere_charges.tolist()
+    [10.246207, 6.746366]
+    >>> output2_rdr.partial_charges[1,:4].tolist()
+    [1.6855, 4.55, 0.4664, 0.0355]
+    >>> output2_rdr.cell_charge
+    23.801802
+    '''
     def __init__(self, filename):
         self.filename = filename
+        self._index_sections()
         self.band_limits = []
-        flag = {
-            'in_band_ranges' : False
-        }
-        file_handle = open(self.filename, 'r')
         line_num = 0
-        for line in file_handle:
+        for line in self._section_lines('band_ranges'):
             line_num = line_num + 1
-            if line.strip().startswith(fmt['band_range_header']):
-                flag['in_band_ranges'] = True
+            if line_num == 1:
                 continue
-            if flag['in_band_ranges'] == True:
-                if line.strip().startswith(fmt['band_line_prefix']):
-                    try:
-                        vals = [val.strip() for val in line.split(fmt['band_line_prefix'])[1].split(' ') if val.strip() != '']
-                        band_num = int(vals[0])
-                        band_min = float(vals[1])
-                        band_max = float(vals[2])
-                    except:
-                        raise UnexpectedFileFormat('Could not parse a band energy limits line from file (line: %d)' % line_num)
-                    # Make sure array is large enough to hold band number
-                    while len(self.band_limits) < band_num:
-                        self.band_limits.append(())
-                    self.band_limits[band_num-1] = (band_num, band_min, band_max)
-                else:
-                    flag['in_band_ranges'] == False
-        # TODO: Parse the rest
-        file_handle.close()
\ No newline at end of file
+            # The band ranges end with the first line which is not a band
+            if not line.strip().startswith(fmt['band_line_prefix']):
+                break
+            try:
+                vals = [val.strip() for val in line.split(fmt['band_line_prefix'])[1].split(' ') if val.strip() != '']
+                band_num = int(vals[0])
+                band_min = float(vals[1])
+                band_max = float(vals[2])
+            except:
+                raise UnexpectedFileFormat('Could not parse a band energy limits line from file (byte: %d)' % \
+                    self.section_offsets['band_ranges'][0])
+            # Make sure array is large enough to hold band number
+            while len(self.band_limits) < band_num:
+                self.band_limits.append(())
+            self.band_limits[band_num-1] = (band_num, band_min, band_max)
+
+    def _index_sections(self):
+        # Scans the file a block at a time for the first line of each
+        # section, stopping at the last section
+        self.section_offsets = {}
+        file_handle = open_file(self.filename)
+        # The text scanned begins with the newline ending the line before,
+        # for the first line pretend there is one
+        text_offset = -1
+        leftover = '\n'
+        while True:
+            block = file_handle.read(fmt['block_size'])
+            text = leftover + block
+            # Only scan up to the start of the last line, unless at the end
+            # of the file
+            end = len(text)
+            if block != '':
+                end = text.rfind('\n')
+            for match in fmt['section_line'].finditer(text, 0, end):
+                self.section_offsets.setdefault(match.lastgroup, []).append(text_offset + match.start() + 1)
+            if (block == '') or (fmt['last_section'] in self.section_offsets):
+                break
+            text_offset = text_offset + end
+            leftover = text[end:]
+        file_handle.close()
+
+    def _section_lines(self, name, num=0):
+        # Yields the lines from the start of a section to the end of the file
+        if name not in self.section_offsets:
+            return
+        file_handle = open_file(self.filename)
+        try:
+            file_handle.seek(self.section_offsets[name][num])
+            for line in iter(file_handle.readline, ''):
+                yield line
+        finally:
+            file_handle.close()
+
+    def _section_values(self, name):
+        # The numbers after the last ':' or '=' of every line beginning the
+        # section
+        values = []
+        for num in range(len(self.section_offsets.get(name, []))):
+            line = self._section_lines(name, num).next()
+            try:
+                values.append([float(x) for x in re.split('[:=]', line)[-1].split()])
+            except ValueError:
+                raise UnexpectedFileFormat('Could not parse the %s (byte: %d)' % \
+                    (name.replace('_', ' '), self.section_offsets[name][num]))
+        return values
+
+    def fermi_energy(self):
+        values = self._section_values('fermi_energy')
+        if len(values) == 0:
+            return None
+        return values[-1][0]
+    fermi_energy = property(fermi_energy)
+
+    def num_electrons(self):
+        values = self._section_values('num_electrons')
+        if len(values) == 0:
+            return None
+        return values[-1][0]
+    num_electrons = property(num_electrons)
+
+    def sphere_charges(self):
+        return np.array([x[0] for x in self._section_values('sphere_charge')])
+    sphere_charges = property(sphere_charges)
+
+    def partial_charges(self):
+        return np.array(self._section_values('partial_charges'))
+    partial_charges = property(partial_charges)
+
+    def cell_charge(self):
+        values = self._section_values('cell_charge')
+        if len(values) == 0:
+            return None
+        return values[-1][0]
+    cell_charge = property(cell_charge)
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    globs = {
+        'TiC_output2_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.output2'),
+        'Output2Reader' : Output2Reader,
+    }
+    doctest.testmod(globs=globs)
@@ -6,31 +6,56 @@ Reads from the .outputkgen file which contains symmetry matrices
 
 __all__ = ['OutputkgenReader']
 
+import os
 import numpy as np
 from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.ArrayCache import ArrayCache
+from wien2k.readers.KgenReader import KgenReader
+from wien2k.readers.FortranFormat import FortranFormat, line_bounds
+from wien2k.readers.CompressedFile import open_file
 from wien2k.SymMat import SymMat
 import wien2k.CONSTANTS as CNST
 
 fmt = {
     'ortho_line_num' : 1,
-    'r1_vector_line_num' : 2, 
+    'r1_vector_line_num' : 2,
     'iarb_line_num' : 5,
     'point_group_symmetries_line_num' : 6,
     'symmetry_matrix_header_line_startswith' : 'SYMMETRY MATRIX NR.',
     'rlvs_header_line_startswith' : 'G1        G2        G3',
     'length_rlvs_line_startswith' : 'length of reciprocal lattice vectors:',
-    'submesh_shift_line_startswith' : 'SUBMESH SHIFTED; SHIFT:',
+    # Either 'SUBMESH SHIFTED; SHIFT:' or 'SUBMESH NOT SHIFTED; SHIFT:'
+    'submesh_shift_line_startswith' : 'SUBMESH',
+    'submesh_shift_line_tag' : 'SHIFT:',
     'number_mesh_points_line_startswith' : 'NO. OF MESH POINTS IN THE BRILLOUIN ZONE =',
     'reciprocal_lattice_vector_intervals_line_startswith' : 'DIVISION OF RECIPROCAL LATTICE VECTORS (INTERVALS)=',
     'num_inequiv_k_points_line_startswith' : 'NO. OF INEQUIVALENT K-POINTS',
     'len_bloch_vector_line' : 74,
+    # Bloch vector lines hold two vectors i.e.
+    #     1(  0.000000  0.000000  0.000000)   2 (  0.076823  0.076823 -0.076823)
+    'bloch_vector_record' : FortranFormat("(2(I5,'(',3F10.6,')'))", names=[
+        'id_1', 'x_1', 'y_1', 'z_1', 'id_2', 'x_2', 'y_2', 'z_2',
+    ]),
     'tetrahedra_to_sort_line_startswith' : 'tetrahedra to sort:',
     'owork_line_startswith' : 'owork:',
     'number_different_tetrahedra_line_startwith' : 'NUMBER OF DIFFERENT TETRAHEDRA :',
     'number_k_points_div_afact_line_startswith' : 'NKP,NDIV,afact',
     'len_tretrahedra_point_line' : 85,
+    # The k points of the tetrahedral mesh, in units of the reciprocal
+    # lattice vector lengths and then multiplied by NDIV/afact i.e.
+    #      0.10000     0.10000    -0.10000                2.00000      2.00000     -2.00000
+    # These run to the end of the file
+    'tetrahedra_point_record' : FortranFormat('(3F12.5,10X,3F13.5)', names=[
+        'x', 'y', 'z', 'x_coord', 'y_coord', 'z_coord',
+    ]),
 }
 
+# The parsed values kept by the on-disk cache, and the version of them
+cached_arrays = ('rlvs', 'rlvs_by_2pi', 'rlvs_in_inv_angs', 'sym_mats', 'point_group_sym_mats',
+    'submesh_shift', 'mesh_divisions', 'bloch_vectors', 'num_mesh_points', 'num_tetrahedra',
+    'num_tetrahedra_k_points', 'afact', '_tetrahedra_points_offset')
+cache_version = 1
+
 class OutputkgenReader(object):
     '''
     A class which reads from the .outputkgen file which contains symmetry vectors
@@ -40,26 +65,136 @@ class OutputkgenReader(object):
     rlvs_by_2pi:        The reciprocal lattice vectors divided by 2pi
     rlvs_in_inv_ang:    The reciprocal lattice vectors in inverse Angstroms
     point_group_sym_mats: The points group symmetry matrices
-    bloch_vectors:
-    tetrahedra:
+    submesh_shift:      The shift of the k mesh (3 ints)
+    num_mesh_points:    The number of k points in the full Brillouin zone
+    mesh_divisions:     The divisions of each reciprocal lattice vector (3
+                        ints)
+    bloch_vectors:      The inequivalent k points as a (num. k points, 3)
+                        array
+    num_tetrahedra:     The number of different tetrahedra
+    afact:              The scaling of the tetrahedral mesh
+    tetrahedra_k_points: The k points of the tetrahedral mesh in units of
+                        the reciprocal lattice vector lengths as a (num. k
+                        points, 3) array
+    tetrahedra_k_point_coords: The same k points multiplied by NDIV/afact as
+                        an int32 array
+    tetrahedra:         The corners (k point ids counting from 1) of each
+                        tetrahedron as an int32 (num. tetrahedra, 4) array,
+                        read from the .kgen file by a KgenReader
+    tetrahedra_multiplicities: The number of times each tetrahedron occurs
+                        as an int32 array
+    tetrahedron_volume: The volume of a tetrahedron as a fraction of the
+                        Brillouin zone
+
+    The tetrahedra are only decoded when first used. The .kgen file is
+    found by replacing '.outputkgen' in 'filename', otherwise set
+    'kgen_filename'.
+
+    Set 'cache' to True to keep the parsed values in .npy files (in
+    'cache_dir' or next to the file) which are memory mapped when the file
+    is next read. The tetrahedra are cached by the KgenReader against the
+    .kgen file.
+
+    EXAMPLE:
+
+    >>> outputkgen_rdr = OutputkgenReader(TiC_outputkgen_filename)
+    >>> outputkgen_rdr.mesh_divisions.tolist()
+    [10, 10, 10]
+    >>> outputkgen_rdr.bloch_vectors.shape
+    (47, 3)
+    >>> outputkgen_rdr.tetrahedra_k_point_coords[1].tolist()
+    [2, 2, -2]
+    >>> outputkgen_rdr.tetrahedra.shape
+    (148, 4)
+    >>> int(outputkgen_rdr.tetrahedra_multiplicities.sum())
+    6000
     '''
 
-    def __init__(self, filename):
+    def __init__(self, filename, cache=False, cache_dir=None, kgen_filename=None):
         self.filename = filename
+        if (kgen_filename is None) and filename.endswith('.outputkgen'):
+            kgen_filename = filename[:-len('.outputkgen')] + '.kgen'
+        self.kgen_filename = kgen_filename
         self.rlvs = None
         self.rlvs_by_2pi = None
         self.rlvs_in_inv_angs = None
         self.sym_mats = []
         self.point_group_sym_mats = []
+        self.submesh_shift = None
+        self.num_mesh_points = None
+        self.mesh_divisions = None
         self.bloch_vectors = None
-        self.tetrahedra = None
-        self._load_values()
+        self.num_tetrahedra = None
+        self.num_tetrahedra_k_points = None
+        self.afact = None
+        self._tetrahedra_points_offset = None
+        self._tetrahedra_k_points = None
+        self._tetrahedra_k_point_coords = None
+        self._tetrahedra = None
+        self._tetrahedra_multiplicities = None
+        self._tetrahedron_volume = None
+        self._cache = cache
+        self._cache_dir = cache_dir
+        if cache == True:
+            array_cache = ArrayCache(filename, cache_dir=cache_dir, version=cache_version, names=cached_arrays)
+            arrays = array_cache.load()
+            if arrays is None:
+                self._load_values()
+                array_cache.save(self._cached_arrays())
+            else:
+                self._restore_cached_arrays(arrays)
+        else:
+            self._load_values()
+
+    def _cached_arrays(self):
+        # The parsed values as a dict of arrays for the on-disk cache. The
+        # tetrahedra k points are left to be decoded when first used and the
+        # tetrahedra are read from the .kgen file, so neither are included
+        arrays = {
+            'rlvs' : self.rlvs,
+            'rlvs_by_2pi' : self.rlvs_by_2pi,
+            'rlvs_in_inv_angs' : self.rlvs_in_inv_angs,
+            'sym_mats' : np.array([sm.matrix for sm in self.sym_mats]).reshape((-1,3,3)),
+            'point_group_sym_mats' : np.array([sm.matrix for sm in self.point_group_sym_mats]).reshape((-1,3,3)),
+            'submesh_shift' : self.submesh_shift,
+            'mesh_divisions' : self.mesh_divisions,
+            'bloch_vectors' : self.bloch_vectors,
+        }
+        for name in ('num_mesh_points', 'num_tetrahedra', 'num_tetrahedra_k_points', 'afact', '_tetrahedra_points_offset'):
+            if getattr(self, name) is not None:
+                arrays[name] = np.array(getattr(self, name))
+            else:
+                arrays[name] = None
+        return arrays
+
+    def _restore_cached_arrays(self, arrays):
+        for name in ('rlvs', 'rlvs_by_2pi', 'rlvs_in_inv_angs', 'submesh_shift', 'mesh_divisions', 'bloch_vectors'):
+            setattr(self, name, arrays[name])
+        for name in ('num_mesh_points', 'num_tetrahedra', 'num_tetrahedra_k_points', '_tetrahedra_points_offset'):
+            if arrays[name] is not None:
+                setattr(self, name, int(arrays[name]))
+        if arrays['afact'] is not None:
+            self.afact = float(arrays['afact'])
+        self.sym_mats = [SymMat(matrix=np.array(m)) for m in arrays['sym_mats']]
+        self.point_group_sym_mats = [SymMat(matrix=np.array(m)) for m in arrays['point_group_sym_mats']]
+
+    def _next_line(self):
+        # Returns the next line, keeping count of the line number and the
+        # offset into the file. Raises StopIteration at the end of the file
+        line = self._file_handle.next()
+        self._line_num = self._line_num + 1
+        self._offset = self._offset + len(line)
+        return line
 
     def _load_values(self):
-        self._file_handle = open(self.filename, 'r')
+        self._file_handle = open_file(self.filename)
         self._line_num = 0
-        for line in self._file_handle:
-            self._line_num = self._line_num + 1
+        self._offset = 0
+        while True:
+            try:
+                line = self._next_line()
+            except StopIteration:
+                break
             line = line.strip()
 
             if self._line_num == fmt['ortho_line_num']:
@@ -68,9 +203,8 @@ class OutputkgenReader(object):
 
             elif self._line_num == fmt['r1_vector_line_num']:
                 #TODO
-                line2 = self._file_handle.next()
-                line3 = self._file_handle.next()
-                self._line_num = self._line_num + 2
+                line2 = self._next_line()
+                line3 = self._next_line()
 
             elif self._line_num == fmt['iarb_line_num']:
                 #TODO
@@ -78,7 +212,7 @@ class OutputkgenReader(object):
 
             elif self._line_num == fmt['point_group_symmetries_line_num']:
                 #TODO read in number of point group symmetry matrices
-                self._file_handle.next() # Throw away a buffer line
+                self._next_line() # Throw away a buffer line
                 self.point_group_sym_mats.extend(self._read_sym_mats())
                 pass
 
@@ -88,9 +222,8 @@ class OutputkgenReader(object):
             elif line.startswith(fmt['rlvs_header_line_startswith']):
                 tmp_vectors = np.zeros((3,3))
                 for i in [0,1,2]:
-                    self._line_num = self._line_num + 1
                     try:
-                        line = self._file_handle.next()
+                        line = self._next_line()
                     except StopIteration:
                         raise UnexpectedFileFormat('Less than 3 lines were specified for the reciprocal lattice vectors (line: %d)' % self._line_num)
                     try:
@@ -99,7 +232,7 @@ class OutputkgenReader(object):
                         raise UnexpectedFileFormat('Could not parse reciprocal lattice vectors from line (line: %d)' % self._line_num)
                 # First set of reciprocal lattic vetors is followed by an
                 # identical set multiplied by 2*pi
-                if self.rlvs == None:
+                if self.rlvs is None:
                     self.rlvs = tmp_vectors.copy()
                     self.rlvs_in_inv_angs = self.rlvs * (2. * np.pi / CNST.BOHR_RADIUS_IN_ANGSTROM)
                 else:
@@ -109,22 +242,23 @@ class OutputkgenReader(object):
                 #TODO
                 pass
 
-            elif line.startswith(fmt['submesh_shift_line_startswith']):
-                #TODO
-                pass
+            elif line.startswith(fmt['submesh_shift_line_startswith']) and (fmt['submesh_shift_line_tag'] in line):
+                self.submesh_shift = np.array(self._parse_ints( \
+                    line.split(fmt['submesh_shift_line_tag'])[1], 3))
 
             elif line.startswith(fmt['number_mesh_points_line_startswith']):
-                #TODO
-                pass
+                self.num_mesh_points = self._parse_ints( \
+                    line[len(fmt['number_mesh_points_line_startswith']):], 1)[0]
 
             elif line.startswith(fmt['reciprocal_lattice_vector_intervals_line_startswith']):
-                #TODO
-                pass
+                self.mesh_divisions = np.array(self._parse_ints( \
+                    line[len(fmt['reciprocal_lattice_vector_intervals_line_startswith']):], 3))
 
             elif line.startswith(fmt['num_inequiv_k_points_line_startswith']):
-                #TODO
-                # fmt['len_bloch_vector_line']
-                pass
+                num_k_points = self._parse_ints( \
+                    line[len(fmt['num_inequiv_k_points_line_startswith']):], 1)[0]
+                self._next_line() # Throw away the 'INEQUIVALENT BLOCH VECTORS' line
+                self.bloch_vectors = self._read_bloch_vectors(num_k_points)
 
             elif line.startswith(fmt['tetrahedra_to_sort_line_startswith']):
                 #TODO
@@ -135,23 +269,117 @@ class OutputkgenReader(object):
                 pass
 
             elif line.startswith(fmt['number_different_tetrahedra_line_startwith']):
-                #TODO
-                pass
+                self.num_tetrahedra = self._parse_ints( \
+                    line[len(fmt['number_different_tetrahedra_line_startwith']):], 1)[0]
 
             elif line.startswith(fmt['number_k_points_div_afact_line_startswith']):
-                #TODO
-                #'len_tretrahedra_point_line' : 85,
-                pass
+                # NDIV is the same as the mesh divisions
+                self.num_tetrahedra_k_points = self._parse_ints( \
+                    line[len(fmt['number_k_points_div_afact_line_startswith']):], 4)[0]
+                try:
+                    self.afact = float(self._next_line())
+                except (StopIteration, ValueError):
+                    raise UnexpectedFileFormat('Could not parse afact (line: %d)' % self._line_num)
+                # The k points of the tetrahedral mesh run to the end of the
+                # file, they are decoded when first used
+                self._tetrahedra_points_offset = self._offset
+                break
 
         self._file_handle.close()
 
+    def _parse_ints(self, text, num_vals):
+        try:
+            vals = [int(x) for x in text.split()]
+        except ValueError:
+            vals = []
+        if len(vals) != num_vals:
+            raise UnexpectedFileFormat('Expected %d integers (line: %d)' % (num_vals, self._line_num))
+        return vals
+
+    def _read_bloch_vectors(self, num_k_points):
+        # Reads the lines of Bloch vectors (two to a line) and decodes them
+        # in one go
+        lines = []
+        for i in range((num_k_points + 1) // 2):
+            try:
+                lines.append(self._next_line().rstrip('\r\n'))
+            except StopIteration:
+                raise UnexpectedFileFormat('Fewer Bloch vectors than inequivalent k points (line: %d)' % self._line_num)
+        try:
+            records = fmt['bloch_vector_record'].decode_lines(lines)
+        except ValueError:
+            raise UnexpectedFileFormat('Could not parse the Bloch vectors (line: %d)' % self._line_num)
+        ids = np.column_stack([records['id_1'], records['id_2']]).ravel()[:num_k_points]
+        if np.any(ids != np.arange(1, num_k_points + 1)):
+            raise UnexpectedFileFormat('The Bloch vectors are not numbered in order (line: %d)' % self._line_num)
+        vectors = np.column_stack([records[name] for name in ('x_1', 'y_1', 'z_1', 'x_2', 'y_2', 'z_2')])
+        return vectors.reshape((-1,3))[:num_k_points]
+
+    def _load_tetrahedra_k_points(self):
+        # Decodes the k points of the tetrahedral mesh from the end of the
+        # file
+        if self._tetrahedra_points_offset is None:
+            return
+        file_handle = open_file(self.filename)
+        file_handle.seek(self._tetrahedra_points_offset)
+        buf = np.frombuffer(file_handle.read(), dtype=np.uint8)
+        file_handle.close()
+        starts, lengths = line_bounds(buf)
+        num_k_points = self.num_tetrahedra_k_points
+        if len(starts) < num_k_points:
+            raise UnexpectedFileFormat('Fewer tetrahedra k points than NKP in file %s' % self.filename)
+        try:
+            records = fmt['tetrahedra_point_record'].decode(buf, starts[:num_k_points], lengths[:num_k_points])
+        except ValueError:
+            raise UnexpectedFileFormat('Could not parse the tetrahedra k points in file %s' % self.filename)
+        self._tetrahedra_k_points = np.column_stack([records['x'], records['y'], records['z']])
+        self._tetrahedra_k_point_coords = np.column_stack( \
+            [records['x_coord'], records['y_coord'], records['z_coord']]).round().astype(np.int32)
+
+    def _load_tetrahedra(self):
+        if (self.kgen_filename is None) or not os.path.exists(self.kgen_filename):
+            return
+        kgen_rdr = KgenReader(self.kgen_filename, cache=self._cache, cache_dir=self._cache_dir)
+        self._tetrahedron_volume = kgen_rdr.volume
+        self._tetrahedra_multiplicities = kgen_rdr.multiplicities
+        self._tetrahedra = kgen_rdr.tetrahedra
+
+    def tetrahedra_k_points(self):
+        if self._tetrahedra_k_points is None:
+            self._load_tetrahedra_k_points()
+        return self._tetrahedra_k_points
+    tetrahedra_k_points = property(tetrahedra_k_points)
+
+    def tetrahedra_k_point_coords(self):
+        if self._tetrahedra_k_point_coords is None:
+            self._load_tetrahedra_k_points()
+        return self._tetrahedra_k_point_coords
+    tetrahedra_k_point_coords = property(tetrahedra_k_point_coords)
+
+    def tetrahedra(self):
+        if self._tetrahedra is None:
+            self._load_tetrahedra()
+        return self._tetrahedra
+    tetrahedra = property(tetrahedra)
+
+    def tetrahedra_multiplicities(self):
+        if self._tetrahedra_multiplicities is None:
+            self._load_tetrahedra()
+        return self._tetrahedra_multiplicities
+    tetrahedra_multiplicities = property(tetrahedra_multiplicities)
+
+    def tetrahedron_volume(self):
+        if self._tetrahedron_volume is None:
+            self._load_tetrahedra()
+        return self._tetrahedron_volume
+    tetrahedron_volume = property(tetrahedron_volume)
+
     def _read_sym_mats(self):
         tmp_matrices = []
         # Read the matrices off the next three lines into a buffer
         for i in [1,2,3]:
             try:
-                line = self._file_handle.next()
-                self._line_num = self._line_num + 1
+                line = self._next_line()
             except StopIteration:
                 raise UnexpectedFileFormat( \
                     'Symmetry matrices do not span 3 lines (line: %d)' % self._line_num)
@@ -171,3 +399,14 @@ class OutputkgenReader(object):
             else:
                 returned_matrices.append(SymMat(matrix = tmp_matrix))
         return returned_matrices
+
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    globs = {
+        'TiC_outputkgen_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.outputkgen'),
+        'OutputkgenReader' : OutputkgenReader,
+    }
+    doctest.testmod(globs=globs)
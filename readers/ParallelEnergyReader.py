@@ -0,0 +1,157 @@
+'''
+ParallelEnergyReader.py
+
+A class for reading the .energy_1 ... .energy_N files written by a k point
+parallel run of lapw1
+'''
+
+__all__ = ['ParallelEnergyReader']
+
+import os
+import multiprocessing
+import numpy as np
+from wien2k.Band import Band
+from wien2k.readers.EnergyReader import _read_energy_file, _iter_energy_blocks
+
+class ParallelEnergyReader(object):
+    '''Reads the set of .energy files written by a k point parallel lapw1 run
+    and merges them into one set of bands
+
+    The files are found by appending '_1', '_2' ... to the filename (i.e.
+    'TiC.energy' finds 'TiC.energy_1', 'TiC.energy_2' ... and 'TiC.energyup'
+    finds 'TiC.energyup_1' ...) and are read concurrently in a pool of
+    processes. If none are found the file itself is read.
+
+    Parameters,
+
+    filename:               The filename of the .energy(so|up|dn) file
+                            without the '_N' suffix
+    spin_orb_dirn:          If is a spin orbit calculation, specify either 'up' or 'down' - default: None
+    num_processes:          The number of processes used to read the files,
+                            by default the number of CPUs - default: None
+
+    Results in,
+
+    bands:                  A list of Band objects of the merged bands
+    k_points:               An Nx4 array of id, i, j, k values, one row per k point
+    weights:                The weight of each k point
+    num_plane_waves:        The number of plane waves (plus local orbitals) at each k point
+    num_bands:              The number of bands (NE) written at each k point
+    energies:               An (n_kpoints, n_bands) array of energies,
+                            bands not present at a k point are NaN
+    shard_filenames:        The files read, in order
+    shard_k_point_nums:     The number of k points read from each file
+
+    The k points are in the order of the files and are renumbered 1 ... N
+    if their ids are not unique across the files. Every file is read
+    whole, so unlike EnergyReader the bands cannot be read lazily or
+    cached.
+
+    EXAMPLE:
+
+    >>> energy_rdr = ParallelEnergyReader(TiC_energy_filename)
+    >>> [os.path.basename(x) for x in energy_rdr.shard_filenames]
+    ['TiC.energy_1', 'TiC.energy_2']
+    >>> energy_rdr.energies.shape
+    (47, 17)
+    >>> (energy_rdr.bands[6].data == EnergyReader(TiC_whole_energy_filename).bands[6].data).all()
+    True
+    '''
+    def __init__(self, filename, spin_orb_dirn=None, num_processes=None):
+        self.filename = filename
+        self.spin_orb_dirn = spin_orb_dirn
+        self.shard_filenames = find_shards(filename)
+        if len(self.shard_filenames) == 0:
+            self.shard_filenames = [filename]
+        if (len(self.shard_filenames) == 1) or (num_processes == 1):
+            shards = [_read_energy_file(x) for x in self.shard_filenames]
+        else:
+            pool = multiprocessing.Pool(processes=num_processes)
+            try:
+                shards = pool.map(_read_energy_file, self.shard_filenames)
+            finally:
+                pool.close()
+                pool.join()
+        self._merge_shards(shards)
+        # Now cast into Band objects
+        self.bands = []
+        for i in range(self.energies.shape[1]):
+            self.bands.append(Band(id=i+1, data=self._band_data(i)))
+
+    def _merge_shards(self, shards):
+        # Stacks the values read from each file into one set
+        k_points, weights, num_plane_waves, num_bands, energies = zip(*shards)
+        self.shard_k_point_nums = [len(x) for x in k_points]
+        self.k_points = np.concatenate(k_points)
+        self.weights = np.concatenate(weights)
+        self.num_plane_waves = np.concatenate(num_plane_waves)
+        self.num_bands = np.concatenate(num_bands)
+        # Pad each files energies to the largest number of bands
+        self.energies = np.empty((len(self.k_points), max([x.shape[1] for x in energies])))
+        self.energies.fill(np.nan)
+        first_k_point = 0
+        for shard_energies in energies:
+            last_k_point = first_k_point + len(shard_energies)
+            self.energies[first_k_point:last_k_point, :shard_energies.shape[1]] = shard_energies
+            first_k_point = last_k_point
+        if len(np.unique(self.k_points[:,0])) != len(self.k_points):
+            self.k_points[:,0] = np.arange(1, len(self.k_points) + 1)
+
+    def _band_data(self, band_num):
+        # Builds the Nx5 id, i, j, k, energy array for a single band from the
+        # k points at which it exists
+        band_energies = self.energies[:,band_num]
+        present = ~np.isnan(band_energies)
+        return np.column_stack((self.k_points[present], band_energies[present]))
+
+    def iter_kpoints(self, chunk_size=1000, block_size=2**22):
+        '''
+        As EnergyReader.iter_kpoints, reading each of the files in turn. The
+        k point ids are those of the merged set.
+        '''
+        num_bands = self.energies.shape[1]
+        first_k_point = 0
+        for shard_filename in self.shard_filenames:
+            for k_points, weights, energies in _iter_energy_blocks(shard_filename, \
+                    num_bands, chunk_size, block_size):
+                last_k_point = first_k_point + len(k_points)
+                k_points[:,0] = self.k_points[first_k_point:last_k_point,0]
+                first_k_point = last_k_point
+                yield (k_points, weights, energies)
+
+
+def find_shards(filename):
+    '''Returns the filename_1, filename_2 ... files that exist, in numerical
+    order'''
+    directory, basename = os.path.split(filename)
+    shards = []
+    for name in os.listdir(directory or os.curdir):
+        suffix = name[len(basename) + 1:]
+        if name.startswith(basename + '_') and suffix.isdigit():
+            shards.append((int(suffix), os.path.join(directory, name)))
+    shards.sort()
+    return [x[1] for x in shards]
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    import shutil
+    import tempfile
+    # Split TiC.energy into two files as written by a k point parallel run
+    tmp_dir = tempfile.mkdtemp()
+    TiC_energy_filename = os.path.join(tmp_dir, 'TiC.energy')
+    from wien2k.readers.EnergyReader import EnergyReader
+    TiC_whole_energy_filename = os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.energy')
+    lines = open(TiC_whole_energy_filename).readlines()
+    split_at = [i for i, line in enumerate(lines) if len(line) == 88][24]
+    open(TiC_energy_filename + '_1', 'w').writelines(lines[:split_at])
+    open(TiC_energy_filename + '_2', 'w').writelines(lines[:4] + lines[split_at:])
+    globs = {
+        'TiC_energy_filename' : TiC_energy_filename,
+        'TiC_whole_energy_filename' : TiC_whole_energy_filename,
+        'ParallelEnergyReader' : ParallelEnergyReader,
+        'EnergyReader' : EnergyReader,
+        'os' : os,
+    }
+    doctest.testmod(globs=globs)
+    shutil.rmtree(tmp_dir)
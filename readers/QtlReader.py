@@ -0,0 +1,285 @@
+'''
+QtlReader.py
+
+A class for reading the partial charges in WIEN2k .qtl files
+'''
+
+__all__ = ['QtlReader']
+
+import os
+import re
+import numpy as np
+from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.FortranFormat import FortranFormat
+from wien2k.readers.CompressedFile import map_file, read_array
+
+fmt = {
+    # The title is followed by a blank line and then,
+    #  LATTICE CONST.=  8.1787  8.1787  8.1787   FERMI ENERGY=   0.74023
+    'lattice_line' : re.compile(r'''
+        LATTICE\ CONST\.=\s*(\S+)\s+(\S+)\s+(\S+)   # a, b, c
+        \s+FERMI\ ENERGY=\s*(\S+)                   # Fermi energy in Ry
+    ''', re.VERBOSE),
+    #   134 < NMAT <  155   SPIN=1   NAT=  2      SO 0
+    'nmat_line' : re.compile(r'SPIN=\s*(\d+)\s+NAT=\s*(\d+)'),
+    # A line for each inequivalent atom naming the characters written i.e.
+    #  JATOM  1  MULT= 1  ISPLIT= 2  tot,0,1,2,D-eg,D-t2g,3
+    'jatom_line' : re.compile(r'''
+        JATOM\s*(\d+)           # Atom number
+        \s+MULT=\s*(\d+)        # Multiplicity
+        \s+ISPLIT=\s*(-?\d+)    # How the characters are split
+        \s+(\S+)                # Comma separated names of the characters
+    ''', re.VERBOSE),
+    # Each band begins with
+    #  BAND:   1
+    'band_line_start' : b' BAND:',
+    'band_record' : FortranFormat('(6X,I4)', names=['band']),
+    # then for each k point there is a line for each atom and then the
+    # interstitial (numbered NAT+1) giving the energy, the total charge and
+    # the characters i.e.
+    #    0.02944  1 0.13321    0.00000 0.02258 0.10834 0.10834 0.00000 0.00189
+    #    0.02944  3 0.23321
+    # Guess a format statement of
+    # FORMAT(F10.5,I3,F8.5,3X,...F8.5)
+    'character_line_start' : ['F10.5', 'I3'],
+    'character_field' : 'F8.5',
+    'character_field_width' : 8,
+    'character_gap' : '3X',         # Between the total and the other characters
+    'interstitial_labels' : ['tot'],
+}
+
+class QtlReader(object):
+    '''
+    Reads the partial charges of each band at each k point from a WIEN2k
+    .qtl file into one array
+
+    Every band is written with the same lines, so the layout of the file
+    is worked out from the first band and only the band headers and the
+    lines of the bands and atoms asked for are read from the memory mapped
+    file. Of those only the characters asked for are decoded, so memory is
+    bounded by the selection rather than the file size. Compressed files
+    are read as map_file does, a band at a time.
+
+    Parameters,
+
+    filename:           The .qtl file to read
+    bands:              A list of band numbers (as in 'BAND:') to read -
+                        default: all
+    atoms:              A list of atom numbers (JATOM) to read, NAT+1 is the
+                        interstitial - default: all including the interstitial
+    channels:           A list of indexes into the character labels to read,
+                        0 is the total charge - default: all
+    in_memory:          If True a compressed file is decompressed into
+                        memory rather than as it is read - default: False
+
+    Results in,
+
+    title:              The title of the case
+    lattice_constants:  The a, b and c lattice constants
+    fermi_energy:       The Fermi energy in Ry
+    spin:               The spin (1 or 2)
+    num_atoms:          The number of inequivalent atoms (NAT)
+    multiplicities:     The multiplicity of each atom
+    isplits:            The ISPLIT of each atom
+    channel_labels:     A list of the character labels of each atom i.e.
+                        ['tot', '0', '1', '2', 'D-eg', 'D-t2g', '3'], the
+                        last is the interstitial
+    band_ids:           The band numbers read
+    atom_ids:           The atom numbers read
+    channel_ids:        The character indexes read
+    energies:           A (band, k point) array of the band energies
+    data:               A float32 (band, k point, atom, channel) array of
+                        the partial charges, characters an atom does not
+                        have are NaN
+
+    EXAMPLE:
+
+    >>> qtl_rdr = QtlReader(TiC_qtl_filename)
+    >>> qtl_rdr.data.shape
+    (11, 111, 3, 7)
+    >>> qtl_rdr.channel_labels[0]
+    ['tot', '0', '1', '2', 'D-eg', 'D-t2g', '3']
+    >>> float(qtl_rdr.data[0,0,0,3])
+    0.10834000259637833
+
+    Reading the total and d characters of the second atom in two bands
+
+    >>> d_rdr = QtlReader(TiC_qtl_filename, bands=[1, 3], atoms=[2], channels=[0, 3])
+    >>> d_rdr.data.shape
+    (2, 111, 1, 2)
+    >>> (d_rdr.data[1] == qtl_rdr.data[2][:,[1]][:,:,[0,3]]).all()
+    True
+    '''
+    def __init__(self, filename, bands=None, atoms=None, channels=None, in_memory=False):
+        self.filename = filename
+        self._load_values(bands, atoms, channels, in_memory)
+
+    def _load_values(self, bands, atoms, channels, in_memory):
+        if os.path.getsize(self.filename) == 0:
+            raise UnexpectedFileFormat('The .qtl file is empty (line: 1)')
+        mapped = map_file(self.filename, in_memory=in_memory)
+        first_band = mapped.find(b'\n' + fmt['band_line_start']) + 1
+        if first_band == 0:
+            raise UnexpectedFileFormat('No bands were found in the .qtl file (line: %d)' % \
+                (mapped[:].count(b'\n') + 1))
+        header_lines = mapped[:first_band].splitlines()
+        self._read_header(header_lines)
+
+        # Every band has a line for each atom and the interstitial at every
+        # k point, each atom's line always the same width
+        num_lines_per_k_point = self.num_atoms + 1
+        band_line_length = mapped.find(b'\n', first_band) + 1 - first_band
+        line_starts = [first_band + band_line_length]
+        for i in range(num_lines_per_k_point):
+            line_end = mapped.find(b'\n', line_starts[-1])
+            if line_end < 0:
+                raise UnexpectedFileFormat('Expected a line for each atom and the interstitial (line: %d)' % \
+                    (len(header_lines) + i + 2))
+            line_starts.append(line_end + 1)
+        line_starts = np.array(line_starts)
+        line_widths = np.diff(line_starts)
+        k_point_length = line_starts[-1] - line_starts[0]
+        second_band = mapped.find(b'\n' + fmt['band_line_start'], first_band) + 1
+        band_length = (second_band if second_band > 0 else len(mapped)) - first_band
+        num_k_points = (band_length - band_line_length) // k_point_length
+        if num_k_points * k_point_length + band_line_length != band_length:
+            raise UnexpectedFileFormat('The lines of an atom are not all the same width (line: %d)' % \
+                (len(header_lines) + 1))
+        band_line_num = lambda index: len(header_lines) + 1 + index * (1 + num_k_points * num_lines_per_k_point)
+
+        # Work out what to read from the band lines where each band should be
+        if bands is None:
+            bands = []
+            while True:
+                band = self._band_id(mapped, first_band + len(bands) * band_length, band_line_length, \
+                    band_line_num(len(bands)))
+                if band is None:
+                    break
+                bands.append(band)
+            band_indexes = range(len(bands))
+        else:
+            # Bands are numbered in order
+            first_band_id = self._band_id(mapped, first_band, band_line_length, band_line_num(0))
+            band_indexes = []
+            for band in bands:
+                index = band - first_band_id
+                found = None
+                if index >= 0:
+                    found = self._band_id(mapped, first_band + index * band_length, band_line_length, \
+                        band_line_num(index))
+                if found is None:
+                    raise ValueError('Band %d is not in the .qtl file' % band)
+                if found != band:
+                    raise UnexpectedFileFormat('Expected band %d (line: %d)' % (band, band_line_num(index)))
+                band_indexes.append(index)
+        if atoms is None:
+            atoms = range(1, num_lines_per_k_point + 1)
+        for atom in atoms:
+            if (atom < 1) or (atom > num_lines_per_k_point):
+                raise ValueError('Atom %d is not in the .qtl file' % atom)
+        num_channels = max([len(labels) for labels in self.channel_labels])
+        if channels is None:
+            channels = range(num_channels)
+        self.band_ids = np.array(bands, dtype=int)
+        self.atom_ids = np.array(atoms, dtype=int)
+        self.channel_ids = np.array(channels, dtype=int)
+
+        # Decode the lines of the atoms selected a band at a time, in the
+        # order of the file
+        line_starts = (k_point_length * np.arange(num_k_points).reshape((-1,1)) + \
+            (line_starts[self.atom_ids - 1] - line_starts[0])).ravel()
+        line_widths = np.tile(line_widths[self.atom_ids - 1], num_k_points)
+        record_fmt = _character_format(self.channel_ids)
+        records = [None] * len(band_indexes)
+        for i in np.argsort(band_indexes, kind='mergesort'):
+            buf = read_array(mapped, first_band + band_indexes[i] * band_length + band_line_length, \
+                band_length - band_line_length)
+            try:
+                records[i] = record_fmt.decode(buf, line_starts, line_widths)
+            except ValueError:
+                raise UnexpectedFileFormat('Could not parse the characters (line: %d)' % \
+                    (band_line_num(band_indexes[i]) + 1))
+        shape = (len(band_indexes), num_k_points, len(self.atom_ids))
+        records = np.concatenate(records) if len(records) > 0 else record_fmt.decode(np.zeros(0, dtype=np.uint8), [], [])
+        bad = np.argwhere(records['atom'].reshape(shape) != self.atom_ids)
+        if len(bad) > 0:
+            band, k_point, atom = bad[0]
+            raise UnexpectedFileFormat('Unexpected atom number (line: %d)' % \
+                (band_line_num(band_indexes[band]) + k_point * num_lines_per_k_point + self.atom_ids[atom]))
+        self.energies = records['energy'].reshape(shape)[:,:,0]
+        self.data = np.empty(shape + (len(self.channel_ids),), dtype=np.float32)
+        for i, channel in enumerate(self.channel_ids):
+            self.data[:,:,:,i] = records['c%d' % channel].reshape(shape)
+        # Characters an atom does not have are not a number
+        for i, atom in enumerate(self.atom_ids):
+            self.data[:,:,i,self.channel_ids >= len(self.channel_labels[atom-1])] = np.nan
+
+    def _band_id(self, mapped, offset, length, line_num):
+        # The number of the band whose line starts at 'offset', None at the
+        # end of the file
+        line = mapped[offset:offset+length]
+        if len(line.strip()) == 0:
+            return None
+        if not line.startswith(fmt['band_line_start']):
+            raise UnexpectedFileFormat('Expected a band (line: %d)' % line_num)
+        return int(fmt['band_record'].decode_lines([line.rstrip()])['band'][0])
+
+    def _read_header(self, lines):
+        # Reads the lines before the first band
+        self.title = lines[0].strip()
+        self.lattice_constants = None
+        self.fermi_energy = None
+        self.spin = None
+        self.num_atoms = None
+        self.multiplicities = []
+        self.isplits = []
+        self.channel_labels = []
+        for line_num, line in enumerate(lines):
+            lattice_match = fmt['lattice_line'].search(line)
+            nmat_match = fmt['nmat_line'].search(line)
+            jatom_match = fmt['jatom_line'].search(line)
+            try:
+                if lattice_match is not None:
+                    self.lattice_constants = np.array([float(x) for x in lattice_match.groups()[:3]])
+                    self.fermi_energy = float(lattice_match.group(4))
+                elif nmat_match is not None:
+                    self.spin = int(nmat_match.group(1))
+                    self.num_atoms = int(nmat_match.group(2))
+                elif jatom_match is not None:
+                    self.multiplicities.append(int(jatom_match.group(2)))
+                    self.isplits.append(int(jatom_match.group(3)))
+                    self.channel_labels.append(jatom_match.group(4).split(','))
+            except ValueError:
+                raise UnexpectedFileFormat('Could not parse the header (line: %d)' % (line_num + 1))
+        if self.num_atoms is None:
+            raise UnexpectedFileFormat('NAT was not found in the header (line: %d)' % len(lines))
+        if len(self.channel_labels) != self.num_atoms:
+            raise UnexpectedFileFormat('Expected a JATOM line for each of the %d atoms (line: %d)' % \
+                (self.num_atoms, len(lines)))
+        self.channel_labels.append(list(fmt['interstitial_labels']))
+
+
+def _character_format(channels):
+    # A format which decodes the energy, the atom and only the given
+    # characters of a line, skipping the others
+    items = list(fmt['character_line_start'])
+    names = ['energy', 'atom']
+    for channel in range(max(channels) + 1):
+        if channel == 1:
+            items.append(fmt['character_gap'])
+        if channel in channels:
+            items.append(fmt['character_field'])
+            names.append('c%d' % channel)
+        else:
+            items.append('%dX' % fmt['character_field_width'])
+    return FortranFormat('(%s)' % ','.join(items), names=names)
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    globs = {
+        'TiC_qtl_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.qtl'),
+        'QtlReader' : QtlReader,
+    }
+    doctest.testmod(globs=globs)
@@ -0,0 +1,94 @@
+'''
+RhoReader.py
+
+A class for reading the densities on a plane in the WIEN2k .rho files
+written by lapw5
+'''
+
+__all__ = ['RhoReader']
+
+import numpy as np
+from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.FortranFormat import FortranFormat, line_bounds
+from wien2k.readers.CompressedFile import read_file
+
+# See the WRITE(21,...) statements in SRC_lapw5/main.f
+fmt = {
+    # The number of points along and the lengths of the x and y directions
+    #   100  100   8.17874   8.17874
+    # FORMAT(2I5,2F10.5)
+    'header_record' : FortranFormat('(2I5,2F10.5)', names=['nx', 'ny', 'x_length', 'y_length']),
+    # then the NY values at each x point, each starting on a new line,
+    #   0.19445297E+00  0.19502925E+00  0.19675936E+00  0.19964666E+00  0.20369532E+00
+    # FORMAT(5E16.8)
+    'value_record' : FortranFormat('(5E16.8)'),
+}
+
+class RhoReader(object):
+    '''
+    Reads the density (or difference density) on a plane from a WIEN2k .rho
+    file
+
+    All the values are decoded in one go rather than line by line.
+
+    Results in,
+
+    nx, ny:             The number of points in the x and y directions
+    x_length, y_length: The lengths of the x and y directions
+    x, y:               The coordinates of the points along each direction
+    data:               An (nx, ny) array of the values
+
+    EXAMPLE:
+
+    >>> rho_rdr = RhoReader(TiC_rho_filename)
+    >>> rho_rdr.data.shape
+    (100, 100)
+    >>> rho_rdr.x_length, rho_rdr.x[-1]
+    (8.17874, 8.17874)
+    >>> rho_rdr.data[0,:2].tolist()
+    [0.19445297, 0.19502925]
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._load_values()
+
+    def _load_values(self):
+        buf = np.frombuffer(read_file(self.filename), dtype=np.uint8)
+        starts, lengths = line_bounds(buf)
+        if len(starts) == 0:
+            raise UnexpectedFileFormat('The .rho file is empty (line: 1)')
+        try:
+            header = fmt['header_record'].decode(buf, starts[:1], lengths[:1])[0]
+        except ValueError:
+            raise UnexpectedFileFormat('Could not parse the grid size (line: 1)')
+        self.nx = int(header['nx'])
+        self.ny = int(header['ny'])
+        self.x_length = float(header['x_length'])
+        self.y_length = float(header['y_length'])
+        self.x = np.linspace(0.0, self.x_length, self.nx)
+        self.y = np.linspace(0.0, self.y_length, self.ny)
+        # Each x point starts on a new line so the last line of each may be
+        # short
+        value_fmt = fmt['value_record']
+        num_vals_per_line = len(value_fmt.fields)
+        num_lines_per_row = -(-self.ny // num_vals_per_line)
+        num_lines = self.nx * num_lines_per_row
+        if len(starts) - 1 < num_lines:
+            raise UnexpectedFileFormat('Expected %d lines of values (line: %d)' % (num_lines, len(starts) + 1))
+        try:
+            records = value_fmt.decode(buf, starts[1:num_lines+1], lengths[1:num_lines+1])
+        except ValueError:
+            raise UnexpectedFileFormat('Could not parse the values (line: 2)')
+        values = records.view(np.float64).reshape((self.nx, -1))
+        self.data = values[:,:self.ny]
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    globs = {
+        'TiC_rho_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.rho'),
+        'RhoReader' : RhoReader,
+    }
+    doctest.testmod(globs=globs)
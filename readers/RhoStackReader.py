@@ -0,0 +1,72 @@
+'''
+RhoStackReader.py
+
+A class for reading a stack of .rho planes into one array
+'''
+
+__all__ = ['RhoStackReader']
+
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from wien2k.readers.RhoReader import RhoReader
+
+class RhoStackReader(object):
+    '''
+    Reads several .rho files on the same grid (i.e. parallel planes through
+    a cell) concurrently in a pool of threads into one array
+
+    Parameters,
+
+    filenames:          The .rho files, in the order they are stacked
+    num_threads:        The number of threads used to read the files, by
+                        default the number of CPUs - default: None
+
+    Results in,
+
+    readers:            The RhoReader of each file
+    nx, ny:             The number of points in the x and y directions
+    x, y:               The coordinates of the points along each direction
+    data:               An (n_files, nx, ny) array of the values
+
+    EXAMPLE:
+
+    >>> rho_rdr = RhoStackReader([TiC_rho_filename, TiC_rho_filename])
+    >>> rho_rdr.data.shape
+    (2, 100, 100)
+    >>> (rho_rdr.data[1] == rho_rdr.readers[0].data).all()
+    True
+    '''
+    def __init__(self, filenames, num_threads=None):
+        self.filenames = list(filenames)
+        if len(self.filenames) == 0:
+            raise ValueError('No .rho files were given')
+        if (len(self.filenames) == 1) or (num_threads == 1):
+            self.readers = [RhoReader(x) for x in self.filenames]
+        else:
+            pool = ThreadPool(processes=num_threads)
+            try:
+                self.readers = pool.map(RhoReader, self.filenames)
+            finally:
+                pool.close()
+                pool.join()
+        first_rdr = self.readers[0]
+        for filename, rho_rdr in zip(self.filenames, self.readers):
+            if (rho_rdr.nx, rho_rdr.ny, rho_rdr.x_length, rho_rdr.y_length) != \
+                    (first_rdr.nx, first_rdr.ny, first_rdr.x_length, first_rdr.y_length):
+                raise ValueError('%s is not on the same grid as %s' % (filename, self.filenames[0]))
+        self.nx = first_rdr.nx
+        self.ny = first_rdr.ny
+        self.x = first_rdr.x
+        self.y = first_rdr.y
+        self.data = np.array([x.data for x in self.readers])
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    globs = {
+        'TiC_rho_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.rho'),
+        'RhoStackReader' : RhoStackReader,
+    }
+    doctest.testmod(globs=globs)
@@ -6,6 +6,7 @@ Reads a WIEN2k .scf2 file into an object
 __all__ = ['Scf2Reader']
 
 from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.CompressedFile import open_file
 
 fermi_energy_line_startswith = ':FER'
 
@@ -18,7 +19,7 @@ class Scf2Reader(object):
     def __init__(self, filename):
         self.filename = filename
         self.fermi_energy = None
-        file_handle = open(self.filename, 'r')
+        file_handle = open_file(self.filename)
         line_num = 0
         for line in file_handle:
             line_num = line_num + 1
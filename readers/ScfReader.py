@@ -0,0 +1,163 @@
+'''
+ScfReader.py
+
+A class for reading the history of every labelled line in a WIEN2k .scf
+file
+'''
+
+__all__ = ['ScfReader']
+
+import os
+import re
+import numpy as np
+from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.CompressedFile import compression, open_file
+
+fmt = {
+    # The lines of interest begin with a label i.e.
+    # :FER  : F E R M I - ENERGY(TETRAH.M.)=   0.71116
+    # :DIS  :  CHARGE DISTANCE       0.8521949
+    # :CHA001: TOTAL CHARGE INSIDE SPHERE   1 =     9.062116
+    'label_line' : re.compile(r'^:([A-Z]+[0-9]*)', re.MULTILINE),
+    # Each iteration begins with
+    # :ITE001:  1. ITERATION
+    'iteration_label' : 'ITE',
+    # The numbers on a labelled line, not those in words like 'v0c' and with
+    # FORTRAN D exponents
+    'number' : re.compile(r'(?<![A-Za-z0-9_.])[-+]?(?:\d+\.?\d*|\.\d+)(?:[EeDd][-+]?\d+)?'),
+}
+
+class ScfReader(object):
+    '''
+    Indexes the labelled lines (':ENE', ':DIS', ':FER' ...) of a WIEN2k
+    .scf file so the history of any of them can be read
+
+    The file is indexed in one pass when read. Call refresh() to index the
+    lines written since, i.e. when polling a running calculation, which
+    reads only the new bytes. Only whole lines are indexed so a line being
+    written is picked up by the next refresh.
+
+    Results in,
+
+    index:          A dict of label (without the colons i.e. 'FER', 'CHA001')
+                    to a list of the (iteration, byte offset) of each line
+                    with the label
+    num_iterations: The number of the last iteration begun (:ITE), 0 before
+                    the first
+    labels:         The labels found, sorted
+
+    EXAMPLE:
+
+    >>> scf_rdr = ScfReader(TiC_scf_filename)
+    >>> scf_rdr.num_iterations
+    11
+    >>> scf_rdr.history(':ENE')[[0,-1]].tolist()
+    [-1784.124298, -1783.961348]
+    >>> scf_rdr.history('FER')[-1]
+    0.73293
+    >>> scf_rdr.iterations('DIS').tolist()
+    [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+
+    Lines with more than one number give all of them when 'field' is None
+
+    >>> scf_rdr.history('BAND', field=None)[0].tolist()
+    [1.0, -3.251977, -3.243295]
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._reset()
+        self.refresh()
+
+    def _reset(self):
+        self.index = {}
+        self.num_iterations = 0
+        self._num_bytes_read = 0
+        # The parsed values of each (label, field) so far
+        self._values = {}
+
+    def refresh(self):
+        '''
+        Indexes the lines appended to the file since it was last read and
+        returns the number of labelled lines found. If the file has shrunk
+        it is taken to have been rewritten and is indexed from the start.
+        '''
+        file_handle = open_file(self.filename)
+        if compression(self.filename) is None:
+            has_shrunk = os.path.getsize(self.filename) < self._num_bytes_read
+        else:
+            # The decompressed size is only found by decompressing, seeking
+            # stops at the end of the file
+            file_handle.seek(self._num_bytes_read)
+            has_shrunk = file_handle.tell() < self._num_bytes_read
+        if has_shrunk:
+            self._reset()
+        file_handle.seek(self._num_bytes_read)
+        new_bytes = file_handle.read()
+        file_handle.close()
+        # Stop at the end of the last whole line
+        end = new_bytes.rfind('\n') + 1
+        num_lines = 0
+        iteration_label = fmt['iteration_label']
+        for match in fmt['label_line'].finditer(new_bytes, 0, end):
+            label = match.group(1)
+            if label.startswith(iteration_label) and label[len(iteration_label):].isdigit():
+                self.num_iterations = int(label[len(iteration_label):])
+            self.index.setdefault(label, []).append((self.num_iterations, self._num_bytes_read + match.start()))
+            num_lines = num_lines + 1
+        self._num_bytes_read = self._num_bytes_read + end
+        return num_lines
+
+    def labels(self):
+        return sorted(self.index.keys())
+    labels = property(labels)
+
+    def iterations(self, label):
+        '''Returns the iteration of each line with the label'''
+        return np.array([x[0] for x in self._entries(label)], dtype=int)
+
+    def history(self, label, field=-1):
+        '''
+        Returns the values on each line with the label (i.e. ':ENE' or 'ENE')
+        as an array. 'field' picks which of the numbers after the label is
+        taken, by default the last, None takes all of them giving a 2D array.
+        Lines already parsed are not parsed again.
+        '''
+        entries = self._entries(label)
+        values = self._values.setdefault((label.strip(':'), field), [])
+        if len(values) < len(entries):
+            file_handle = open_file(self.filename)
+            for iteration, offset in entries[len(values):]:
+                file_handle.seek(offset)
+                values.append(_parse_line(file_handle.readline(), field, offset))
+            file_handle.close()
+        return np.array(values)
+
+    def _entries(self, label):
+        label = label.strip(':')
+        if label not in self.index:
+            raise KeyError('No :%s lines in %s' % (label, self.filename))
+        return self.index[label]
+
+
+def _parse_line(line, field, offset):
+    # The numbers after the label of a line
+    label_match = fmt['label_line'].match(line)
+    numbers = fmt['number'].findall(line, label_match.end())
+    try:
+        numbers = [float(x.upper().replace('D', 'E')) for x in numbers]
+        if field is None:
+            return numbers
+        return numbers[field]
+    except (ValueError, IndexError):
+        raise UnexpectedFileFormat('Could not parse field %s of a labelled line (byte: %d)' % (field, offset))
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    globs = {
+        'TiC_scf_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC_scf.scf'),
+        'ScfReader' : ScfReader,
+    }
+    doctest.testmod(globs=globs)
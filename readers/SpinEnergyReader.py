@@ -0,0 +1,124 @@
+'''
+SpinEnergyReader.py
+
+A class for reading the up and down .energy files of a spin polarised
+calculation together
+'''
+
+__all__ = ['SpinEnergyReader']
+
+import numpy as np
+from wien2k.Band import Band
+from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.EnergyReader import _read_energy_file
+
+# Index of each spin direction in the first axis of the energies array
+SPIN_UP = 0
+SPIN_DN = 1
+
+# Tolerance when checking that both files contain the same k points
+K_POINT_DECIMALS = 6
+
+class SpinEnergyReader(object):
+    '''An object which reads the .energyup and .energydn (or .energysoup and
+    .energysodn) files of a spin polarised calculation into one table of
+    k points and a single array of energies
+
+    Parameters,
+
+    filename:               The filename of the .energy(so) file without the
+                            'up' or 'dn' suffix, i.e. 'TiC.energy' reads
+                            'TiC.energyup' and 'TiC.energydn'
+
+    Results in,
+
+    filenames:              The up and down filenames
+    k_points:               An Nx4 array of id, i, j, k values, one row per k point
+    weights:                The weight of each k point
+    num_bands:              A (2, N) array of the number of bands at each k point for each spin
+    energies:               A (spin, band, k point) array of energies, bands
+                            not present at a k point are NaN
+    up_bands:               A list of Band objects for spin up
+    dn_bands:               A list of Band objects for spin down
+
+    EXAMPLE:
+
+    >>> spin_rdr = SpinEnergyReader(TiC_energy_filename)
+    >>> spin_rdr.energies.shape
+    (2, 17, 47)
+    >>> spin_rdr.k_points.shape
+    (47, 4)
+    >>> spin_rdr.dn_bands[6].data.shape
+    (47, 5)
+    >>> spin_rdr.dn_bands[6] is spin_rdr.dn_bands[6]
+    True
+
+    The exchange splitting of every band at every k point
+
+    >>> np.nanmax(np.abs(spin_rdr.energies[SPIN_UP] - spin_rdr.energies[SPIN_DN]))
+    0.0
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.filenames = (filename + 'up', filename + 'dn')
+        up_vals = _read_energy_file(self.filenames[SPIN_UP])
+        dn_vals = _read_energy_file(self.filenames[SPIN_DN])
+        up_k_points, up_weights, up_num_plane_waves, up_num_bands, up_energies = up_vals
+        dn_k_points, dn_weights, dn_num_plane_waves, dn_num_bands, dn_energies = dn_vals
+        if (up_k_points.shape != dn_k_points.shape) or \
+                (np.around(up_k_points - dn_k_points, decimals=K_POINT_DECIMALS) != 0).any():
+            raise UnexpectedFileFormat('The up and down files do not contain the same k points')
+        # Only one copy of the k points is kept
+        self.k_points = up_k_points
+        self.weights = up_weights
+        self.num_bands = np.array([up_num_bands, dn_num_bands])
+        num_bands = max(up_energies.shape[1], dn_energies.shape[1])
+        self.energies = np.empty((2, num_bands, len(self.k_points)))
+        self.energies.fill(np.nan)
+        self.energies[SPIN_UP, :up_energies.shape[1]] = up_energies.transpose()
+        self.energies[SPIN_DN, :dn_energies.shape[1]] = dn_energies.transpose()
+        self._bands = {}
+
+    def bands(self, spin):
+        '''Returns a list of Band objects for spin SPIN_UP or SPIN_DN, made
+        when first asked for and then kept'''
+        if spin not in self._bands:
+            bands = []
+            for i, band_energies in enumerate(self.energies[spin]):
+                present = ~np.isnan(band_energies)
+                bands.append(Band(id=i+1, character=('up', 'dn')[spin], \
+                    data=np.column_stack((self.k_points[present], band_energies[present]))))
+            self._bands[spin] = bands
+        return self._bands[spin]
+
+    def up_bands(self):
+        return self.bands(SPIN_UP)
+
+    def dn_bands(self):
+        return self.bands(SPIN_DN)
+
+    # Overwrite the function labels with properties
+    up_bands = property(up_bands)
+    dn_bands = property(dn_bands)
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    import shutil
+    import tempfile
+    # TiC is not spin polarised, use the same energies for both spins
+    tmp_dir = tempfile.mkdtemp()
+    TiC_energy_filename = os.path.join(tmp_dir, 'TiC.energy')
+    for spin in ('up', 'dn'):
+        shutil.copy(os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.energy'), TiC_energy_filename + spin)
+    globs = {
+        'TiC_energy_filename' : TiC_energy_filename,
+        'SpinEnergyReader' : SpinEnergyReader,
+        'SPIN_UP' : SPIN_UP,
+        'SPIN_DN' : SPIN_DN,
+        'np' : np,
+    }
+    doctest.testmod(globs=globs)
+    shutil.rmtree(tmp_dir)
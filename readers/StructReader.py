@@ -8,6 +8,8 @@ __all__ = ['StructReader']
 
 from wien2k.errors import UnexpectedFileFormat
 from wien2k.SymMat import SymMat
+from wien2k.readers.FortranFormat import FortranFormat
+from wien2k.readers.CompressedFile import open_file
 import numpy as np
 
 # n.b. FORMATS specified in WIEN2K user guides (2001 & 2009) don't match up to actual .struct spec!
@@ -28,7 +30,10 @@ fmt= {
     'len_local_rotation_matrix_line' : 51,      # FORMAT(20X,3F10.7)
     'len_num_symmetry_operations_line' : 40,    # FORMAT(I4)
     'len_symmetry_matrix_line' : 18,            # FORMAT(3I2,F10.7)
-    'len_symmetry_matrix_index_line' : 9        # FORMAT(I8)
+    'len_symmetry_matrix_index_line' : 9,       # FORMAT(I8)
+    # The user guide gives FORMAT(3I2,F10.7) but the files written hold the
+    # offset in 11 columns, i.e. ' 0-1 0 0.00000000'
+    'symmetry_matrix_record' : FortranFormat('(3I2,F11.8)', names=['m1', 'm2', 'm3', 'tau']),
 }
 
 class StructReader(object):
@@ -59,8 +64,12 @@ class StructReader(object):
 
     def _load_values(self):
         # Populate values from the struct file
-        file_handle = open(self.filename, 'r')
+        file_handle = open_file(self.filename)
         line_num = 0
+        # The rows of the symmetry matrices are collected and decoded in one
+        # go once the file is read
+        sym_mat_lines = []
+        sym_mat_line_nums = []
         for line in file_handle:
             line_num = line_num + 1
             line_len = len(line)
@@ -114,21 +123,17 @@ class StructReader(object):
                 pass
 
             elif line_len == fmt['len_symmetry_matrix_line']:
-                sm = SymMat()
-                line1 = line
+                lines = [line]
                 try:
-                    line2 = file_handle.next()
+                    lines.append(file_handle.next())
                     line_num = line_num + 1
-                    line3 = file_handle.next()
+                    lines.append(file_handle.next())
                     line_num = line_num + 1
-                    for i,l in enumerate([line1, line2, line3]):
-                        sm.matrix[i,:] = np.array([float(l[j:j+2]) for j in [0, 2, 4]])
-                        sm.tau_offsets[i] = float(l.strip()[6:])
                 except StopIteration:
                     break
-                except ValueError:
-                    raise UnexpectedFileFormat('Could not parse the symmetry matrix from file (line: %d)' % line_num)
-                self.sym_mats.append(sm)
+                sym_mat_lines.extend([l.rstrip('\r\n') for l in lines])
+                sym_mat_line_nums.append(line_num)
+                self.sym_mats.append(SymMat())
 
             elif line_len == fmt['len_symmetry_matrix_index_line']:
                 try:
@@ -139,3 +144,24 @@ class StructReader(object):
                     pass
 
         file_handle.close()
+        self._decode_sym_mats(sym_mat_lines, sym_mat_line_nums)
+
+    def _decode_sym_mats(self, lines, line_nums):
+        # Fill in the matrices and offsets of self.sym_mats from their rows
+        if len(lines) == 0:
+            return
+        try:
+            records = fmt['symmetry_matrix_record'].decode_lines(lines)
+        except ValueError:
+            # Find the matrix at fault for the error message
+            for i, line_num in enumerate(line_nums):
+                try:
+                    fmt['symmetry_matrix_record'].decode_lines(lines[3*i:3*i+3])
+                except ValueError:
+                    raise UnexpectedFileFormat('Could not parse the symmetry matrix from file (line: %d)' % line_num)
+            raise
+        matrices = np.column_stack([records['m1'], records['m2'], records['m3']]).astype(float).reshape((-1,3,3))
+        tau_offsets = records['tau'].reshape((-1,3))
+        for sm, matrix, tau in zip(self.sym_mats, matrices, tau_offsets):
+            sm.matrix = matrix
+            sm.tau_offsets = tau
@@ -0,0 +1,272 @@
+'''
+VectorReader.py
+
+A class for reading the eigenvectors in the binary WIEN2k .vector files
+written by lapw1
+'''
+
+__all__ = ['VectorReader']
+
+import os
+import numpy as np
+from wien2k.errors import UnexpectedFileFormat
+from wien2k.readers.CompressedFile import map_file, read_array, gather
+
+# The .vector file is FORTRAN unformatted, each record is preceded and
+# followed by its length in bytes. See SRC_lapw1/outwin.f,
+#   WRITE(10) (E(l),l=0,LMAX)                           for each atom
+#   WRITE(10) ((ELO(l,k),k=1,nloat),l=0,LOMAX)
+# then for each k point,
+#   WRITE(10) SX, SY, SZ, KNAME, N, NE, WEIGHT, IPGR    the k point
+#   WRITE(10) (KX(I), KY(I), KZ(I), I=1,N)              the plane waves
+# and for each band,
+#   WRITE(10) NUM, E(NUM)                               the energy
+#   WRITE(10) (Z(I,NUM), I=1,N)                         the coefficients
+fmt = {
+    'record_marker' : np.dtype('<i4'),
+    # SX, SY, SZ, KNAME, N, NE, WEIGHT, IPGR, the IPGR is not written by
+    # older versions. n.b. the linearisation energy records are a multiple
+    # of 8 bytes long so are never mistaken for one of these
+    'k_point_record' : np.dtype([('i', '<f8'), ('j', '<f8'), ('k', '<f8'), ('k_point_name', 'S10'), \
+        ('num_plane_waves', '<i4'), ('num_bands', '<i4'), ('weight', '<f8'), ('ipgr', 'S3')]),
+    'k_point_record_lengths' : (50, 53),
+    # KX, KY, KZ of each plane wave
+    'g_vector_record' : np.dtype('<i4'),
+    # NUM, E
+    'band_record' : np.dtype([('band', '<i4'), ('energy', '<f8')]),
+    # Z is real unless the structure lacks inversion symmetry (or spin orbit)
+    'coefficients' : {8 : np.dtype('<f8'), 16 : np.dtype('<c16')},
+}
+
+class VectorReader(object):
+    '''
+    Reads the eigenvectors in a WIEN2k .vector file
+
+    The file is memory mapped and its records are walked once to find where
+    the plane waves and the coefficients of each band at each k point
+    begin. The plane waves and coefficients are then returned as views of
+    the memory mapped file so only those used are read from disk.
+    Compressed files are read as map_file does, returning copies.
+
+    Parameters,
+
+    filename:                   The .vector file to read
+    in_memory:                  If True a compressed file is decompressed
+                                into memory rather than as it is read -
+                                default: False
+
+    Results in,
+
+    linearization_energies:     A list of the linearisation energies (E(l))
+                                of each atom
+    lo_linearization_energies:  A list of the local orbital linearisation
+                                energies (ELO) of each atom
+    k_points:                   An Nx4 array of id, i, j, k values, one row
+                                per k point, as EnergyReader
+    k_point_names:              The name (KNAME) of each k point
+    weights:                    The weight of each k point
+    num_plane_waves:            The number of plane waves (plus local
+                                orbitals) at each k point
+    num_bands:                  The number of bands (NE) at each k point
+    energies:                   An (n_kpoints, n_bands) array of energies,
+                                bands not present at a k point are NaN
+    is_complex:                 True if the coefficients are complex
+    g_vector_offsets:           The byte offset of the plane waves of each
+                                k point
+    coefficient_offsets:        An (n_kpoints, n_bands) array of the byte
+                                offset of the coefficients of each band,
+                                -1 where not present
+
+    EXAMPLE:
+
+    >>> vector_rdr = VectorReader(TiC_vector_filename)
+    >>> vector_rdr.energies.shape
+    (111, 17)
+    >>> vector_rdr.k_point_names[0], vector_rdr.num_plane_waves[0]
+    ('W', 134)
+    >>> vector_rdr.g_vectors(0)[:2].tolist()
+    [[-1, -1, -1], [-2, 0, 0]]
+    >>> vector_rdr.coefficients(0, 0).shape
+    (134,)
+
+    All the bands at a k point as one (n_bands, n_plane_waves) array
+
+    >>> z = vector_rdr.k_point_coefficients(0)
+    >>> z.shape
+    (16, 134)
+    >>> (z[3] == vector_rdr.coefficients(0, 3)).all()
+    True
+
+    The energies are those of the .energy file written at the same time
+
+    >>> dos_vector_rdr = VectorReader(TiC_dos_vector_filename)
+    >>> energy_rdr = EnergyReader(TiC_energy_filename)
+    >>> np.allclose(dos_vector_rdr.energies, energy_rdr.energies, equal_nan=True)
+    True
+    '''
+    def __init__(self, filename, in_memory=False):
+        self.filename = filename
+        if os.path.getsize(filename) == 0:
+            raise UnexpectedFileFormat('The .vector file is empty (byte: 0)')
+        self._map = map_file(filename, in_memory=in_memory)
+        self._index_records()
+
+    def _record(self, offset):
+        # Returns the offset of the data and the length of the record
+        # beginning at 'offset'
+        marker = read_array(self._map, offset, 4)
+        if len(marker) < 4:
+            raise UnexpectedFileFormat('Record runs past the end of the file (byte: %d)' % offset)
+        length = int(marker.view(fmt['record_marker'])[0])
+        if length < 0:
+            raise UnexpectedFileFormat('Record markers do not match (byte: %d)' % offset)
+        end_marker = read_array(self._map, offset + 4 + length, 4)
+        if (len(end_marker) < 4) or (int(end_marker.view(fmt['record_marker'])[0]) != length):
+            raise UnexpectedFileFormat('Record markers do not match (byte: %d)' % offset)
+        return offset + 4, length
+
+    def _markers(self, offsets):
+        # The record markers at each of the offsets
+        return gather(self._map, offsets, 4).view(fmt['record_marker']).ravel()
+
+    def _index_records(self):
+        # Walks the records, the bands at each k point are the same length
+        # so are checked together
+        k_point_record_lengths = fmt['k_point_record_lengths']
+        self.linearization_energies = []
+        self.lo_linearization_energies = []
+        offset = 0
+        while True:
+            data_offset, length = self._record(offset)
+            if length in k_point_record_lengths:
+                break
+            energies = read_array(self._map, data_offset, length).view('<f8')
+            if len(self.linearization_energies) == len(self.lo_linearization_energies):
+                self.linearization_energies.append(energies)
+            else:
+                self.lo_linearization_energies.append(energies)
+            offset = data_offset + length + 4
+        k_point_vals = []
+        g_vector_offsets = []
+        band_offsets = []
+        energies = []
+        coefficient_itemsize = None
+        band_record_length = fmt['band_record'].itemsize
+        while len(read_array(self._map, offset, 1)) > 0:
+            data_offset, length = self._record(offset)
+            if length not in k_point_record_lengths:
+                raise UnexpectedFileFormat('Expected a k point record (byte: %d)' % offset)
+            record = np.zeros(1, dtype=fmt['k_point_record'])
+            record.view(np.uint8)[:length] = read_array(self._map, data_offset, length)
+            k_point_vals.append(record[0])
+            num_plane_waves = int(record['num_plane_waves'][0])
+            num_bands = int(record['num_bands'][0])
+            # The plane waves
+            data_offset, length = self._record(data_offset + length + 4)
+            if length != 3 * fmt['g_vector_record'].itemsize * num_plane_waves:
+                raise UnexpectedFileFormat('Expected %d plane waves (byte: %d)' % \
+                    (num_plane_waves, data_offset - 4))
+            g_vector_offsets.append(data_offset)
+            offset = data_offset + length + 4
+            if num_bands == 0:
+                band_offsets.append(np.zeros(0, dtype=np.int64))
+                energies.append(np.zeros(0))
+                continue
+            # The first band gives the length of the coefficients
+            data_offset, length = self._record(offset)
+            data_offset, length = self._record(data_offset + length + 4)
+            if (num_plane_waves == 0) or (length % num_plane_waves != 0) or \
+                    (length // num_plane_waves not in fmt['coefficients']):
+                raise UnexpectedFileFormat('Expected %d coefficients (byte: %d)' % \
+                    (num_plane_waves, data_offset - 4))
+            if coefficient_itemsize is None:
+                coefficient_itemsize = length // num_plane_waves
+            elif length // num_plane_waves != coefficient_itemsize:
+                raise UnexpectedFileFormat('Coefficients change between real and complex (byte: %d)' % \
+                    (data_offset - 4))
+            # The offsets of the energy record of every band at this k point
+            band_length = 8 + band_record_length + 8 + length
+            starts = offset + band_length * np.arange(num_bands, dtype=np.int64)
+            try:
+                markers = self._markers(np.concatenate((starts, starts + 4 + band_record_length, \
+                    starts + 8 + band_record_length, starts + band_length - 4))).reshape((4,-1))
+            except IndexError:
+                raise UnexpectedFileFormat('Expected %d bands (byte: %d)' % (num_bands, offset))
+            expected = np.array([band_record_length] * 2 + [length] * 2).reshape((4,1))
+            if np.any(markers != expected):
+                bad_band = np.flatnonzero(np.any(markers != expected, axis=0))[0]
+                raise UnexpectedFileFormat('Record markers do not match (byte: %d)' % starts[bad_band])
+            band_vals = gather(self._map, starts + 4, band_record_length).view(fmt['band_record']).ravel()
+            energies.append(band_vals['energy'])
+            band_offsets.append(starts + 12 + band_record_length)
+            offset = int(starts[-1]) + band_length
+        if len(k_point_vals) == 0:
+            raise UnexpectedFileFormat('No k points were found (byte: %d)' % offset)
+        k_point_vals = np.array(k_point_vals, dtype=fmt['k_point_record'])
+        self.k_point_names = [x.strip() for x in k_point_vals['k_point_name']]
+        k_point_ids = np.zeros(len(k_point_vals))
+        for i, name in enumerate(self.k_point_names):
+            if name.isdigit():
+                k_point_ids[i] = int(name)
+        self.k_points = np.column_stack((k_point_ids, k_point_vals['i'], k_point_vals['j'], k_point_vals['k']))
+        self.weights = k_point_vals['weight']
+        self.num_plane_waves = k_point_vals['num_plane_waves'].astype(int)
+        self.num_bands = k_point_vals['num_bands'].astype(int)
+        self.is_complex = coefficient_itemsize == 16
+        self._dtype = fmt['coefficients'][coefficient_itemsize or 8]
+        self.g_vector_offsets = np.array(g_vector_offsets, dtype=np.int64)
+        # Pad to the largest number of bands
+        max_num_bands = max(self.num_bands)
+        self.energies = np.empty((len(k_point_vals), max_num_bands))
+        self.energies.fill(np.nan)
+        self.coefficient_offsets = -np.ones((len(k_point_vals), max_num_bands), dtype=np.int64)
+        for i in range(len(k_point_vals)):
+            self.energies[i,:self.num_bands[i]] = energies[i]
+            self.coefficient_offsets[i,:self.num_bands[i]] = band_offsets[i]
+
+    def g_vectors(self, k_point_index):
+        '''Returns an (n_plane_waves, 3) view of the plane waves (KX, KY, KZ)
+        at a k point, counting from 0'''
+        offset = int(self.g_vector_offsets[k_point_index])
+        length = 3 * fmt['g_vector_record'].itemsize * int(self.num_plane_waves[k_point_index])
+        return read_array(self._map, offset, length).view(fmt['g_vector_record']).reshape((-1,3))
+
+    def coefficients(self, k_point_index, band_index):
+        '''Returns a view of the coefficients of a band at a k point, both
+        counting from 0'''
+        offset = int(self.coefficient_offsets[k_point_index, band_index])
+        if offset < 0:
+            raise IndexError('Band %d is not present at k point %d' % (band_index, k_point_index))
+        length = self._dtype.itemsize * int(self.num_plane_waves[k_point_index])
+        return read_array(self._map, offset, length).view(self._dtype)
+
+    def k_point_coefficients(self, k_point_index):
+        '''Returns an (n_bands, n_plane_waves) view of the coefficients of
+        every band at a k point, counting from 0'''
+        num_bands = int(self.num_bands[k_point_index])
+        num_plane_waves = int(self.num_plane_waves[k_point_index])
+        offsets = self.coefficient_offsets[k_point_index, :num_bands]
+        if num_bands == 0:
+            return np.zeros((0, num_plane_waves), dtype=self._dtype)
+        band_length = 0
+        if num_bands > 1:
+            band_length = int(offsets[1] - offsets[0])
+        buf = read_array(self._map, int(offsets[0]), band_length * (num_bands - 1) + \
+            self._dtype.itemsize * num_plane_waves)
+        return np.ndarray(shape=(num_bands, num_plane_waves), dtype=self._dtype, buffer=buf, \
+            strides=(band_length, self._dtype.itemsize))
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    from wien2k.readers.EnergyReader import EnergyReader
+    globs = {
+        'TiC_vector_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.vector'),
+        'TiC_dos_vector_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.vector_dos'),
+        'TiC_energy_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.energy'),
+        'VectorReader' : VectorReader,
+        'EnergyReader' : EnergyReader,
+        'np' : np,
+    }
+    doctest.testmod(globs=globs)
@@ -1,8 +1,25 @@
-__all__ = ['EnergyReader', 'StructReader', 'Scf2Reader', 'OutputkgenReader', 'KlistReader', 'Output2Reader']
+__all__ = ['EnergyReader', 'StructReader', 'Scf2Reader', 'OutputkgenReader', 'KlistReader', 'Output2Reader', 'ParallelEnergyReader', 'SpinEnergyReader', 'KgenReader', 'QtlReader', 'DosReader', 'DosBatchReader', 'ScfReader', 'VectorReader', 'ClmReader', 'RhoReader', 'RhoStackReader']
 
-from EnergyReader import EnergyReader
-from StructReader import StructReader
-from Scf2Reader import Scf2Reader
-from OutputkgenReader import OutputkgenReader
-from KlistReader import KlistReader
-from Output2Reader import Output2Reader
+# The public names are imported from their modules when first used, see
+# LazyModule
+import sys
+from wien2k.LazyModule import LazyModule
+sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+    'EnergyReader' : 'wien2k.readers.EnergyReader',
+    'StructReader' : 'wien2k.readers.StructReader',
+    'Scf2Reader' : 'wien2k.readers.Scf2Reader',
+    'OutputkgenReader' : 'wien2k.readers.OutputkgenReader',
+    'KlistReader' : 'wien2k.readers.KlistReader',
+    'Output2Reader' : 'wien2k.readers.Output2Reader',
+    'ParallelEnergyReader' : 'wien2k.readers.ParallelEnergyReader',
+    'SpinEnergyReader' : 'wien2k.readers.SpinEnergyReader',
+    'KgenReader' : 'wien2k.readers.KgenReader',
+    'QtlReader' : 'wien2k.readers.QtlReader',
+    'DosReader' : 'wien2k.readers.DosReader',
+    'DosBatchReader' : 'wien2k.readers.DosBatchReader',
+    'ScfReader' : 'wien2k.readers.ScfReader',
+    'VectorReader' : 'wien2k.readers.VectorReader',
+    'ClmReader' : 'wien2k.readers.ClmReader',
+    'RhoReader' : 'wien2k.readers.RhoReader',
+    'RhoStackReader' : 'wien2k.readers.RhoStackReader',
+})
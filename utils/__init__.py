@@ -1,5 +1,12 @@
 __all__ = ['expand_ibz', 'extract_isoenergy_mesh', 'remove_duplicates', 'generate_cartesian_klist']
-from expand_ibz import expand_ibz
-from extract_isoenergy_mesh import extract_isoenergy_mesh
-from remove_duplicates import remove_duplicates
-from generate_cartesian_klist import generate_cartesian_klist
+
+# The public names are imported from their modules when first used, see
+# LazyModule
+import sys
+from wien2k.LazyModule import LazyModule
+sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+    'expand_ibz' : 'wien2k.utils.expand_ibz',
+    'extract_isoenergy_mesh' : 'wien2k.utils.extract_isoenergy_mesh',
+    'remove_duplicates' : 'wien2k.utils.remove_duplicates',
+    'generate_cartesian_klist' : 'wien2k.utils.generate_cartesian_klist',
+})
@@ -5,10 +5,8 @@ extract_isoenergy_mesh.py
 __all__ = ['extract_isoenergy_mesh']
 
 import numpy as np
-from scipy.interpolate import Rbf
 import sys
 import copy
-import pdb
 
 def extract_isoenergy_mesh(orig_kmesh, energy, precision=sys.float_info.epsilon, verbose=False, interp_method='linear'):
     '''
@@ -182,6 +180,8 @@ def _interp_rbf(kmesh, marching_cube_indexes, precision, verbose, energy):
     TODO: Find out exactly what radial basis functions actually does ...
     TODO: Get this to work on smaller numbers of points with a moving window
     '''
+    # Scipy is slow to import so is only imported when needed
+    from scipy.interpolate import Rbf
     if verbose == True:
         print 'Generating Radial Basis Function for interpolation ...'
     i_indexes, j_indexes, k_indexes = np.where(kmesh.energies.mask == False)
@@ -3,8 +3,6 @@ import wien2k
 from wien2k.utils.reduce_ibz import reduce_ibz
 from wien2k.utils.expand_ibz import expand_ibz
 
-import pdb
-
 def generate_cartesian_klist(points, sym_mats=None, reduce_to_ibz=True, outfile=None, verbose=False):
 
     tot_points = points[0]*points[1]*points[2]
@@ -1,3 +1,14 @@
+'''
+KgenWriter.py
+
+A class to write the tetrahedra of a .kgen file for use in WIEN2k calculations
+'''
+
+__all__ = ['KgenWriter']
+
+import numpy as np
+from wien2k.readers.FortranFormat import FortranFormat
+
 # tetcnt.f contains code for writign to .kgen
 # See the WRITE(15,...) commands
 # 1234 FORMAT(2i10,e20.12,2I10) NKP,NTT,V,MWRIT,NREC
@@ -8,5 +19,91 @@
 #         0
 ## NKP         NUMBER OF IRREDUCIBLE K-POINTS                **
 ## MWRIT       INFORMATION FOR MWRIT TETRAHEDRA ARE WRITTEN  **
-##             AT ONE TIME. 
+##             AT ONE TIME.
 # NTT - not declared
+
+header_fmt = FortranFormat('(2I10,E20.12,2I10)')
+NUM_VALS_PER_LINE = 6
+NUM_VALS_PER_TETRAHEDRON = 5
+
+class KgenWriter(object):
+    '''
+    A class to write .kgen files for WIEN2k calculations
+
+    Set 'data' to an (NTT, 5) array of the multiplicity and the four corners
+    (k point ids counting from 1) of each tetrahedron, as read by
+    KgenReader, along with 'num_k_points' (NKP) and 'volume' (V, the volume
+    of a tetrahedron). The tetrahedra are written 'num_tetrahedra_per_record'
+    (MWRIT) at a time, by default all in one record.
+
+    EXAMPLE:
+
+    >>> kgen_rdr = KgenReader(TiC_kgen_filename)
+    >>> kw = KgenWriter(kgen_filename)
+    >>> kw.data = kgen_rdr.data
+    >>> kw.num_k_points = kgen_rdr.num_k_points
+    >>> kw.volume = kgen_rdr.volume
+    >>> kw.num_tetrahedra_per_record = kgen_rdr.num_tetrahedra_per_record
+    >>> kw.write()
+    >>> open(kgen_filename).read() == open(TiC_kgen_filename).read()
+    True
+    '''
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.data = None
+        self.num_k_points = 0
+        self.volume = 0.0
+        self.num_tetrahedra_per_record = None
+
+    def write(self):
+        data = np.zeros((0,NUM_VALS_PER_TETRAHEDRON), dtype=np.int32)
+        if self.data is not None:
+            data = np.asarray(self.data).reshape((-1,NUM_VALS_PER_TETRAHEDRON))
+        num_tetrahedra = len(data)
+        num_tetrahedra_per_record = self.num_tetrahedra_per_record
+        if num_tetrahedra_per_record is None:
+            num_tetrahedra_per_record = max(num_tetrahedra, 1)
+        num_records = -(-num_tetrahedra // num_tetrahedra_per_record)
+        filehandle = open(self.filename, 'w')
+        filehandle.write(header_fmt.encode([[self.num_k_points], [num_tetrahedra], [self.volume], \
+            [num_tetrahedra_per_record], [num_records]]))
+        if num_records > 0:
+            filehandle.write(_format_records(data, num_records, num_tetrahedra_per_record))
+        filehandle.close()
+
+
+def _format_records(data, num_records, num_tetrahedra_per_record):
+    # Returns the lines of all the records, the last record is padded with
+    # zeros
+    vals = np.zeros((num_records, num_tetrahedra_per_record * NUM_VALS_PER_TETRAHEDRON), dtype=np.int64)
+    vals.ravel()[:data.size] = data.ravel()
+    num_full_lines, num_leftover_vals = divmod(vals.shape[1], NUM_VALS_PER_LINE)
+    # Format the full lines and the short line ending each record
+    # separately then interleave them
+    lines = []
+    if num_full_lines > 0:
+        full_vals = vals[:,:num_full_lines*NUM_VALS_PER_LINE].reshape((-1,NUM_VALS_PER_LINE))
+        text = FortranFormat('(%dI10)' % NUM_VALS_PER_LINE).encode(list(full_vals.T))
+        lines.append(np.frombuffer(text, dtype=np.uint8).reshape((num_records,-1)))
+    if num_leftover_vals > 0:
+        text = FortranFormat('(%dI10)' % num_leftover_vals).encode(list(vals[:,-num_leftover_vals:].T))
+        lines.append(np.frombuffer(text, dtype=np.uint8).reshape((num_records,-1)))
+    return np.hstack(lines).tobytes()
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import sys
+    import shutil
+    import tempfile
+    from wien2k.readers.KgenReader import KgenReader
+    tmp_dir = tempfile.mkdtemp()
+    globs = {
+        'TiC_kgen_filename' : os.path.join(sys.path[0], '..', 'tests', 'TiC', 'TiC.kgen'),
+        'kgen_filename' : os.path.join(tmp_dir, 'test.kgen'),
+        'KgenReader' : KgenReader,
+        'KgenWriter' : KgenWriter,
+    }
+    doctest.testmod(globs=globs)
+    shutil.rmtree(tmp_dir)
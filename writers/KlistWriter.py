@@ -7,6 +7,7 @@ A class to write .klist file for use in WIEN2k calculations
 __all__ = ['KlistWriter']
 
 import numpy as np
+from wien2k.readers.FortranFormat import FortranFormat
 
 # FORTRAN format statement found in main.f on line 287
 # FORMAT(I10,4I10,3f5.1,4x,i6,' k, div: (',3i3,')')  
@@ -23,10 +24,38 @@ import numpy as np
 
 GENERATED_BY_TAG = '    k-list generated by PythonWIEN2k'
 
+# The k point lines are formatted this many at a time
+CHUNK_SIZE = 2**16
+
+k_point_fmt = FortranFormat('(I10,4I10,f5.1)')
+# The names are not written
+xcd_band_k_point_fmt = FortranFormat('(10X,4I5,f5.1)')
+
 class KlistWriter(object):
     '''
     A class to write .klist files for WIEN2k calculations
     Set 'is_bandlist' to True for XCrysden (v.1.4.1) style output
+
+    Either set 'data' (an Nx6 array of id, i, j, k, denominator, weight) and
+    call write(), or stream the k points in blocks with open(), append()
+    and close() so the whole list is never held in memory. When streaming,
+    set 'total_number_k_points', 'bz_shape' and 'is_bandlist' before the
+    first block is appended.
+
+    EXAMPLE:
+
+    >>> kw = KlistWriter(klist_filename)
+    >>> kw.total_number_k_points = 4
+    >>> kw.open()
+    >>> kw.append([[1, 0, 0, 0, 2, 1.0], [2, 1, 0, 0, 2, 2.0]])
+    >>> kw.append([[3, 1, 1, 0, 2, 1.0]])
+    >>> kw.close()
+    >>> print open(klist_filename).read()
+             1         0         0         0         2  1.0 -7.0  1.5         4 k, div: (  0  0  0)
+             2         1         0         0         2  2.0
+             3         1         1         0         2  1.0
+    END
+    <BLANKLINE>
     '''
     def __init__(self, filename=None):
         self.filename = filename
@@ -34,68 +63,123 @@ class KlistWriter(object):
         self.total_number_k_points = 0
         self.bz_shape = ()
         self.is_bandlist = False
+        self._file_handle = None
+        self._num_k_points_written = 0
 
     def write(self):
-        filehandle = open(self.filename, 'w')
-        if self.data != None:
-            for line_num, k in enumerate(self.data):
-                k = k.round()
-                if self.is_bandlist == True:
-                    # Write a .klist file in the style of an XCrysden
-                    # .klist_band file
-                    if line_num == 0:
-                        filehandle.write('          %5d%5d%5d%5d%5.1f%5.1f%5.1f%s\n' % \
-                            
-                            (k[1], k[2], k[3], k[4], k[5], -8.0, 8.0, GENERATED_BY_TAG))
-                    else:
-                        filehandle.write('          %5d%5d%5d%5d%5.1f\n' % (k[1], k[2], k[3], k[4], k[5]))
-                else:
-                    # Write a .klist file in the style of WIEN2k kgen
-                    if line_num == 0:
-                        if len(self.bz_shape) == 0:
-                            bz_shape = (0, 0, 0)
-                        else:
-                            bz_shape = self.bz_shape
-                        filehandle.write('%10d%10d%10d%10d%10d%5.1f%5.1f%5.1f    %6d k, div: (%3d%3d%3d)\n' % \
-                            (k[0], k[1], k[2], k[3], k[4], k[5], -7.0, 1.5, self.total_number_k_points, \
-                            bz_shape[0], bz_shape[1], bz_shape[2]))
-                    else:
-                        filehandle.write('%10d%10d%10d%10d%10d%5.1f\n' % (k[0], k[1], k[2], k[3], k[4], k[5]))
-        filehandle.write('END\n')
-        filehandle.close()
+        '''Writes the k points in 'data' to the file'''
+        self.open()
+        if self.data is not None:
+            self.append(self.data)
+        self.close()
+
+    def open(self):
+        '''Opens the file ready for k points to be appended'''
+        self._file_handle = open(self.filename, 'w')
+        self._num_k_points_written = 0
+
+    def append(self, data):
+        '''Writes a block of k points (an Nx6 array of id, i, j, k,
+        denominator, weight) to the end of the opened file'''
+        if self._file_handle is None:
+            raise IOError('The file must be opened before k points are appended')
+        data = np.asarray(data, dtype=float).reshape((-1,6)).round()
+        if len(data) == 0:
+            return
+        num_k_points = len(data)
+        if self._num_k_points_written == 0:
+            # The first k point is written on the meta data line
+            self._write_meta_data_line(data[0])
+            data = data[1:]
+        for start in range(0, len(data), CHUNK_SIZE):
+            self._file_handle.write(self._format_k_points(data[start:start+CHUNK_SIZE]))
+        self._num_k_points_written = self._num_k_points_written + num_k_points
+
+    def close(self):
+        '''Terminates and closes the file'''
+        if self._file_handle is None:
+            return
+        self._file_handle.write('END\n')
+        self._file_handle.close()
+        self._file_handle = None
+
+    def _write_meta_data_line(self, k):
+        if self.is_bandlist == True:
+            # Write a .klist file in the style of an XCrysden
+            # .klist_band file
+            self._file_handle.write('          %5d%5d%5d%5d%5.1f%5.1f%5.1f%s\n' % \
+                (k[1], k[2], k[3], k[4], k[5], -8.0, 8.0, GENERATED_BY_TAG))
+        else:
+            # Write a .klist file in the style of WIEN2k kgen
+            if len(self.bz_shape) == 0:
+                bz_shape = (0, 0, 0)
+            else:
+                bz_shape = self.bz_shape
+            self._file_handle.write('%10d%10d%10d%10d%10d%5.1f%5.1f%5.1f    %6d k, div: (%3d%3d%3d)\n' % \
+                (k[0], k[1], k[2], k[3], k[4], k[5], -7.0, 1.5, self.total_number_k_points, \
+                bz_shape[0], bz_shape[1], bz_shape[2]))
+
+    def _format_k_points(self, data):
+        # Returns the lines for a block of (rounded) k points
+        try:
+            if self.is_bandlist == True:
+                return xcd_band_k_point_fmt.encode([data[:,i] for i in range(1, 6)])
+            else:
+                return k_point_fmt.encode([data[:,i] for i in range(6)])
+        except ValueError:
+            # A value too wide for its column, the line is widened to fit
+            # as it always has been
+            if self.is_bandlist == True:
+                return ''.join(['          %5d%5d%5d%5d%5.1f\n' % tuple(k[1:6]) for k in data])
+            else:
+                return ''.join(['%10d%10d%10d%10d%10d%5.1f\n' % tuple(k[0:6]) for k in data])
 
     def ids(self):
-        if self.data != None:
+        if self.data is not None:
             return np.array(self.data[:,0], dtype=int)
         else:
             return None
 
     def i_vals(self):
-        if self.data != None:
+        if self.data is not None:
             return self.data[:,1]/self.data[:,4]
         else:
             return None
     
     def j_vals(self):
-        if self.data != None:
+        if self.data is not None:
             return self.data[:,2]/self.data[:,4]
         else:
             return None
     
     def k_vals(self):
-        if self.data != None:
+        if self.data is not None:
             return self.data[:,3]/self.data[:,4]
         else:
             return None
     
     def denominators(self):
-        if self.data != None:
+        if self.data is not None:
             return self.data[:,4]
         else:
             return None
     
     def weights(self):
-        if self.data != None:
+        if self.data is not None:
             return self.data[:,5]
         else:
             return None
+
+
+if __name__ == '__main__':
+    import doctest
+    import os
+    import shutil
+    import tempfile
+    tmp_dir = tempfile.mkdtemp()
+    globs = {
+        'klist_filename' : os.path.join(tmp_dir, 'test.klist'),
+        'KlistWriter' : KlistWriter,
+    }
+    doctest.testmod(globs=globs)
+    shutil.rmtree(tmp_dir)
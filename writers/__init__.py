@@ -1,2 +1,10 @@
-__all__ = ['KlistWriter']
-from KlistWriter import KlistWriter
+__all__ = ['KlistWriter', 'KgenWriter']
+
+# The public names are imported from their modules when first used, see
+# LazyModule
+import sys
+from wien2k.LazyModule import LazyModule
+sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+    'KlistWriter' : 'wien2k.writers.KlistWriter',
+    'KgenWriter' : 'wien2k.writers.KgenWriter',
+})